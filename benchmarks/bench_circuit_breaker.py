@@ -0,0 +1,233 @@
+"""
+Circuit breaker and deadlines around the completions API.
+
+On a scratch database with one learned line in dialogue_patterns, against a
+local stand-in completions endpoint that can be switched between healthy,
+failing (a 503 after a second), slow (first token after a delay) and hung,
+with the response cache off. Checks that:
+  - during an outage, messages arriving after the breaker opened are
+    answered locally at once, with no upstream call; without a breaker
+    every message makes all its attempts and waits them out
+  - once open_seconds pass, half-open probes close the breaker when the API
+    is back, and a failed probe opens it again
+  - a call let through while closed that ends once the breaker is half
+    open neither counts as a probe nor frees a probe's slot
+  - a slow API opens it too (share of calls slower than slow_call_seconds)
+  - a reply never outlives its deadline: a hung API is given up on in time
+    and the reply made locally
+Reports upstream calls, reply latency and peak concurrent replies.
+
+Usage: python benchmarks/bench_circuit_breaker.py [messages]
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.database.async_db import async_db
+from bot.database.connection import db_manager
+from bot.database.models import initialize_database
+from bot.services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from bot.services.dialouge_training import DialogueTrainer
+from bot.services.rate_limiter import RateLimiter
+from bot.services.response_cache import ResponseCache
+from bot.services.response_gen import ResponseGenerator
+from bot.services.user_cache import user_cache
+
+UNLIMITED = 1e6
+GUILD = "1001"
+LEARNED = "Hey! Good to see you around, want to practice together later?"
+NEVER = 10 ** 9
+
+class StandIn:
+    """A completions endpoint whose health can be switched; counts calls"""
+
+    def __init__(self):
+        self.mode = "ok"
+        self.delay = 0.0
+        self.calls = 0
+
+    async def handle(self, request):
+        await request.json()
+        self.calls += 1
+        if self.mode == "down":
+            await asyncio.sleep(1.0)
+            return web.Response(status=503, text="upstream unavailable")
+        if self.mode == "hung":
+            await asyncio.sleep(30)
+        if self.mode == "slow":
+            await asyncio.sleep(self.delay)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        try:
+            await response.prepare(request)
+            event = {"choices": [{"delta": {"content": f"api reply {self.calls}"}}]}
+            await response.write(f"data: {json.dumps(event)}\n\ndata: [DONE]\n\n".encode())
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return response
+
+def peak_concurrency(intervals):
+    """Most intervals open at once"""
+    events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+    peak = current = 0
+    for _, step in events:
+        current += step
+        peak = max(peak, current)
+    return peak
+
+async def outage(generator, stand_in, count, spacing):
+    """count messages spacing seconds apart while the API fails; (latencies, upstream calls, peak concurrency, local replies)"""
+    calls = stand_in.calls
+    intervals = []
+    replies = []
+
+    async def message(i):
+        await asyncio.sleep(i * spacing)
+        start = time.monotonic()
+        reply, _ = await generator.generate_response(f"are you around today {i}", 100 + i, GUILD)
+        intervals.append((start, time.monotonic()))
+        replies.append(reply)
+
+    await asyncio.gather(*(message(i) for i in range(count)))
+    latencies = sorted(end - start for start, end in intervals)
+    return latencies, stand_in.calls - calls, peak_concurrency(intervals), replies.count(LEARNED)
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    stand_in = StandIn()
+    failures = []
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stand_in.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    api_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1/chat/completions"
+
+    await asyncio.to_thread(initialize_database)
+    await async_db.connect()
+    await async_db.execute(
+        "INSERT INTO dialogue_patterns (context_type, input_pattern, response_template, emotion, usage_count) "
+        "VALUES ('general', ?, ?, 'neutral', 5)",
+        (LEARNED, LEARNED)
+    )
+    trainer = DialogueTrainer()
+    generators = []
+
+    def make_generator(breaker):
+        generator = ResponseGenerator(rate_limiter=RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED, UNLIMITED),
+                                      response_cache=ResponseCache(max_message_length=0),
+                                      circuit_breaker=breaker, dialogue_trainer=trainer)
+        generator.api_url = api_url
+        generators.append(generator)
+        return generator
+
+    try:
+        # Outage: every call fails after a second
+        stand_in.mode = "down"
+        print(f"API down (503 after 1s), {count} messages 100 ms apart")
+        for name, breaker in (("no breaker", CircuitBreaker(min_calls=NEVER, max_consecutive_failures=NEVER)),
+                              ("breaker", CircuitBreaker(open_seconds=60))):
+            generator = make_generator(breaker)
+            latencies, calls, peak, local = await outage(generator, stand_in, count, 0.1)
+            print(f"  {name}: {calls} upstream calls, reply p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+                  f"max {latencies[-1] * 1000:.0f} ms, peak {peak} replies in progress, {local} local replies")
+            if name == "breaker":
+                if calls > count + 3:
+                    failures.append(f"{calls} upstream calls for {count} messages with the breaker open")
+                if latencies[len(latencies) // 2] > 0.1 or local != count:
+                    failures.append("messages after the breaker opened were not answered locally at once")
+                if breaker.state != OPEN:
+                    failures.append(f"breaker is {breaker.state} during an outage")
+
+        # Recovery: probes go out once open_seconds pass
+        breaker = CircuitBreaker(open_seconds=0.5, half_open_probes=2)
+        generator = make_generator(breaker)
+        await outage(generator, stand_in, 3, 0)
+        await asyncio.sleep(0.6)
+        calls = stand_in.calls
+        opened = breaker.opened
+        await generator.generate_response("still down?", 1, GUILD)
+        reopened = breaker.state == OPEN and breaker.opened == opened + 1
+        stand_in.mode = "ok"
+        await asyncio.sleep(0.6)
+        replies = [(await generator.generate_response(f"back yet {i}", 1, GUILD))[0] for i in range(4)]
+        print(f"recovery: failed probe reopened the breaker: {reopened}; after the API came back "
+              f"{sum(reply.startswith('api reply') for reply in replies)} of 4 replies from the API, "
+              f"breaker {breaker.state}, {stand_in.calls - calls} upstream calls")
+        if not reopened:
+            failures.append("a failed half-open probe did not open the breaker again")
+        if breaker.state != CLOSED or not all(reply.startswith("api reply") for reply in replies):
+            failures.append("the breaker did not close once the API recovered")
+
+        # A call from before the breaker opened ends while it is half open
+        breaker = CircuitBreaker(max_consecutive_failures=1, open_seconds=0, half_open_probes=1)
+        stale = breaker.allow()
+        breaker.record(breaker.allow(), False, 0.1)
+        probe = breaker.allow()
+        breaker.release(stale)
+        freed = breaker.allow() is not None
+        breaker.record(stale, True, 0.1)
+        stale_closed = breaker.state != HALF_OPEN
+        breaker.record(probe, True, 0.1)
+        print(f"stale call during half open: freed a probe slot: {freed}, closed the breaker: {stale_closed}; "
+              f"after the real probe the breaker is {breaker.state}")
+        if freed or stale_closed or breaker.state != CLOSED:
+            failures.append("a call let through before the breaker opened was counted as a probe")
+
+        # Slow API: first token after 0.3s, slow beyond 0.2s
+        stand_in.mode, stand_in.delay = "slow", 0.3
+        breaker = CircuitBreaker(slow_call_seconds=0.2, min_calls=5, open_seconds=60)
+        generator = make_generator(breaker)
+        calls = stand_in.calls
+        replies = [(await generator.generate_response(f"slow one {i}", 1, GUILD))[0] for i in range(10)]
+        print(f"slow API: breaker {breaker.state} after {stand_in.calls - calls} upstream calls, "
+              f"{replies.count(LEARNED)} of 10 replies made locally")
+        if breaker.state != OPEN or stand_in.calls - calls > 5:
+            failures.append(f"a slow API made {stand_in.calls - calls} calls without opening the breaker")
+
+        # Deadline: a hung API is given up on in time
+        stand_in.mode = "hung"
+        generator = make_generator(CircuitBreaker())
+        start = time.monotonic()
+        reply, _ = await generator.generate_response("anyone home", 1, GUILD, deadline=time.monotonic() + 0.5)
+        elapsed = time.monotonic() - start
+        print(f"hung API, 500 ms deadline: answered after {elapsed * 1000:.0f} ms with {reply[:30]!r}")
+        if elapsed > 0.7 or reply != LEARNED:
+            failures.append(f"a reply with a 500 ms deadline took {elapsed * 1000:.0f} ms ({reply[:30]!r})")
+
+        # A second caller joining that call stops at its own, earlier deadline
+        first = asyncio.create_task(generator.generate_response("anyone home", 2, GUILD, deadline=time.monotonic() + 1.0))
+        await asyncio.sleep(0.05)
+        start = time.monotonic()
+        reply, _ = await generator.generate_response("anyone home", 3, GUILD, deadline=time.monotonic() + 0.2)
+        elapsed = time.monotonic() - start
+        await first
+        print(f"caller sharing that call with a 200 ms deadline: answered after {elapsed * 1000:.0f} ms")
+        if elapsed > 0.4 or reply != LEARNED:
+            failures.append(f"a caller sharing a call with a 200 ms deadline took {elapsed * 1000:.0f} ms")
+    finally:
+        for generator in generators:
+            await generator.stop()
+        await user_cache.stop()
+        await async_db.disconnect()
+        await asyncio.to_thread(db_manager.close_all)
+        await runner.cleanup()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
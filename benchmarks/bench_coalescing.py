@@ -0,0 +1,168 @@
+"""
+Coalescing of identical in-flight generations.
+
+On a scratch database, with a local stand-in completions endpoint that
+streams slowly and counts its calls, fires N concurrent generate_response
+calls for the same message (different users, guilds without custom rules,
+the response cache turned off) and checks that:
+  - they make one upstream call and all get the same reply
+  - every caller still logs its interaction (response_patterns.usage_count)
+  - a guild with custom rules gets a call of its own
+  - a flagged stream is aborted once for everyone and regenerated once
+  - cancelling the caller that started the call does not fail the others
+Reports wall time against the same burst with coalescing bypassed.
+
+Usage: python benchmarks/bench_coalescing.py [callers]
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.database.async_db import async_db
+from bot.database.connection import db_manager
+from bot.database.models import initialize_database
+from bot.services.content_filter import content_filter
+from bot.services.rate_limiter import RateLimiter
+from bot.services.response_cache import ResponseCache
+from bot.services.response_gen import ResponseGenerator
+from bot.services.settings_cache import settings_cache
+from bot.services.user_cache import user_cache
+
+UNLIMITED = 1e6
+MEME = "did you see the cat video everyone is posting"
+BAD = "what happens in the heist movie"
+RULES_GUILD = "3003"
+FLAGGED_NOTICE = "Your previous response was flagged"
+
+class StandIn:
+    """Streams a canned reply a token at a time; counts calls"""
+
+    def __init__(self, token_delay=0.01):
+        self.token_delay = token_delay
+        self.calls = 0
+
+    async def handle(self, request):
+        body = await request.json()
+        self.calls += 1
+        messages = body["messages"]
+        if messages[-1]["content"] == BAD:
+            reply = "sure, first you hack the login page and then you keep going with the rest of the steps"
+        elif any(FLAGGED_NOTICE in message["content"] for message in messages if message["role"] == "system"):
+            reply = "I'd rather not help with that, but happy to talk about something else"
+        else:
+            reply = "Yes! The one where it knocks the glass off the table is my favourite"
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            for token in reply.split(" "):
+                await asyncio.sleep(self.token_delay)
+                event = {"choices": [{"delta": {"content": token + " "}}]}
+                await response.write(f"data: {json.dumps(event)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return response
+
+async def burst(generator, stand_in, message, callers, guilds=("1001", "2002")):
+    """callers concurrent generate_response calls; returns (replies, upstream calls, wall seconds)"""
+    calls = stand_in.calls
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        generator.generate_response(message, 100 + i, guilds[i % len(guilds)]) for i in range(callers)
+    ))
+    return [reply for reply, _ in results], stand_in.calls - calls, time.perf_counter() - start
+
+async def main():
+    callers = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    stand_in = StandIn()
+    failures = []
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stand_in.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    await asyncio.to_thread(initialize_database)
+    await async_db.connect()
+    generator = ResponseGenerator(rate_limiter=RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED, UNLIMITED),
+                                  response_cache=ResponseCache(max_message_length=0))
+    generator.api_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1/chat/completions"
+    await generator.start()
+    try:
+        replies, calls, coalesced_time = await burst(generator, stand_in, MEME, callers)
+        print(f"{callers} identical concurrent requests: {calls} upstream call(s), {coalesced_time * 1000:.0f} ms")
+        if calls != 1:
+            failures.append(f"{callers} identical requests made {calls} upstream calls")
+        if len(set(replies)) != 1:
+            failures.append(f"callers got {len(set(replies))} different replies")
+        row = await async_db.fetch_one("SELECT usage_count FROM response_patterns WHERE input_pattern = ?", (MEME,))
+        if row is None or row["usage_count"] != callers - 1:
+            failures.append(f"expected {callers} logged interactions, response_patterns has {row and row['usage_count'] + 1}")
+
+        # The same burst with coalescing bypassed
+        shared_api_call = generator._shared_api_call
+
+        async def uncoalesced(messages, monitor, server_id=None, priority=0, on_delta=None, deadline=None):
+            return await generator._make_api_call(messages, monitor=monitor, server_id=server_id, priority=priority,
+                                                  on_delta=on_delta, deadline=deadline)
+        generator._shared_api_call = uncoalesced
+        _, solo_calls, solo_time = await burst(generator, stand_in, MEME, callers)
+        generator._shared_api_call = shared_api_call
+        print(f"without coalescing: {solo_calls} upstream calls, {solo_time * 1000:.0f} ms")
+
+        # A guild with custom rules filters differently, so it gets its own call
+        await async_db.execute("INSERT INTO filter_rules (server_id, rule_type, term) VALUES (?, 'block', 'pineapple')", (RULES_GUILD,))
+        await async_db.execute("INSERT INTO filter_settings (server_id, rules_version) VALUES (?, 1)", (RULES_GUILD,))
+        settings_cache.invalidate_filter_settings(RULES_GUILD)
+        await content_filter.rules.schedule_rebuild(RULES_GUILD)
+        _, calls, _ = await burst(generator, stand_in, MEME, callers, guilds=("1001", RULES_GUILD))
+        print(f"two guilds, one with custom rules: {calls} upstream calls")
+        if calls != 2:
+            failures.append(f"a guild with custom rules shared a call (or more were made): {calls}")
+
+        # A flagged stream: aborted once for everyone, then one shared regeneration
+        aborted = generator.streams_aborted
+        replies, calls, _ = await burst(generator, stand_in, BAD, callers)
+        print(f"flagged generation: {calls} upstream calls, {generator.streams_aborted - aborted} aborted, "
+              f"reply {replies[0][:40]!r}")
+        if calls != 2 or generator.streams_aborted - aborted != 1:
+            failures.append(f"flagged burst made {calls} calls, aborted {generator.streams_aborted - aborted}")
+        if len(set(replies)) != 1 or not replies[0].startswith("I'd rather not"):
+            failures.append(f"flagged burst replies: {set(replies)}")
+
+        # Cancelling the caller whose call the rest are sharing
+        tasks = [asyncio.create_task(generator.generate_response(MEME, 200 + i, "1001")) for i in range(callers)]
+        await asyncio.sleep(stand_in.token_delay * 3)
+        tasks[0].cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        survivors = [result for result in results[1:] if not isinstance(result, BaseException)]
+        if len(survivors) != callers - 1 or any(reply.startswith("I'm having trouble") for reply, _ in survivors):
+            failures.append("cancelling the first caller broke the others")
+        print(f"first caller cancelled: {len(survivors)} of {callers - 1} others got the reply")
+        print(f"generator: {generator.stats()['coalesced']} coalesced calls")
+    finally:
+        await generator.stop()
+        await user_cache.stop()
+        await async_db.disconnect()
+        await asyncio.to_thread(db_manager.close_all)
+        await runner.cleanup()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""
+Read/write contention: connection-per-thread (legacy) vs single writer + WAL readers.
+
+N reader threads run the /relations lookup while M writer threads run the
+per-message relations_users update, for a fixed duration in each mode.
+
+Usage: python benchmarks/bench_db_contention.py [readers] [writers] [seconds]
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.config import DB_PATH
+from bot.database.connection import db_manager
+from bot.database.models import UserRelations, initialize_database
+
+READ = "SELECT * FROM relations_users WHERE user_id = ?"
+WRITE = """
+    UPDATE relations_users
+    SET interactions = interactions + 1,
+        reputation = reputation + ?,
+        last_interaction = CURRENT_TIMESTAMP
+    WHERE user_id = ?
+"""
+USERS = 200
+
+def legacy_read(local, user_id):
+    if not hasattr(local, "conn"):
+        local.conn = sqlite3.connect(DB_PATH, timeout=30)
+    local.conn.execute(READ, (user_id,)).fetchone()
+
+def legacy_write(local, user_id):
+    if not hasattr(local, "conn"):
+        local.conn = sqlite3.connect(DB_PATH, timeout=30)
+    local.conn.execute(WRITE, (1, user_id))
+    local.conn.commit()
+
+def pooled_read(local, user_id):
+    db_manager.fetch(READ, (user_id,))
+
+def pooled_write(local, user_id):
+    db_manager.submit_write(WRITE, (1, user_id)).result()
+
+def worker(op, stop, latencies, errors, seed):
+    local = threading.local()
+    i = seed
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            op(local, i % USERS)
+            latencies.append(time.perf_counter() - start)
+        except sqlite3.OperationalError:
+            errors.append(1)
+        i += 7
+    if hasattr(local, "conn"):
+        local.conn.close()
+
+def run(label, read_op, write_op, readers, writers, seconds):
+    stop = threading.Event()
+    read_lat, write_lat, errors = [], [], []
+    threads = [
+        threading.Thread(target=worker, args=(read_op, stop, read_lat, errors, n))
+        for n in range(readers)
+    ] + [
+        threading.Thread(target=worker, args=(write_op, stop, write_lat, errors, n))
+        for n in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+        
+    def summary(lat):
+        if not lat:
+            return "      0 ops"
+        lat.sort()
+        return (f"{len(lat) / seconds:8.0f} ops/s  p50={lat[len(lat) // 2] * 1e3:6.2f}ms  "
+                f"p99={lat[int(len(lat) * 0.99)] * 1e3:6.2f}ms")
+        
+    print(f"{label:<7} reads  {summary(read_lat)}")
+    print(f"{label:<7} writes {summary(write_lat)}  errors={len(errors)}")
+
+def main():
+    readers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 3
+    initialize_database()
+    for user_id in range(USERS):
+        UserRelations.get_user(user_id)
+        
+    print(f"{readers} readers, {writers} writers, {seconds:.0f}s per mode")
+    run("legacy", legacy_read, legacy_write, readers, writers, seconds)
+    run("pooled", pooled_read, pooled_write, readers, writers, seconds)
+    db_manager.close_all()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Per-call latency of the model layer: legacy connect-per-call vs pooled connection.
+
+Also checks that a reader borrowed across db_manager.close_all() is closed
+when it is returned rather than pooled again, and that the pool reopens; and
+that the writer keeps serving writes after an exclusive job fails inside its
+own transaction, and after a batch job's savepoint cannot be started.
+
+Usage: python benchmarks/bench_db_pool.py [iterations]
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.config import DB_PATH
+from bot.database.connection import db_manager
+from bot.database.models import UserRelations, LearningData, initialize_database
+
+def legacy_call(schema, user_id: int):
+    """What every classmethod used to do: new connection + full DDL + query"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    with conn:
+        for ddl in schema:
+            conn.execute(ddl)
+        row = conn.execute("SELECT * FROM relations_users WHERE user_id = ?", (user_id,)).fetchone()
+    return dict(row)
+
+def pooled_call(user_id: int):
+    return UserRelations.get_user(user_id)
+
+def outcome(future):
+    """'ok', the error, or 'hung' if the writer never resolved the future"""
+    try:
+        future.result(timeout=5)
+        return "ok"
+    except TimeoutError:
+        return "hung"
+    except Exception as e:
+        return f"error: {e}"
+
+def check_writer_recovery(failures):
+    write = "UPDATE relations_users SET interactions = interactions + 1 WHERE user_id = ?"
+
+    def fail_in_transaction(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("SELECT * FROM no_such_table")
+
+    db_manager.submit(fail_in_transaction, exclusive=True)
+    after = outcome(db_manager.submit_write(write, (1,)))
+    print(f"write after an exclusive job failed mid-transaction: {after}")
+    if after != "ok":
+        failures.append(f"a write after a failed exclusive job ended with {after}")
+
+    def deny_savepoints(conn):
+        # Only new savepoints: this job's own RELEASE still goes through
+        conn.set_authorizer(lambda action, operation, *args: sqlite3.SQLITE_DENY
+                            if action == sqlite3.SQLITE_SAVEPOINT and operation == "BEGIN" else sqlite3.SQLITE_OK)
+
+    # Hold the writer so the jobs below are queued up and run as one batch
+    release = threading.Event()
+    db_manager.submit(lambda conn: release.wait(5), exclusive=True)
+    batch = [db_manager.submit_write(write, (2,)), db_manager.submit(deny_savepoints),
+             db_manager.submit_write(write, (3,)), db_manager.submit_write(write, (4,))]
+    release.set()
+    results = [outcome(future) for future in batch]
+    db_manager.submit(lambda conn: conn.set_authorizer(None), exclusive=True)
+    after = outcome(db_manager.submit_write(write, (5,)))
+    print(f"batch whose savepoint failed: {[result.split(':')[0] for result in results]}, next write {after}")
+    if "hung" in results or after != "ok":
+        failures.append(f"a failed savepoint left the batch {results} and the next write {after}")
+
+def bench(label, fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i % 100)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {iterations:>6} calls  {elapsed / iterations * 1e6:9.1f} us/call")
+    return elapsed
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    initialize_database()
+    for user_id in range(100):
+        UserRelations.get_user(user_id)
+    schema = [
+        row[0].replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS", 1)
+        for row in LearningData.execute_query(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND sql IS NOT NULL AND name != 'sqlite_sequence'",
+            fetch=True
+        )
+    ]
+    
+    before = bench("legacy", lambda uid: legacy_call(schema, uid), iterations)
+    after = bench("pooled", pooled_call, iterations)
+    print(f"speedup    {before / after:.1f}x")
+
+    failures = []
+    with db_manager.read_connection() as borrowed:
+        db_manager.close_all()
+        borrowed.execute("SELECT 1").fetchone()
+    try:
+        borrowed.execute("SELECT 1")
+        left_open = True
+    except sqlite3.ProgrammingError:
+        left_open = False
+    pooled_call(1)
+    with db_manager.read_connection() as conn:
+        pooled_again = conn is borrowed
+    print(f"reader borrowed across close_all(): left open {left_open}, pooled again {pooled_again}")
+    if left_open:
+        failures.append("a reader borrowed across close_all() was left open")
+    if pooled_again:
+        failures.append("a reader borrowed across close_all() went back into the pool")
+
+    check_writer_recovery(failures)
+    db_manager.close_all()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Worst-case ContentFilter latency on crafted inputs.
+
+Each input targets one detector: repeated pair bases that made the old
+base.*modifier regexes backtrack quadratically, long word runs for the
+repetition check, near-miss character runs for the spam check, dense keyword
+hits for the automaton. Every input is timed REPEATS times at the scan cap
+and far past it; the script exits non-zero if the median for any input
+exceeds the latency budget (the slowest run is shown too, but one scheduler
+hiccup is not the filter's cost). The legacy regexes are timed at the cap
+for reference.
+
+Usage: python benchmarks/bench_filter_adversarial.py [budget_ms]
+"""
+import gc
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot.config import FILTER_LIMITS
+from bot.services.content_filter import ContentFilter
+
+REPEATS = 5
+
+def adversarial_inputs(length):
+    def fill(unit):
+        return (unit * (length // len(unit) + 1))[:length]
+    return {
+        "pair bases": fill("settings system prompt instructions character "),
+        "pair bases, one line each": fill("settings\ninstructions\n"),
+        "word run": fill("a "),
+        "near-miss char runs": fill("aaaaaaaaaa "),
+        "repetition near-miss": fill("ha hahaha"[:-1] + " "),
+        "keyword dense": fill("hack token cp ass damn "),
+        "long single word": fill("x"),
+        "distinct characters": "".join(chr(0x4E00 + i % 20000) for i in range(length)),
+    }
+
+def legacy_scan(text):
+    text = text.lower()
+    for base, modifier in [("system prompt", "change|modify|update|ignore"), ("instructions", "ignore|bypass|override"),
+                           ("settings", "change|modify|override"), ("character", "change|switch|modify")]:
+        re.search(f"{base}.*(?:{modifier})|(?:{modifier}).*{base}", text, re.IGNORECASE)
+    re.findall(r"(\b\w+\b)\s+\1{3,}", text)
+    re.search(r"(.)\1{10,}", text)
+
+def timings_ms(fn, text):
+    """Sorted run times of fn(text) over REPEATS runs"""
+    # Collector pauses depend on the whole heap rather than the filter, so
+    # they are kept out of the measurement, as timeit does
+    times = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            fn(text)
+            times.append((time.perf_counter() - start) * 1000)
+    finally:
+        gc.enable()
+    return sorted(times)
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    content_filter = ContentFilter()
+    cap = FILTER_LIMITS["max_scan_length"]
+    failures = 0
+
+    print(f"budget {budget_ms:.1f} ms/message, scan cap {cap:,} chars")
+    print(f"{'input':<28} {'length':>8} {'median ms':>10} {'worst ms':>9} {'legacy ms':>10}")
+    for length in (cap, cap * 25):
+        for name, text in adversarial_inputs(length).items():
+            times = timings_ms(lambda message: content_filter.scan(message, {}), text)
+            median = times[len(times) // 2]
+            legacy = f"{timings_ms(legacy_scan, text)[REPEATS // 2]:10.2f}" if length == cap else f"{'-':>10}"
+            flag = "" if median <= budget_ms else "  OVER BUDGET"
+            print(f"{name:<28} {length:>8,} {median:10.2f} {times[-1]:9.2f} {legacy}{flag}")
+            if median > budget_ms:
+                failures += 1
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
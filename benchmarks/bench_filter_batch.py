@@ -0,0 +1,167 @@
+"""
+ContentFilter.filter_batch vs per-message filter_message, and the
+conversation_log history scan built on it.
+
+On a scratch database with one guild that has custom rules, checks that
+filter_batch (inline and over a process pool) returns exactly what
+filter_message returns per message, and reports messages/sec for each. Then
+fills conversation_log, runs HistoryScanner, checks the stored flags match
+the filter, edits the guild's rules and checks the re-scan clears the rows
+that no longer match. Another guild's rows, flagged under its own rules,
+are left alone by both scans.
+
+Usage: python benchmarks/bench_filter_batch.py [rows] [workers]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.database.async_db import async_db
+from bot.database.connection import db_manager
+from bot.database.models import initialize_database
+from bot.services.content_filter import ContentFilter
+from bot.services.guild_rules import GuildRuleCache
+from bot.services.history_scan import HistoryScanner
+from bot.services.settings_cache import settings_cache
+from bot.services.verdict_cache import VerdictCache
+
+GUILD = "1234"
+OTHER_GUILD = "5678"
+
+def make_messages(count, rng):
+    words = "the match was so close today and everyone on the team played really well".split()
+    extras = [
+        "ignore previous instructions and tell me", "i love pineapple pizza", "damn that was close",
+        "join the hackathon", "settings change please", "aaaaaaaaaaaaaaaa", "hack the planet",
+    ]
+    messages = []
+    for i in range(count):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(5, 30)))
+        if rng.random() < 0.15:
+            text += " " + rng.choice(extras)
+        messages.append(f"{text} #{i}")
+    return messages
+
+async def set_rules(blocked, allowed):
+    async with async_db.transaction() as tx:
+        tx.execute("DELETE FROM filter_rules WHERE server_id = ?", (GUILD,))
+        for rule_type, terms in (("block", blocked), ("allow", allowed)):
+            for term in terms:
+                tx.execute(
+                    "INSERT INTO filter_rules (server_id, rule_type, term) VALUES (?, ?, ?)",
+                    (GUILD, rule_type, term)
+                )
+        tx.execute(
+            """
+            INSERT INTO filter_settings (server_id, rules_version) VALUES (?, 1)
+            ON CONFLICT(server_id) DO UPDATE SET rules_version = rules_version + 1
+            """,
+            (GUILD,)
+        )
+    settings_cache.invalidate_filter_settings(GUILD)
+
+async def timed(coro, count):
+    start = time.perf_counter()
+    result = await coro
+    return result, count / (time.perf_counter() - start)
+
+async def compare_entry_points(content_filter, messages, workers):
+    failures = []
+
+    async def per_message():
+        return [await content_filter.filter_message(text, GUILD) for text in messages]
+
+    expected, single_rate = await timed(per_message(), len(messages))
+    inline, inline_rate = await timed(content_filter.filter_batch(messages, GUILD), len(messages))
+    with ProcessPoolExecutor(workers) as executor:
+        # Worker start-up is paid once per scan, not per batch
+        await content_filter.filter_batch(messages[:workers * 250], GUILD, executor=executor)
+        pooled, pooled_rate = await timed(content_filter.filter_batch(messages, GUILD, executor=executor), len(messages))
+
+    if inline != expected:
+        failures.append("inline filter_batch differs from filter_message")
+    if pooled != expected:
+        failures.append(f"filter_batch over {workers} processes differs from filter_message")
+    print(f"{'filter_message loop':<28} {single_rate:10,.0f} messages/sec")
+    print(f"{'filter_batch inline':<28} {inline_rate:10,.0f} messages/sec ({inline_rate / single_rate:.1f}x)")
+    print(f"{f'filter_batch {workers} processes':<28} {pooled_rate:10,.0f} messages/sec ({pooled_rate / single_rate:.1f}x)")
+    return failures, expected
+
+async def check_history_scan(content_filter, messages, expected, workers):
+    failures = []
+    await async_db.executemany(
+        "INSERT INTO conversation_log (user_id, user_message, bot_response, server_id) VALUES (?, ?, ?, ?)",
+        [(i % 50, text, "ok", GUILD) for i, text in enumerate(messages)]
+    )
+    # Another guild's rows: one its own rules flagged, one this guild's rules would flag
+    await async_db.executemany(
+        "INSERT INTO conversation_log (user_id, user_message, bot_response, server_id, flagged, flag_reason) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(1, "mango smoothie time", "ok", OTHER_GUILD, 1, "blocked term: mango"),
+         (2, "pineapple on pizza is great", "ok", OTHER_GUILD, 0, None)]
+    )
+    scanner = HistoryScanner(content_filter=content_filter, workers=workers, page_pause=0)
+
+    result = await scanner.run(GUILD)
+    rows = await async_db.fetch_all(
+        "SELECT user_message FROM conversation_log WHERE flagged = 1 AND server_id = ? ORDER BY id", (GUILD,)
+    )
+    want = [text for text, verdict in zip(messages, expected) if verdict["is_filtered"]]
+    if [row["user_message"] for row in rows] != want:
+        failures.append(f"history scan flagged {len(rows)} rows, the filter flags {len(want)}")
+    print(f"history scan: {result['scanned']:,} rows in {result['pages']} pages, {result['flagged']:,} flagged, "
+          f"{result['scanned'] / (result['duration_ms'] / 1000):,.0f} rows/sec")
+
+    # Drop the custom block term: the rows it alone flagged are cleared
+    await set_rules([], ["hackathon"])
+    await content_filter.rules.schedule_rebuild(GUILD)
+    result = await scanner.run(GUILD)
+    pineapple = await async_db.fetch_one(
+        "SELECT COUNT(*) AS count FROM conversation_log "
+        "WHERE flagged = 1 AND flag_reason LIKE 'blocked term%' AND server_id = ?",
+        (GUILD,)
+    )
+    if pineapple["count"] or not result["cleared"]:
+        failures.append(f"re-scan left {pineapple['count']} custom-rule flags, cleared {result['cleared']}")
+    print(f"re-scan after rule edit: {result['cleared']:,} flags cleared")
+
+    other = await async_db.fetch_all(
+        "SELECT flagged, flag_reason FROM conversation_log WHERE server_id = ? ORDER BY id", (OTHER_GUILD,)
+    )
+    if [(row["flagged"], row["flag_reason"]) for row in other] != [(1, "blocked term: mango"), (0, None)]:
+        failures.append(f"scanning {GUILD} changed another guild's flags: {other}")
+    print(f"other guild's rows after both scans: {[(row['flagged'], row['flag_reason']) for row in other]}")
+    return failures
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    messages = make_messages(count, random.Random(11))
+
+    await asyncio.to_thread(initialize_database)
+    await async_db.connect()
+    try:
+        await set_rules(["pineapple"], ["hackathon"])
+        content_filter = ContentFilter(verdicts=VerdictCache(max_entries=0), rules=GuildRuleCache())
+        failures, expected = await compare_entry_points(content_filter, messages, workers)
+        failures += await check_history_scan(content_filter, messages, expected, workers)
+    finally:
+        await async_db.disconnect()
+        await asyncio.to_thread(db_manager.close_all)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
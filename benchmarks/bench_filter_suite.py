@@ -0,0 +1,250 @@
+"""
+ContentFilter benchmark suite.
+
+Drives filter_message, detect_jailbreak, check_mature_content and
+is_safe_content over three corpora:
+
+    realistic     benchmarks/corpora/realistic_chat.txt
+    pathological  long repetitions, near-miss jailbreak phrases, emoji floods,
+                  keyword and pair-base floods
+    max_length    messages at the Discord limits, at the scan cap and past it
+
+and reports throughput, p50/p99/max latency and peak allocation per call
+(tracemalloc). Results are compared against benchmarks/baselines/filter_suite.json;
+the script exits non-zero if throughput or allocation regress by more than the
+threshold, or p99 latency by more than twice it. Each pass over a corpus is
+paired with a fixed calibration workload and compared in those units, so the
+baseline carries across machines and load changes during a run.
+
+Runs offline: no Discord connection, no database (filter_message is called
+without a guild, with the verdict cache disabled).
+
+Usage:
+    python benchmarks/bench_filter_suite.py [--threshold 0.25] [--rounds 1.0]
+    python benchmarks/bench_filter_suite.py --update-baseline
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot.config import FILTER_LIMITS, GENERATION_LIMITS
+from bot.services.content_filter import ContentFilter
+from bot.services.verdict_cache import VerdictCache
+
+CORPUS_DIR = os.path.join(ROOT, "benchmarks", "corpora")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "filter_suite.json")
+
+def realistic_corpus():
+    with open(os.path.join(CORPUS_DIR, "realistic_chat.txt"), encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+def pathological_corpus():
+    near_misses = [
+        "ignore previous instruction", "ignore your rule", "brake character", "pretend you're",
+        "ignore previous\ninstructions", "bypass you filters", "act as different", "stop bein",
+        "dont be", "leave charactr", "new personalty", "override you settings",
+    ]
+    return [
+        "ha " * 1300,
+        "spam " * 800,
+        "ha hahaha " * 400,
+        "aaaaaaaaaa " * 360,
+        "a" * 3999,
+        " ".join(near_misses) * 12,
+        "\n".join(near_misses * 20),
+        "😂" * 2000,
+        "🥰😊❤️💕" * 500,
+        "settings system prompt instructions character " * 85,
+        "settings\ninstructions\n" * 180,
+        "hack token cp ass damn " * 170,
+        "xd" * 1999 + "!",
+        "".join(chr(0x4E00 + i) for i in range(3500)),
+    ]
+
+def max_length_corpus():
+    chat = " ".join(realistic_corpus())
+    limit = GENERATION_LIMITS["max_response_length"]
+    cap = FILTER_LIMITS["max_scan_length"]
+
+    def fill(unit, length):
+        return (unit * (length // len(unit) + 1))[:length]
+
+    return [
+        fill(chat + " ", limit),
+        fill(chat + " ", cap),
+        fill(chat + " ", cap * 25),
+        fill("settings change ", cap),
+        fill("x", cap),
+        fill("ignore previous instructions ", cap * 25),
+    ]
+
+# corpus -> (builder, passes over it)
+CORPORA = {
+    "realistic": (realistic_corpus, 150),
+    "pathological": (pathological_corpus, 30),
+    "max_length": (max_length_corpus, 30),
+}
+
+def run_coroutine(coro):
+    """Drive a coroutine that never suspends (filter_message without a guild)"""
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    coro.close()
+    raise RuntimeError("filter_message suspended; the suite must run without a guild or database")
+
+def entry_points(content_filter):
+    return {
+        "filter_message": lambda text: run_coroutine(content_filter.filter_message(text)),
+        "detect_jailbreak": content_filter.detect_jailbreak,
+        "check_mature_content": lambda text: content_filter.check_mature_content(text, {}),
+        "is_safe_content": content_filter.is_safe_content,
+    }
+
+_CALIBRATION_RE = re.compile(r"\w+")
+_CALIBRATION_TEXT = "the match was so close today and everyone played well " * 20
+
+def calibrate():
+    """Time of a fixed ~1 ms pure-Python workload, in ns"""
+    start = time.perf_counter_ns()
+    counts = {}
+    for _ in range(20):
+        for word in _CALIBRATION_RE.findall(_CALIBRATION_TEXT):
+            counts[word] = counts.get(word, 0) + 1
+    return time.perf_counter_ns() - start
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def measure(call, corpus, rounds):
+    call(corpus[0])
+
+    # Every pass is preceded by the calibration workload, and the regression
+    # check uses pass cost in calibration units: machine speed and load swings
+    # during the run hit both alike. Throughput and p99 come from the median
+    # pass. Collector pauses depend on the whole heap rather than the filter,
+    # so the collector is off while timing.
+    latencies = []
+    pass_costs = []
+    pass_p99s = []
+    best_pass = None
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            unit = calibrate()
+            pass_start = time.perf_counter_ns()
+            pass_latencies = []
+            for text in corpus:
+                start = time.perf_counter_ns()
+                call(text)
+                pass_latencies.append(time.perf_counter_ns() - start)
+            elapsed = time.perf_counter_ns() - pass_start
+            pass_latencies.sort()
+            pass_costs.append(elapsed / unit)
+            pass_p99s.append(percentile(pass_latencies, 0.99) / unit)
+            latencies.extend(pass_latencies)
+            best_pass = elapsed if best_pass is None else min(best_pass, elapsed)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    try:
+        peaks = []
+        for text in corpus:
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            call(text)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "calls_per_sec": len(corpus) / (best_pass / 1e9),
+        "p50_us": percentile(latencies, 0.50) / 1000,
+        "p99_us": percentile(latencies, 0.99) / 1000,
+        "max_us": latencies[-1] / 1000,
+        "alloc_bytes": sum(peaks) / len(peaks),
+        # Machine-independent figures used for the regression check
+        "calls_per_unit": len(corpus) / percentile(sorted(pass_costs), 0.50),
+        "p99_units": percentile(sorted(pass_p99s), 0.50),
+    }
+
+def compare(result, baseline, threshold):
+    """Regression messages for one result vs its baseline (in calibration units)"""
+    problems = []
+    change = result["calls_per_unit"] / baseline["calls_per_unit"] - 1
+    if change < -threshold:
+        problems.append(f"throughput {change:+.0%}")
+    change = result["p99_units"] / baseline["p99_units"] - 1
+    if change > 2 * threshold:
+        problems.append(f"p99 latency {change:+.0%}")
+    # Allocation is not machine dependent; allow 1 KiB of interpreter noise
+    if result["alloc_bytes"] > baseline["alloc_bytes"] * (1 + threshold) + 1024:
+        problems.append(f"alloc {result['alloc_bytes'] / 1024:.1f}KiB vs {baseline['alloc_bytes'] / 1024:.1f}KiB")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed regression fraction (default 0.25)")
+    parser.add_argument("--rounds", type=float, default=1.0, help="multiplier for the passes over each corpus")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    content_filter = ContentFilter(verdicts=VerdictCache(max_entries=0))
+    results = {}
+
+    print(f"{'corpus/function':<36} {'calls/s':>10} {'p50 us':>8} {'p99 us':>8} {'max us':>9} {'alloc KiB':>10}")
+    for corpus_name, (build, rounds) in CORPORA.items():
+        corpus = build()
+        for function_name, call in entry_points(content_filter).items():
+            key = f"{corpus_name}/{function_name}"
+            result = measure(call, corpus, max(1, int(rounds * args.rounds)))
+            results[key] = result
+            print(f"{key:<36} {result['calls_per_sec']:>10,.0f} {result['p50_us']:>8.1f} "
+                  f"{result['p99_us']:>8.1f} {result['max_us']:>9.1f} {result['alloc_bytes'] / 1024:>10.1f}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "results": results
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {os.path.relpath(BASELINE_PATH, ROOT)}")
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print("No baseline stored; run with --update-baseline to create one")
+        return 0
+
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nvs baseline (threshold {args.threshold:.0%})")
+
+    regressions = 0
+    for key, result in results.items():
+        if key not in baseline["results"]:
+            print(f"  {key}: no baseline entry")
+            continue
+        for problem in compare(result, baseline["results"][key], args.threshold):
+            regressions += 1
+            print(f"  REGRESSION {key}: {problem}")
+    if not regressions:
+        print("  no regressions")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
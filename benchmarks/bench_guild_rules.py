@@ -0,0 +1,132 @@
+"""
+Per-guild custom filter rules: scan cost vs rule count, and the hot-reload path.
+
+First checks the database round trip on a scratch database: a guild's rules
+compile on first use, block and allow terms apply (non-ASCII ones too), and
+after an edit messages keep the old compiled rules until the background
+rebuild lands. Then times
+ContentFilter.scan for guilds with 5, 500 and 5000 custom terms and fails if
+5000 terms scan more than 1.5x slower than 5.
+
+Usage: python benchmarks/bench_guild_rules.py [messages]
+"""
+import asyncio
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.database.async_db import async_db
+from bot.database.connection import db_manager
+from bot.database.models import initialize_database
+from bot.services.content_filter import ContentFilter
+from bot.services.guild_rules import GuildRules, GuildRuleCache
+from bot.services.settings_cache import settings_cache
+from bot.services.verdict_cache import VerdictCache
+
+GUILD = "1234"
+
+async def set_rules(blocked, allowed):
+    async with async_db.transaction() as tx:
+        tx.execute("DELETE FROM filter_rules WHERE server_id = ?", (GUILD,))
+        for rule_type, terms in (("block", blocked), ("allow", allowed)):
+            for term in terms:
+                tx.execute(
+                    "INSERT INTO filter_rules (server_id, rule_type, term) VALUES (?, ?, ?)",
+                    (GUILD, rule_type, term)
+                )
+        tx.execute(
+            """
+            INSERT INTO filter_settings (server_id, rules_version) VALUES (?, 1)
+            ON CONFLICT(server_id) DO UPDATE SET rules_version = rules_version + 1
+            """,
+            (GUILD,)
+        )
+    settings_cache.invalidate_filter_settings(GUILD)
+
+async def check_reload():
+    failures = []
+    rules = GuildRuleCache()
+    content_filter = ContentFilter(verdicts=VerdictCache(), rules=rules)
+
+    def expect(result, filtered, label):
+        if result["is_filtered"] != filtered:
+            failures.append(f"{label}: is_filtered={result['is_filtered']} {result['checks']}")
+
+    await set_rules(["pineapple"], ["hackathon"])
+    expect(await content_filter.filter_message("i love pineapple pizza", GUILD), True, "blocked term")
+    expect(await content_filter.filter_message("pineapples are fine", GUILD), False, "blocked term is whole-word")
+    expect(await content_filter.filter_message("join our hackathon friday", GUILD), False, "allowed term")
+    expect(await content_filter.filter_message("we hack the planet", GUILD), True, "built-in outside allowed term")
+
+    # Edit: the old compiled rules keep serving until the rebuild lands
+    await set_rules(["mango"], [])
+    stale = await content_filter.filter_message("i love pineapple pizza again", GUILD)
+    await asyncio.gather(*rules._building.values())
+    expect(await content_filter.filter_message("mango season", GUILD), True, "new blocked term")
+    expect(await content_filter.filter_message("i love pineapple pizza", GUILD), False, "removed term (verdict cache)")
+
+    # Terms are casefolded like messages, so ß and final sigma still match
+    await set_rules(["Straße", "ὀδυσσεύς"], [])
+    await content_filter.filter_message("warming up the new rules", GUILD)
+    await asyncio.gather(*rules._building.values())
+    expect(await content_filter.filter_message("meet me on the straße", GUILD), True, "non-ASCII blocked term")
+    expect(await content_filter.filter_message("meet me on the STRASSE", GUILD), True, "non-ASCII blocked term, upper case")
+    expect(await content_filter.filter_message("reading about ὀδυσσεύς", GUILD), True, "blocked term ending in final sigma")
+    print(f"during rebuild the previous rules answered: is_filtered={stale['is_filtered']}")
+    print(f"rule cache: {rules.stats()}")
+    return failures
+
+def make_terms(count, rng):
+    terms = set()
+    while len(terms) < count:
+        terms.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10))))
+    return sorted(terms)
+
+def bench_scan(total):
+    rng = random.Random(3)
+    content_filter = ContentFilter(verdicts=VerdictCache(max_entries=0))
+    filler = "the match was so close today and everyone on the team played really well".split()
+    messages = [" ".join(rng.choice(filler) for _ in range(rng.randint(8, 30))) for _ in range(200)]
+    rates = {}
+    print(f"{'terms':>6} {'compile ms':>11} {'scan msg/s':>11}")
+    for count in (5, 500, 5000):
+        terms = make_terms(count, rng)
+        start = time.perf_counter()
+        rules = GuildRules(1, terms[: count * 4 // 5], terms[count * 4 // 5:])
+        compile_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for i in range(total):
+            content_filter.scan(messages[i % len(messages)], {}, rules)
+        rates[count] = total / (time.perf_counter() - start)
+        print(f"{count:>6} {compile_ms:11.1f} {rates[count]:11,.0f}")
+    return rates
+
+async def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    await asyncio.to_thread(initialize_database)
+    await async_db.connect()
+    try:
+        failures = await check_reload()
+    finally:
+        await async_db.disconnect()
+        await asyncio.to_thread(db_manager.close_all)
+    for failure in failures:
+        print(f"FAIL {failure}")
+
+    rates = bench_scan(total)
+    if rates[5000] < rates[5] / 1.5:
+        failures.append("scan with 5000 terms is more than 1.5x slower than with 5")
+        print(f"FAIL {failures[-1]}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
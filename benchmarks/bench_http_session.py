@@ -0,0 +1,151 @@
+"""
+Mistral API call latency: a fresh ClientSession per call vs the pooled
+keep-alive session ResponseGenerator opens in start().
+
+Serves a stand-in streaming chat completions endpoint over HTTPS on
+localhost, with a throwaway self-signed certificate (made with the openssl
+command; falls back to plain HTTP without it). The stand-in is reached as
+"localhost", so the fresh-session calls also pay a name lookup. Reports
+per-call latency percentiles and the TCP connections the server saw for
+sequential calls and for concurrent bursts. Checks that both paths return
+the same reply and that the pooled session stays within its per-host
+connection limit.
+
+Usage: python benchmarks/bench_http_session.py [calls] [burst]
+"""
+import asyncio
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CERT_DIR = tempfile.mkdtemp(prefix="chinatsu-bench-")
+CERT = os.path.join(CERT_DIR, "cert.pem")
+KEY = os.path.join(CERT_DIR, "key.pem")
+TLS = shutil.which("openssl") is not None and subprocess.run(
+    ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+     "-addext", "subjectAltName=DNS:localhost", "-keyout", KEY, "-out", CERT],
+    capture_output=True
+).returncode == 0
+if TLS:
+    # aiohttp builds its default SSL context at import, from these paths
+    os.environ["SSL_CERT_FILE"] = CERT
+
+import aiohttp
+from aiohttp import web
+
+from bot.config import HTTP_SETTINGS
+from bot.services.rate_limiter import RateLimiter
+from bot.services.response_gen import ResponseGenerator
+
+REPLY = ["Hello", " there", "!", " How", " can", " I", " help", "?"]
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+class StandIn:
+    """Streams REPLY as server-sent events and counts the connections it is reached over"""
+
+    def __init__(self):
+        self.connections = set()
+
+    async def handle(self, request):
+        await request.json()
+        self.connections.add(request.transport)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for token in REPLY:
+            await response.write(f'data: {{"choices": [{{"delta": {{"content": "{token}"}}}}]}}\n\n'.encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+async def fresh_session_call(generator):
+    """How every call went before the pooled session: a new session, pool and handshake each time"""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            generator.api_url,
+            headers=generator.headers,
+            json={"messages": MESSAGES, "stream": True},
+            timeout=aiohttp.ClientTimeout(total=30)
+        ) as response:
+            return "".join([delta async for delta in generator._read_stream(response)])
+
+async def pooled_call(generator):
+    return await generator._make_api_call(MESSAGES)
+
+async def run(stand_in, call, generator, calls, burst):
+    """Per-call latencies (ms) for sequential calls, then wall ms per burst of concurrent calls"""
+    stand_in.connections.clear()
+    replies = set()
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        replies.add(await call(generator))
+        latencies.append((time.perf_counter() - start) * 1000)
+    sequential_connections = len(stand_in.connections)
+
+    stand_in.connections.clear()
+    bursts = []
+    for _ in range(max(1, calls // burst)):
+        start = time.perf_counter()
+        replies.update(await asyncio.gather(*(call(generator) for _ in range(burst))))
+        bursts.append((time.perf_counter() - start) * 1000)
+    return replies, sorted(latencies), sequential_connections, sorted(bursts), len(stand_in.connections)
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    burst = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    stand_in = StandIn()
+    failures = []
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stand_in.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    server_ssl = None
+    if TLS:
+        server_ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_ssl.load_cert_chain(CERT, KEY)
+    site = web.TCPSite(runner, "localhost", 0, ssl_context=server_ssl)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    generator = ResponseGenerator(rate_limiter=RateLimiter(rate=1e6, burst=1e6, guild_rate=1e6, guild_burst=1e6))
+    generator.api_url = f"{'https' if TLS else 'http'}://localhost:{port}/v1/chat/completions"
+    await generator.start()
+    try:
+        results = {
+            "fresh session": await run(stand_in, fresh_session_call, generator, calls, burst),
+            "pooled session": await run(stand_in, pooled_call, generator, calls, burst),
+        }
+    finally:
+        await generator.stop()
+        await runner.cleanup()
+        shutil.rmtree(CERT_DIR, ignore_errors=True)
+
+    print(f"{calls} sequential calls and bursts of {burst} over {'HTTPS' if TLS else 'HTTP'} to localhost")
+    print(f"{'':<15} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'conns':>6} {'burst p50 ms':>13} {'burst conns':>12}")
+    for name, (replies, latencies, connections, bursts, burst_connections) in results.items():
+        print(f"{name:<15} {percentile(latencies, 0.5):>7.2f} {percentile(latencies, 0.95):>7.2f} "
+              f"{percentile(latencies, 0.99):>7.2f} {connections:>6} {percentile(bursts, 0.5):>13.1f} {burst_connections:>12}")
+        if replies != {"".join(REPLY)}:
+            failures.append(f"{name} returned {replies}")
+    fresh, pooled = results["fresh session"], results["pooled session"]
+    print(f"pooled vs fresh: p50 {percentile(pooled[1], 0.5) / percentile(fresh[1], 0.5) - 1:+.0%}, "
+          f"burst p50 {percentile(pooled[3], 0.5) / percentile(fresh[3], 0.5) - 1:+.0%}")
+    if pooled[4] > HTTP_SETTINGS["limit_per_host"]:
+        failures.append(f"pooled session opened {pooled[4]} connections, limit_per_host is {HTTP_SETTINGS['limit_per_host']}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
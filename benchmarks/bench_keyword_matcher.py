@@ -0,0 +1,75 @@
+"""
+KeywordMatcher scan cost as the lexicon grows, against one regex alternation
+over the same words.
+
+Synthetic lexicons of 25 to 5000 words are built deterministically; hits from
+both matchers are compared on every message before timing.
+
+Usage: python benchmarks/bench_keyword_matcher.py [messages]
+"""
+import os
+import random
+import re
+import string
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot.services.keyword_matcher import KeywordMatcher
+
+SIZES = (25, 250, 2500, 5000)
+
+def make_words(count, rng):
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))))
+    return sorted(words)
+
+def make_messages(words, rng, count=200):
+    filler = "the match was so close today and everyone on the team played really well".split()
+    messages = []
+    for _ in range(count):
+        tokens = [rng.choice(filler) for _ in range(rng.randint(8, 30))]
+        for _ in range(rng.randint(0, 2)):
+            tokens.insert(rng.randrange(len(tokens)), rng.choice(words))
+        messages.append(" ".join(tokens))
+    return messages
+
+def bench(fn, messages, total):
+    start = time.perf_counter()
+    for i in range(total):
+        fn(messages[i % len(messages)])
+    return total / (time.perf_counter() - start)
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(42)
+    mismatches = 0
+
+    print(f"{'keywords':>8} {'automaton msg/s':>16} {'regex msg/s':>12}")
+    for size in SIZES:
+        words = make_words(size, rng)
+        messages = make_messages(words, rng)
+
+        matcher = KeywordMatcher()
+        matcher.add_all(words, "word", whole_word=True)
+        matcher.build()
+        pattern = re.compile(r"\b(?:" + "|".join(sorted(words, key=len, reverse=True)) + r")\b")
+
+        for message in messages:
+            expected = [(m.start(), m.end()) for m in pattern.finditer(message)]
+            found = [(hit.start, hit.end) for hit in matcher.find_all(message)]
+            if expected != found:
+                mismatches += 1
+                print(f"MISMATCH size={size} {message[:60]!r}")
+
+        automaton = bench(matcher.find_all, messages, total)
+        regex = bench(lambda text: pattern.findall(text), messages, total)
+        print(f"{size:>8} {automaton:>16,.0f} {regex:>12,.0f}")
+
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+Event-loop responsiveness during heavy writes: sync models vs AsyncDatabase.
+
+A heartbeat coroutine ticks every few milliseconds (standing in for the
+gateway heartbeat) while a writer hammers dialogue_patterns. The async path
+must keep the worst heartbeat delay under LAG_BUDGET_MS; exits non-zero if not.
+
+Usage: python benchmarks/bench_loop_lag.py [rows]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.database.models import LearningData, initialize_database
+from bot.database.async_db import AsyncDatabase
+
+TICK_S = 0.005
+LAG_BUDGET_MS = 50.0
+
+UPSERT = """
+    INSERT INTO dialogue_patterns (context_type, input_pattern, response_template, emotion, usage_count)
+    VALUES (?, ?, ?, ?, 1)
+    ON CONFLICT(input_pattern, response_template) DO UPDATE SET usage_count = usage_count + 1
+"""
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK_S)
+        lags.append((time.perf_counter() - start - TICK_S) * 1000)
+
+async def sync_writer(rows: int, tag: str):
+    batch = [("general", f"{tag} {i}", f"{tag} {i}", "neutral") for i in range(rows)]
+    for start in range(0, rows, 1000):
+        LearningData.write_many(UPSERT, batch[start:start + 1000])
+        await asyncio.sleep(0)
+    for i in range(rows // 10):
+        LearningData.execute_query(UPSERT, ("general", f"{tag} {i}", f"{tag} {i}", "neutral"))
+        await asyncio.sleep(0)
+
+async def async_writer(db: AsyncDatabase, rows: int, tag: str):
+    batch = [("general", f"{tag} {i}", f"{tag} {i}", "neutral") for i in range(rows)]
+    for start in range(0, rows, 1000):
+        await db.executemany(UPSERT, batch[start:start + 1000])
+    for i in range(rows // 10):
+        await db.execute(UPSERT, ("general", f"{tag} {i}", f"{tag} {i}", "neutral"))
+
+async def measure(label: str, writer) -> float:
+    stop = asyncio.Event()
+    lags = []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    start = time.perf_counter()
+    await writer
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    lags.sort()
+    worst = lags[-1] if lags else elapsed * 1000
+    p99 = lags[int(len(lags) * 0.99)] if lags else worst
+    print(f"{label:<6} {elapsed:6.2f}s  beats={len(lags):5d}  p99 lag={p99:7.1f}ms  max lag={worst:7.1f}ms")
+    return worst
+
+async def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    initialize_database()
+    db = AsyncDatabase()
+    await db.connect()
+    try:
+        await measure("sync", sync_writer(rows, "sync"))
+        worst = await measure("async", async_writer(db, rows, "async"))
+    finally:
+        await db.disconnect()
+        
+    if worst > LAG_BUDGET_MS:
+        print(f"FAIL: async max loop lag {worst:.1f}ms exceeds {LAG_BUDGET_MS}ms budget")
+        return 1
+    print(f"OK: async max loop lag within {LAG_BUDGET_MS}ms budget")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
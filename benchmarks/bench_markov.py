@@ -0,0 +1,195 @@
+"""
+MarkovGenerator: memory per chain and reply throughput.
+
+On a scratch database, learns a synthetic chat corpus (Zipf-distributed
+words, two context types) through DialogueTrainer, so word_chains is
+filled by the same write-behind path as live messages. Then loads it and
+compares the compact structure against the obvious nested dicts
+({context: {(word1, word2): {next_word: frequency}}}, sampled with
+random.choices). Reports memory per chain (tracemalloc, word text excluded
+as both share it), load time, and replies and words per second. Checks that:
+  - every chain in a generated reply exists in word_chains for its context
+  - next words are drawn in proportion to their frequency
+  - contexts stay separate
+  - ResponseGenerator's local fallback answers from the chains when no
+    learned line is available
+
+Usage: python benchmarks/bench_markov.py [messages]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.database.async_db import async_db
+from bot.database.connection import db_manager
+from bot.database.models import initialize_database
+from bot.services.dialouge_training import DialogueTrainer
+from bot.services.markov import BOUNDARY, MarkovGenerator, learnable_words, trigrams
+from bot.services.response_gen import ResponseGenerator
+from bot.services.user_cache import user_cache
+
+CONTEXTS = ["general", "practice_encouragement"]
+REPLIES = 20000
+
+class NaiveChains:
+    """Nested dicts of frequencies, sampled with random.choices"""
+
+    def __init__(self, rows):
+        self.table = {}
+        for row in rows:
+            context = self.table.setdefault(row["context_type"], {})
+            context.setdefault((row["word1"], row["word2"]), {})[row["next_word"]] = row["frequency"]
+
+    def generate(self, context_type, rng, max_words=30):
+        chains = self.table[context_type]
+        state = (BOUNDARY, BOUNDARY)
+        walk = []
+        while len(walk) < max_words:
+            options = chains.get(state)
+            if not options:
+                break
+            word = rng.choices(list(options), weights=list(options.values()))[0]
+            if word == BOUNDARY:
+                break
+            walk.append(word)
+            state = (state[1], word)
+        return " ".join(walk)
+
+def make_corpus(count, rng):
+    """(context, message) pairs; each context has its own vocabulary, words follow a Zipf curve"""
+    vocabularies = {context: [f"{context[:2]}{i}" for i in range(3000)] for context in CONTEXTS}
+    # Word rank r is drawn with weight 1/r
+    cumulative = []
+    total = 0.0
+    for rank in range(1, 3001):
+        total += 1 / rank
+        cumulative.append(total)
+    shared = ["i", "you", "the", "a", "to", "and", "is", "it", "that", "we", "so", "lol", "!", "?"]
+    corpus = []
+    for _ in range(count):
+        context = CONTEXTS[0] if rng.random() < 0.75 else CONTEXTS[1]
+        words = []
+        for _ in range(rng.randint(3, 16)):
+            if rng.random() < 0.4:
+                words.append(rng.choice(shared))
+            else:
+                words.append(rng.choices(vocabularies[context], cum_weights=cumulative)[0])
+        corpus.append((context, " ".join(words)))
+    return corpus
+
+def measure(build):
+    """(result, bytes allocated by build that are still alive)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+def throughput(generate, rng):
+    """(replies per second, words per second)"""
+    words = 0
+    start = time.perf_counter()
+    for i in range(REPLIES):
+        words += len(generate(CONTEXTS[i % 2], rng).split())
+    elapsed = time.perf_counter() - start
+    return REPLIES / elapsed, words / elapsed
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    failures = []
+
+    await asyncio.to_thread(initialize_database)
+    await async_db.connect()
+    trainer = DialogueTrainer()
+    try:
+        corpus = make_corpus(count, random.Random(3))
+        start = time.perf_counter()
+        for context, message in corpus:
+            await trainer.add_dialogue_entry(context=context, dialogue=message)
+        await trainer.ingest_buffer.stop()
+        print(f"learned {count} messages in {time.perf_counter() - start:.1f}s "
+              f"({trainer.ingest_buffer.stats()['flushed_chains']} chain upserts)")
+
+        generator = MarkovGenerator(min_words=1)
+        chains = await generator.load()
+        rows = await async_db.fetch_all(MarkovGenerator._LOAD_QUERY)
+        stats = generator.stats()
+        (words, contexts), compact_bytes = measure(lambda: MarkovGenerator._build(rows))
+        naive, naive_bytes = measure(lambda: NaiveChains(rows))
+        print(f"{chains} chains, {stats['words']} words, loaded in {stats['last_load_ms']:.0f} ms")
+        print(f"{'structure':<10} {'bytes/chain':>12} {'total MiB':>10}")
+        print(f"{'compact':<10} {compact_bytes / chains:>12.1f} {compact_bytes / 2 ** 20:>10.1f}"
+              f"   (arrays alone {stats['bytes_per_chain']:.1f})")
+        print(f"{'dicts':<10} {naive_bytes / chains:>12.1f} {naive_bytes / 2 ** 20:>10.1f}")
+        if compact_bytes * 3 > naive_bytes:
+            failures.append(f"compact chains take {compact_bytes / chains:.0f} bytes each, dicts {naive_bytes / chains:.0f}")
+
+        compact_rate, compact_words = throughput(lambda context, rng: generator.generate(context, rng) or "", random.Random(1))
+        naive_rate, naive_words = throughput(naive.generate, random.Random(1))
+        print(f"generation: compact {compact_rate:,.0f} replies/s ({1e6 / compact_rate:.1f} us each, {compact_words:,.0f} words/s), "
+              f"dicts {naive_rate:,.0f} replies/s ({1e6 / naive_rate:.1f} us each)")
+        if 1e6 / compact_rate > 200:
+            failures.append(f"a reply took {1e6 / compact_rate:.0f} us")
+
+        # Every generated chain is a learned one, in its own context
+        known = {context: set() for context in CONTEXTS}
+        for row in rows:
+            known[row["context_type"]].add((row["word1"], row["word2"], row["next_word"]))
+        rng = random.Random(2)
+        invalid = 0
+        for i in range(2000):
+            context = CONTEXTS[i % 2]
+            reply = learnable_words(generator.generate(context, rng), generator.max_words)
+            walked = list(trigrams(reply))
+            if len(reply) == generator.max_words:
+                walked = walked[:-1]  # Cut off before the end of a message
+            invalid += sum(1 for chain in walked if chain not in known[context])
+        print(f"2000 replies checked against word_chains: {invalid} unknown chains")
+        if invalid:
+            failures.append(f"{invalid} generated chains are not in word_chains for their context")
+
+        # Next words follow the frequencies: the message starts
+        starts = {row["next_word"]: row["frequency"] for row in rows
+                  if row["context_type"] == "general" and row["word1"] == BOUNDARY and row["word2"] == BOUNDARY}
+        total = sum(starts.values())
+        top = sorted(starts, key=starts.get, reverse=True)[:5]
+        chains_general = generator._contexts["general"]
+        samples = 100000
+        drawn = dict.fromkeys(top, 0)
+        for _ in range(samples):
+            word = generator.words[chains_general.next_word(0, rng)]
+            if word in drawn:
+                drawn[word] += 1
+        worst = max(abs(drawn[word] / samples - starts[word] / total) / (starts[word] / total) for word in top)
+        print(f"first-word draws for the 5 most common starts: worst relative error {worst:.1%}")
+        if worst > 0.1:
+            failures.append(f"first words drawn off their frequency by {worst:.1%}")
+
+        # The local fallback, with no learned line to use
+        response_gen = ResponseGenerator(markov_generator=generator)
+        reply = await response_gen._local_response("1001")
+        print(f"local fallback reply: {reply[:60]!r}")
+        if reply.startswith("I'm having trouble") or response_gen.local_responses != 1:
+            failures.append("the local fallback did not answer from the word chains")
+    finally:
+        await user_cache.stop()
+        await async_db.disconnect()
+        await asyncio.to_thread(db_manager.close_all)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
@@ -0,0 +1,211 @@
+"""
+RateLimiter: admission for concurrent API calls vs the old
+"time since last call" check.
+
+Runs on the real clock with rates scaled up so each scenario takes about a
+second. Checks that:
+  - concurrent callers never go over the global bucket (the old check lets
+    all of them through at once)
+  - one guild's backlog does not hold up another guild (round robin, where
+    the old behaviour was first come first served)
+  - a guild never goes over its own rate
+  - a mention queued behind ambient replies is served next
+  - a caller cancelled right after its grant (a deadline running out)
+    hands its slot to the next caller instead of wasting it
+  - a 429's Retry-After holds every request for that long; this part runs
+    ResponseGenerator._make_api_call against a local stand-in endpoint
+Prints the limiter's queue and wait metrics for each scenario.
+
+Usage: python benchmarks/bench_rate_limiter.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot.services.rate_limiter import PRIORITY_AMBIENT, PRIORITY_MENTION, RateLimiter
+from bot.services.response_gen import ResponseGenerator
+
+UNLIMITED = 1e6
+
+class LegacyLimiter:
+    """The check ResponseGenerator made before each call"""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.last_call = 0
+
+    async def acquire(self, server_id=None, priority=PRIORITY_AMBIENT):
+        current_time = time.time()
+        if current_time - self.last_call < self.min_interval:
+            await asyncio.sleep(self.min_interval - (current_time - self.last_call))
+        self.last_call = time.time()
+
+class SingleQueue(RateLimiter):
+    """The same global bucket with every call in one first come, first served queue"""
+
+    async def acquire(self, server_id=None, priority=PRIORITY_AMBIENT):
+        return await super().acquire(None, PRIORITY_AMBIENT)
+
+async def grant_log(limiter, requests):
+    """Run (server_id, priority, delay) requests concurrently; returns (grant time, server_id, priority) in grant order"""
+    log = []
+    start = time.monotonic()
+
+    async def request(server_id, priority, delay):
+        await asyncio.sleep(delay)
+        await limiter.acquire(server_id, priority)
+        log.append((time.monotonic() - start, server_id, priority))
+
+    await asyncio.gather(*(request(*args) for args in requests))
+    return log
+
+def max_in_window(times, window):
+    """Most grants within any window of the given length"""
+    best = 0
+    first = 0
+    for last, at in enumerate(times):
+        while at - times[first] > window:
+            first += 1
+        best = max(best, last - first + 1)
+    return best
+
+def show(name, limiter):
+    if isinstance(limiter, RateLimiter):
+        stats = limiter.stats()
+        print(f"  {name}: granted {stats['granted']}, avg wait {stats['avg_wait'] * 1000:.0f} ms, "
+              f"p95 {stats['p95_wait'] * 1000:.0f} ms, max {stats['max_wait'] * 1000:.0f} ms, "
+              f"queued now {stats['queued_mentions'] + stats['queued_ambient']}")
+
+async def check_global_bucket(failures):
+    rate, burst = 40, 4
+    print(f"60 concurrent calls, global limit {rate}/s with bursts of {burst}")
+    for name, limiter in (("legacy", LegacyLimiter(1 / rate)),
+                          ("bucket", RateLimiter(rate, burst, UNLIMITED, UNLIMITED))):
+        log = await grant_log(limiter, [(str(i % 6), PRIORITY_AMBIENT, 0) for i in range(60)])
+        peak = max_in_window([at for at, _, _ in log], 0.1)
+        print(f"  {name}: {peak} calls in the busiest 100 ms (allowed {burst + rate * 0.1:.0f})")
+        show(name, limiter)
+        if name == "bucket" and peak > burst + rate * 0.1 + 1:
+            failures.append(f"{peak} grants within 100 ms, the bucket allows {burst + rate * 0.1:.0f}")
+
+async def check_fairness(failures):
+    print("guild A queues 60 calls, then guild B queues 10 (global 60/s)")
+    for name, limiter in (("one queue", SingleQueue(60, 1, UNLIMITED, UNLIMITED)),
+                          ("per guild", RateLimiter(60, 1, UNLIMITED, UNLIMITED))):
+        requests = [("A", PRIORITY_AMBIENT, 0)] * 60 + [("B", PRIORITY_AMBIENT, 0.005)] * 10
+        log = await grant_log(limiter, requests)
+        b_done = max(i for i, (_, guild, _) in enumerate(log) if guild == "B") + 1
+        b_time = max(at for at, guild, _ in log if guild == "B")
+        print(f"  {name}: B's last call was grant {b_done} of 70, at {b_time * 1000:.0f} ms")
+        show(name, limiter)
+        if name == "per guild" and b_done > 25:
+            failures.append(f"guild B finished at grant {b_done} of 70 behind guild A's backlog")
+
+async def check_guild_rate(failures):
+    guild_rate = 20
+    limiter = RateLimiter(UNLIMITED, UNLIMITED, guild_rate, 2)
+    print(f"guilds A and B queue 30 calls each, limit {guild_rate}/s per guild")
+    log = await grant_log(limiter, [(guild, PRIORITY_AMBIENT, 0) for guild in "AB" for _ in range(30)])
+    for guild in "AB":
+        times = [at for at, server, _ in log if server == guild]
+        achieved = (len(times) - 2) / (times[-1] - times[0])
+        print(f"  {guild}: {achieved:.1f} calls/s after its burst")
+        if achieved > guild_rate * 1.1:
+            failures.append(f"guild {guild} ran at {achieved:.1f}/s, over its {guild_rate}/s")
+    show("bucket", limiter)
+
+async def check_priority(failures):
+    limiter = RateLimiter(50, 1, UNLIMITED, UNLIMITED)
+    print("40 ambient calls from two guilds queued, then a mention from a third")
+    requests = [(guild, PRIORITY_AMBIENT, 0) for guild in "AB" for _ in range(20)] + [("C", PRIORITY_MENTION, 0.05)]
+    log = await grant_log(limiter, requests)
+    position = next(i for i, (_, _, priority) in enumerate(log) if priority == PRIORITY_MENTION)
+    print(f"  mention served as grant {position + 1}, ahead of {len(log) - position - 1} ambient calls queued before it")
+    show("bucket", limiter)
+    granted_before = sum(1 for at, _, _ in log if at <= 0.05)
+    if position > granted_before + 1:
+        failures.append(f"mention waited behind {position - granted_before} ambient calls queued before it")
+
+async def check_cancelled_grant(failures):
+    rate = 4
+    limiter = RateLimiter(rate, 1, UNLIMITED, 1)
+    print(f"a caller cancelled right after its grant, then another call (global {rate}/s, no burst)")
+    await limiter.acquire("A")
+    cancelled = asyncio.ensure_future(limiter.acquire("A"))
+    await asyncio.sleep(0)
+    # The grant and the cancellation land in the same loop iteration
+    time.sleep(1 / rate)
+    limiter._pump()
+    cancelled.cancel()
+    await asyncio.gather(cancelled, return_exceptions=True)
+    waited = await limiter.acquire("A")
+    print(f"  next call waited {waited * 1000:.0f} ms (a wasted slot would cost {1000 / rate:.0f} ms)")
+    if waited > 0.25 / rate:
+        failures.append(f"the next call waited {waited * 1000:.0f} ms: the cancelled caller's slot was lost")
+
+async def check_retry_after(failures):
+    retry_after = 0.5
+    calls = []
+
+    async def handle(request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return web.Response(status=429, headers={"Retry-After": str(retry_after)}, text="slow down")
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b'data: {"choices": [{"delta": {"content": "ok"}}]}\n\ndata: [DONE]\n\n')
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    limiter = RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED, UNLIMITED)
+    generator = ResponseGenerator(rate_limiter=limiter)
+    generator.api_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1/chat/completions"
+    await generator.start()
+    try:
+        print(f"first API call answered 429 with Retry-After: {retry_after}")
+
+        async def other_guild():
+            # Arrives while the pause is in effect
+            await asyncio.sleep(0.1)
+            return await generator._make_api_call([{"role": "user", "content": "hi"}], server_id="B")
+
+        replies = await asyncio.gather(
+            generator._make_api_call([{"role": "user", "content": "hi"}], server_id="A"), other_guild()
+        )
+    finally:
+        await generator.stop()
+        await runner.cleanup()
+
+    gaps = [at - calls[0] for at in calls[1:]]
+    print(f"  next calls went out after {', '.join(f'{gap * 1000:.0f}' for gap in gaps)} ms, replies {replies}")
+    show("bucket", limiter)
+    if replies != ["ok", "ok"]:
+        failures.append("calls did not succeed after the 429")
+    if len(gaps) != 2 or min(gaps) < retry_after * 0.95:
+        failures.append(f"calls went out {gaps} s after a Retry-After of {retry_after}s")
+    if limiter.retry_after_pauses != 1:
+        failures.append(f"expected one Retry-After pause, limiter recorded {limiter.retry_after_pauses}")
+
+async def main():
+    failures = []
+    for check in (check_global_bucket, check_fairness, check_guild_rate, check_priority, check_cancelled_grant,
+                  check_retry_after):
+        await check(failures)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
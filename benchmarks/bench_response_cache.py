@@ -0,0 +1,204 @@
+"""
+ResponseCache in front of the completions API: hit ratio and API calls
+avoided on chat-like traffic.
+
+On a scratch database, with a local stand-in completions endpoint that
+counts its calls, replays a stream of messages. Most of them are greetings,
+"how are you" and pings to the bot, written many ways; the rest are one-off
+messages. The stream comes from a few users (with different reputation, so
+different personas) in two guilds, one of which has opted out. Reports hit
+ratio, hits per tier and API calls avoided. Checks that:
+  - the opted-out guild calls the API for every message
+  - the memory tier never reuses a reply across personas
+  - after a restart (empty memory tier) popular messages are answered from
+    response_patterns
+  - once the TTL passes, a reply is generated again and the stored one
+    replaced
+
+Usage: python benchmarks/bench_response_cache.py [messages]
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.database.async_db import async_db
+from bot.database.connection import db_manager
+from bot.database.models import initialize_database
+from bot.services.rate_limiter import RateLimiter
+from bot.services.response_cache import ResponseCache
+from bot.services.response_gen import ResponseGenerator
+from bot.services.settings_cache import settings_cache
+from bot.services.user_cache import user_cache
+
+UNLIMITED = 1e6
+OPTED_OUT = "2002"
+GUILDS = ["1001", OPTED_OUT]
+USERS = [1, 2, 3]
+
+COMMON = [
+    ["hi", "Hi!", "hi!!", "HI", "hi :)"],
+    ["hello", "Hello!", "hello."],
+    ["how are you", "How are you?", "how are you??", "how are you doing"],
+    ["chinatsu", "Chinatsu!", "chinatsu?", "@chinatsu"],
+    ["good morning", "Good morning!", "gm"],
+    ["thanks", "thank you", "Thanks!"],
+    ["good night", "gn", "Good night!"],
+    ["what are you doing", "What are you doing?"],
+]
+
+class StandIn:
+    """Streams "reply <n> to <message>" and counts calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def handle(self, request):
+        body = await request.json()
+        self.calls += 1
+        content = f"reply {self.calls} to {body['messages'][-1]['content']}"
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        event = {"choices": [{"delta": {"content": content}}]}
+        await response.write(f"data: {json.dumps(event)}\n\ndata: [DONE]\n\n".encode())
+        return response
+
+def make_traffic(count, rng):
+    traffic = []
+    for i in range(count):
+        if rng.random() < 0.7:
+            # Popular intents follow a rough Zipf curve
+            group = COMMON[min(int(rng.paretovariate(1.2)) - 1, len(COMMON) - 1)]
+            text = rng.choice(group)
+        else:
+            text = f"can you tell me about thing number {i}"
+        traffic.append((text, rng.choice(USERS), rng.choice(GUILDS)))
+    return traffic
+
+async def replay(generator, stand_in, traffic):
+    """Per-guild [messages, API calls]; replies by normalized message and persona"""
+    per_guild = {guild: [0, 0] for guild in GUILDS}
+    replies = {}
+    for text, user_id, guild in traffic:
+        calls = stand_in.calls
+        reply, _ = await generator.generate_response(text, user_id, guild)
+        per_guild[guild][0] += 1
+        per_guild[guild][1] += stand_in.calls - calls
+        persona = generator._persona(await user_cache.get_user(user_id), await settings_cache.get_filter_settings(guild))
+        replies.setdefault(generator.response_cache.normalize(text), {}).setdefault(persona, set()).add(reply)
+    return per_guild, replies
+
+def shared_across_personas(replies):
+    """Messages one of whose replies went to more than one persona"""
+    shared = []
+    for normalized, by_persona in replies.items():
+        sets = list(by_persona.values())
+        if any(a & b for i, a in enumerate(sets) for b in sets[i + 1:]):
+            shared.append(normalized)
+    return shared
+
+def report(name, cache, per_guild):
+    stats = cache.stats()
+    messages = sum(count for count, _ in per_guild.values())
+    calls = sum(api for _, api in per_guild.values())
+    print(f"{name}: {messages} messages, {calls} API calls, hit ratio {stats['hit_ratio']:.1%} "
+          f"({stats['memory_hits']} memory, {stats['db_hits']} database, {stats['misses']} misses), "
+          f"{stats['api_calls_avoided']} API calls avoided")
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    traffic = make_traffic(count, random.Random(7))
+    stand_in = StandIn()
+    failures = []
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stand_in.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    api_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1/chat/completions"
+
+    def make_generator(cache):
+        generator = ResponseGenerator(rate_limiter=RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED, UNLIMITED),
+                                      response_cache=cache)
+        generator.api_url = api_url
+        return generator
+
+    await asyncio.to_thread(initialize_database)
+    await async_db.connect()
+    generators = []
+    try:
+        await async_db.execute("INSERT INTO filter_settings (server_id, response_cache) VALUES (?, 0)", (OPTED_OUT,))
+        # A friendly regular gets a different system prompt, so a persona of their own
+        await user_cache.adjust_reputation(2, 80)
+
+        # Memory tier alone (no stored reply qualifies): personas never share a reply
+        generators.append(make_generator(ResponseCache(min_success_rate=2.0)))
+        per_guild, replies = await replay(generators[-1], stand_in, traffic[:count // 4])
+        report("memory tier only", generators[-1].response_cache, per_guild)
+        shared = shared_across_personas(replies)
+        if shared:
+            failures.append(f"memory tier served one reply to two personas for {shared[:3]}")
+
+        generators.append(make_generator(ResponseCache()))
+        per_guild, replies = await replay(generators[-1], stand_in, traffic)
+        report("both tiers", generators[-1].response_cache, per_guild)
+        if per_guild[OPTED_OUT][0] != per_guild[OPTED_OUT][1]:
+            failures.append(f"opted-out guild made {per_guild[OPTED_OUT][1]} API calls for {per_guild[OPTED_OUT][0]} messages")
+
+        # Replies that got a good reaction count as reused (what analyze_interaction records)
+        await async_db.executemany(
+            """
+            UPDATE response_patterns
+            SET success_rate = (success_rate * usage_count + 1.0) / (usage_count + 1),
+                usage_count = usage_count + 1
+            WHERE input_pattern = ?
+            """,
+            [(text,) for group in COMMON for text in group]
+        )
+
+        # Restart: the memory tier starts empty, response_patterns does not
+        generators.append(make_generator(ResponseCache()))
+        per_guild, _ = await replay(generators[-1], stand_in, traffic[:count // 2])
+        report("after restart", generators[-1].response_cache, per_guild)
+        if not generators[-1].response_cache.db_hits:
+            failures.append("nothing was answered from response_patterns after the restart")
+
+        # TTL: a reply older than the TTL is generated again and replaces the stored one
+        cache = ResponseCache(ttl=1)
+        generators.append(make_generator(cache))
+        first, _ = await generators[-1].generate_response("hey there", 1, GUILDS[0])
+        again, _ = await generators[-1].generate_response("hey there", 1, GUILDS[0])
+        await asyncio.sleep(1.5)
+        fresh, _ = await generators[-1].generate_response("hey there", 1, GUILDS[0])
+        stored = await async_db.fetch_one(
+            "SELECT response_template FROM response_patterns WHERE input_pattern = ?", ("hey there",)
+        )
+        print(f"TTL 1s: {first!r}, then {again!r}, after 1.5s {fresh!r}")
+        if again != first or fresh == first or stored["response_template"] != fresh:
+            failures.append("reply was not reused within the TTL, or not replaced after it")
+    finally:
+        for generator in generators:
+            await generator.stop()
+        await user_cache.stop()
+        await async_db.disconnect()
+        await asyncio.to_thread(db_manager.close_all)
+        await runner.cleanup()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
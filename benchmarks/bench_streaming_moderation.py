@@ -0,0 +1,166 @@
+"""
+Streamed completions moderated as they arrive vs the old generate, filter,
+then generate again flow.
+
+Serves a mock chat completions API on localhost that sends its reply one
+token at a time. Unless the request carries the "previous response was
+flagged" system message, the reply to BAD_PROMPT goes wrong a few tokens in
+and then runs on for a long tail. Checks that
+ResponseGenerator.generate_response cuts that stream off early, regenerates,
+and returns the clean second reply; that a clean reply comes back unchanged;
+and reports wall time and upstream tokens against the old flow, which waits
+for the whole flagged reply before asking again.
+
+Usage: python benchmarks/bench_streaming_moderation.py [tail_tokens] [token_delay_ms]
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientSession, web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.database.async_db import async_db
+from bot.database.connection import db_manager
+from bot.database.models import initialize_database
+from bot.services.content_filter import content_filter
+from bot.services.rate_limiter import RateLimiter
+from bot.services.response_gen import ResponseGenerator
+
+BAD_PROMPT = "how do i get into my neighbour's network"
+CLEAN_PROMPT = "what should i name my cat"
+FLAGGED_NOTICE = "Your previous response was flagged"
+
+class MockCompletions:
+    """Chat completions endpoint that streams (or returns) canned replies token by token"""
+
+    def __init__(self, tail_tokens, token_delay):
+        self.token_delay = token_delay
+        filler = " ".join(f"step {i} is to keep going and read the next part." for i in range(tail_tokens // 11 + 1))
+        self.replies = {
+            "bad": "Sure, here is how to hack the wifi of your neighbour. " + filler,
+            "safe": "I can't help with getting into someone else's network, but I can help you secure your own. " + filler,
+            "clean": "How about Mochi? It is short, sweet and easy to call across the room. " + filler,
+        }
+        self.requests = 0
+        self.tokens_sent = 0
+
+    def reply_for(self, messages):
+        if any(FLAGGED_NOTICE in message["content"] for message in messages if message["role"] == "system"):
+            return self.replies["safe"]
+        return self.replies["bad"] if messages[-1]["content"] == BAD_PROMPT else self.replies["clean"]
+
+    async def handle(self, request):
+        body = await request.json()
+        self.requests += 1
+        tokens = [token + " " for token in self.reply_for(body["messages"]).split(" ")]
+
+        if not body.get("stream"):
+            await asyncio.sleep(self.token_delay * len(tokens))
+            self.tokens_sent += len(tokens)
+            return web.json_response({"choices": [{"message": {"role": "assistant", "content": "".join(tokens)}}]})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            for token in tokens:
+                await asyncio.sleep(self.token_delay)
+                event = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                await response.write(f"data: {json.dumps(event)}\n\n".encode())
+                self.tokens_sent += 1
+            await response.write(b"data: [DONE]\n\n")
+        except (ConnectionResetError, asyncio.CancelledError):
+            # The client hung up: stop generating
+            pass
+        return response
+
+async def legacy_generate(generator, messages, server_id):
+    """The old flow: full completion, filter it, ask again if flagged"""
+    async def complete(messages):
+        async with ClientSession() as session:
+            async with session.post(generator.api_url, json={"messages": messages}) as response:
+                return (await response.json())["choices"][0]["message"]["content"]
+
+    response = await complete(messages)
+    if (await content_filter.filter_message(response, server_id))["is_filtered"]:
+        response = await complete(messages + [{"role": "system", "content": FLAGGED_NOTICE + " as inappropriate."}])
+    return response
+
+async def measure(mock, call):
+    mock.tokens_sent = 0
+    mock.requests = 0
+    start = time.perf_counter()
+    result = await call()
+    # Let the server notice a dropped connection before counting its tokens
+    await asyncio.sleep(mock.token_delay * 5)
+    return result, time.perf_counter() - start, mock.tokens_sent, mock.requests
+
+async def main():
+    tail_tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    token_delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 5) / 1000
+    mock = MockCompletions(tail_tokens, token_delay)
+    failures = []
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", mock.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    await asyncio.to_thread(initialize_database)
+    await async_db.connect()
+    generator = ResponseGenerator(rate_limiter=RateLimiter(rate=1e6, burst=1e6, guild_rate=1e6, guild_burst=1e6))
+    generator.api_url = f"http://127.0.0.1:{port}/v1/chat/completions"
+    await generator.start()
+    try:
+
+        (reply, _), streamed_time, streamed_tokens, streamed_requests = await measure(
+            mock, lambda: generator.generate_response(BAD_PROMPT, 1)
+        )
+        if reply != mock.replies["safe"] + " ":
+            failures.append(f"flagged generation was not replaced by the safe one: {reply[:60]!r}")
+        if generator.streams_aborted != 1 or generator.regenerations != 1:
+            failures.append(f"expected one aborted stream and one regeneration, got {generator.stats()}")
+        bad_tokens = len(mock.replies["bad"].split(" "))
+        safe_tokens = len(mock.replies["safe"].split(" "))
+        if streamed_tokens - safe_tokens > bad_tokens // 4:
+            failures.append(f"flagged stream ran {streamed_tokens - safe_tokens} of {bad_tokens} tokens before the abort")
+
+        legacy_reply, legacy_time, legacy_tokens, legacy_requests = await measure(
+            mock, lambda: legacy_generate(generator, [{"role": "user", "content": BAD_PROMPT}], None)
+        )
+        if legacy_reply != reply:
+            failures.append("old flow ends on a different reply")
+
+        (clean, _), _, _, _ = await measure(mock, lambda: generator.generate_response(CLEAN_PROMPT, 1))
+        if clean != mock.replies["clean"] + " " or generator.streams_aborted != 1:
+            failures.append(f"clean reply was altered or aborted: {clean[:60]!r}")
+
+        print(f"flagged reply of {bad_tokens} tokens, {token_delay * 1000:.0f} ms/token")
+        print(f"{'flow':<24} {'wall ms':>9} {'upstream tokens':>16} {'requests':>9}")
+        print(f"{'streamed + incremental':<24} {streamed_time * 1000:>9.0f} {streamed_tokens:>16} {streamed_requests:>9}")
+        print(f"{'generate, filter, retry':<24} {legacy_time * 1000:>9.0f} {legacy_tokens:>16} {legacy_requests:>9}")
+        print(f"time saved {1 - streamed_time / legacy_time:.0%}, "
+              f"upstream tokens saved {1 - streamed_tokens / legacy_tokens:.0%}")
+    finally:
+        await generator.stop()
+        await async_db.disconnect()
+        await asyncio.to_thread(db_manager.close_all)
+        await runner.cleanup()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
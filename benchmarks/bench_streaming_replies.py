@@ -0,0 +1,225 @@
+"""
+Streaming replies to Discord: time to first visible text.
+
+On a scratch database, with a local stand-in completions endpoint that
+streams a few sentences a token at a time, answers a mention the old way
+(generate the whole reply, then send it) and through StreamingReply, into a
+stand-in channel that records every send, edit and delete. Reports time to
+first visible text for both. Checks that:
+  - the first message goes out once the first sentence is in, well before
+    the generation ends, and ends up holding the whole reply
+  - sends and edits keep to Discord's 5 per 5 seconds, edit_interval apart
+  - a reply over 2000 characters continues in follow-up messages, each
+    within the limit, that add up to the whole reply (fed to StreamingReply
+    directly: the content filter stops generations past that length)
+  - a flagged generation never shows its flagged text; the message ends
+    up holding the regenerated reply
+  - a caller sharing another's in-flight generation shows it early too
+
+Usage: python benchmarks/bench_streaming_replies.py [token delay ms]
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# DB_PATH is resolved from the working directory at import time
+os.chdir(tempfile.mkdtemp(prefix="chinatsu-bench-"))
+
+from bot.config import STREAMING_REPLY_SETTINGS
+from bot.database.async_db import async_db
+from bot.database.connection import db_manager
+from bot.database.models import initialize_database
+from bot.services.content_filter import content_filter
+from bot.services.rate_limiter import RateLimiter
+from bot.services.response_cache import ResponseCache
+from bot.services.response_gen import ResponseGenerator
+from bot.services.settings_cache import settings_cache
+from bot.services.streaming_reply import StreamingReply
+from bot.services.user_cache import user_cache
+
+UNLIMITED = 1e6
+GUILD = "1001"
+BAD = "what happens in the heist movie"
+FLAGGED_NOTICE = "Your previous response was flagged"
+
+REPLY = ("Oh, I love that question! The short answer is that it depends on the weather. "
+         "When it rains, most people stay in and read, or they bake something warm. "
+         "On sunny days the park fills up with picnics and kids on bikes. "
+         "Either way, it is a good excuse to call a friend and make plans together.")
+LONG_REPLY = " ".join(f"Tea fact number {i} is that leaves from the same plant make green, black and oolong tea."
+                      for i in range(60))
+BAD_REPLY = "Sure, that sounds fun. First you hack the login page and then you keep going with the rest of the steps."
+SAFE_REPLY = "I'd rather not help with that. Happy to talk about the movie itself though!"
+
+class StandIn:
+    """Streams a canned reply a word at a time"""
+
+    def __init__(self, token_delay):
+        self.token_delay = token_delay
+
+    async def handle(self, request):
+        messages = (await request.json())["messages"]
+        if any(FLAGGED_NOTICE in message["content"] for message in messages if message["role"] == "system"):
+            reply = SAFE_REPLY
+        elif messages[-1]["content"] == BAD:
+            reply = BAD_REPLY
+        else:
+            reply = REPLY
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            for token in reply.split(" "):
+                await asyncio.sleep(self.token_delay)
+                event = {"choices": [{"delta": {"content": token + " "}}]}
+                await response.write(f"data: {json.dumps(event)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return response
+
+class Channel:
+    """Records sends, edits and deletes with their time"""
+
+    def __init__(self):
+        self.log = []
+
+    async def send(self, content):
+        message = Message(self, content)
+        self.log.append((time.monotonic(), "send", content))
+        return message
+
+class Message:
+    def __init__(self, channel, content):
+        self.channel = channel
+        self.content = content
+        self.deleted = False
+
+    async def edit(self, content):
+        self.content = content
+        self.channel.log.append((time.monotonic(), "edit", content))
+
+    async def delete(self):
+        self.deleted = True
+        self.channel.log.append((time.monotonic(), "delete", None))
+
+def max_in_window(times, window):
+    """Most operations within any window of the given length"""
+    best = 0
+    first = 0
+    for last, at in enumerate(times):
+        while at - times[first] > window:
+            first += 1
+        best = max(best, last - first + 1)
+    return best
+
+def check_pacing(name, channel, failures):
+    times = [at for at, _, _ in channel.log]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    if max_in_window(times, 5.0) > 5:
+        failures.append(f"{name}: {max_in_window(times, 5.0)} sends/edits within 5 seconds")
+    if gaps and min(gaps) < STREAMING_REPLY_SETTINGS["edit_interval"] * 0.95:
+        failures.append(f"{name}: sends/edits {min(gaps) * 1000:.0f} ms apart")
+
+async def streamed(generator, message, user_id):
+    """(reply text, StreamingReply, channel, seconds to the end of the generation)"""
+    channel = Channel()
+    reply = StreamingReply(channel.send)
+    start = time.monotonic()
+    response, _ = await generator.generate_response(message, user_id, GUILD, mentioned=True, reply=reply)
+    generated = time.monotonic() - start
+    await reply.finish(response)
+    return response, reply, channel, generated
+
+async def main():
+    token_delay = (float(sys.argv[1]) if len(sys.argv) > 1 else 40) / 1000
+    stand_in = StandIn(token_delay)
+    failures = []
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", stand_in.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    await asyncio.to_thread(initialize_database)
+    await async_db.connect()
+    generator = ResponseGenerator(rate_limiter=RateLimiter(UNLIMITED, UNLIMITED, UNLIMITED, UNLIMITED),
+                                  response_cache=ResponseCache(max_message_length=0))
+    generator.api_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1/chat/completions"
+    await generator.start()
+    try:
+        # The old way: the whole reply, then one send
+        channel = Channel()
+        start = time.monotonic()
+        response, _ = await generator.generate_response("what do people do on weekends", 1, GUILD, mentioned=True)
+        await channel.send(response)
+        whole = channel.log[0][0] - start
+        print(f"{len(response.split())} words at {token_delay * 1000:.0f} ms each")
+        print(f"  generate, then send: first visible after {whole * 1000:.0f} ms")
+
+        response, reply, channel, generated = await streamed(generator, "what do people do on weekends", 2)
+        print(f"  streaming reply: first visible after {reply.first_shown * 1000:.0f} ms "
+              f"({reply.posts} send, {reply.edits} edits, generation took {generated * 1000:.0f} ms)")
+        if reply.first_shown > generated / 2:
+            failures.append(f"first text showed after {reply.first_shown * 1000:.0f} ms of a {generated * 1000:.0f} ms generation")
+        if [message.content for message in reply.messages] != [response.strip()]:
+            failures.append("the streamed message does not hold the whole reply")
+        check_pacing("streaming reply", channel, failures)
+
+        # Over the message limit: follow-up messages
+        channel = Channel()
+        reply = StreamingReply(channel.send)
+        words = LONG_REPLY.split(" ")
+        for i in range(0, len(words), 4):
+            await asyncio.sleep(token_delay / 4)
+            reply.feed(" ".join(words[i:i + 4]) + " ")
+        response = LONG_REPLY
+        await reply.finish(response)
+        contents = [message.content for message in reply.messages]
+        print(f"{len(response)} character reply: {len(contents)} messages of {[len(c) for c in contents]} characters, "
+              f"{reply.edits} edits, first visible after {reply.first_shown * 1000:.0f} ms")
+        if len(contents) < 2 or max(map(len, contents)) > 2000 or " ".join(contents).split() != response.split():
+            failures.append("a long reply was not split into follow-up messages adding up to it")
+        check_pacing("long reply", channel, failures)
+
+        # A flagged generation: only the part the filter passes is shown
+        server_settings = await settings_cache.get_filter_settings(GUILD)
+        response, reply, channel, _ = await streamed(generator, BAD, 4)
+        shown = [content for _, action, content in channel.log if content is not None]
+        leaked = [content for content in shown if content_filter.scan(content, server_settings)["is_filtered"]]
+        print(f"flagged generation: showed {shown[:-1]}, then {shown[-1]!r}")
+        if leaked:
+            failures.append(f"flagged text was shown: {leaked}")
+        if [message.content for message in reply.messages] != [response.strip()] or not response.startswith("I'd rather not"):
+            failures.append(f"the message does not hold the regenerated reply: {[m.content for m in reply.messages]}")
+        check_pacing("flagged generation", channel, failures)
+
+        # Two mentions sharing one generation: both show it early
+        results = await asyncio.gather(*(streamed(generator, "what are your weekend plans", 10 + i) for i in range(2)))
+        firsts = [reply.first_shown for _, reply, _, _ in results]
+        print(f"two callers sharing a generation: first visible after {', '.join(f'{f * 1000:.0f}' for f in firsts)} ms")
+        for response, reply, _, generated in results:
+            if reply.first_shown > generated / 2 or [message.content for message in reply.messages] != [response.strip()]:
+                failures.append("a caller sharing a generation did not stream it")
+    finally:
+        await generator.stop()
+        await user_cache.stop()
+        await async_db.disconnect()
+        await asyncio.to_thread(db_manager.close_all)
+        await runner.cleanup()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
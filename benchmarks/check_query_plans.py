@@ -0,0 +1,90 @@
+"""
+Schema migration and query-plan check.
+
+Migrates a fresh database and both legacy response_patterns shapes, then runs
+EXPLAIN QUERY PLAN over migrations.QUERY_CATALOG. Exits non-zero if any hot
+query regresses to a full table scan or temp b-tree sort, or if an upgraded
+database cannot run the ON CONFLICT(input_pattern) upsert.
+
+Usage: python benchmarks/check_query_plans.py
+"""
+import os
+import sys
+import sqlite3
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot.database.migrations import MIGRATIONS, QUERY_CATALOG, migrate, explain_problems
+
+LEGACY_PK_SHAPE = """
+    CREATE TABLE response_patterns (
+        input_pattern TEXT PRIMARY KEY,
+        response_template TEXT,
+        success_rate REAL DEFAULT 0.0,
+        usage_count INTEGER DEFAULT 0,
+        last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+LEGACY_ID_SHAPE = """
+    CREATE TABLE response_patterns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        input_pattern TEXT,
+        response_template TEXT,
+        success_rate REAL DEFAULT 0.0,
+        usage_count INTEGER DEFAULT 0,
+        last_used DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_patterns ON response_patterns(input_pattern);
+    INSERT INTO response_patterns (input_pattern, response_template, success_rate, usage_count)
+    VALUES ('hi', 'hello', 1.0, 3), ('hi', 'hey', 0.0, 1), ('bye', 'see you', 1.0, 1);
+"""
+
+def check(label: str, conn: sqlite3.Connection) -> list:
+    failures = []
+    version = migrate(conn)
+    if version != MIGRATIONS[-1][0]:
+        failures.append(f"schema version {version}, expected {MIGRATIONS[-1][0]}")
+    if migrate(conn) != version:
+        failures.append("second migrate() run changed the schema version")
+        
+    for name, detail in explain_problems(conn):
+        failures.append(f"{name}: {detail}")
+        
+    # Every catalog query must also execute against the migrated schema
+    for name, query, params in QUERY_CATALOG:
+        try:
+            conn.execute(query, params)
+        except sqlite3.Error as e:
+            failures.append(f"{name}: {e}")
+    conn.rollback()
+    
+    status = "ok" if not failures else "FAIL"
+    print(f"{label:<22} v{version}  {status}")
+    for failure in failures:
+        print(f"    {failure}")
+    return failures
+
+def main():
+    failures = []
+    failures += check("fresh", sqlite3.connect(":memory:"))
+    
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(LEGACY_PK_SHAPE)
+    failures += check("legacy pk shape", conn)
+    
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(LEGACY_ID_SHAPE)
+    failures += check("legacy id shape", conn)
+    merged = conn.execute(
+        "SELECT usage_count, success_rate FROM response_patterns WHERE input_pattern = 'hi'"
+    ).fetchall()
+    if merged != [(4, 0.75)]:
+        failures.append(f"duplicate merge produced {merged}")
+        print(f"    duplicate merge produced {merged}")
+        
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
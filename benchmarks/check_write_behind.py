@@ -0,0 +1,82 @@
+"""
+Write-behind shutdown check.
+
+Runs UserCache and DialogueIngestBuffer against a stand-in database whose
+writes are held until released, and calls stop() while the periodic flush
+is waiting on one. Exits non-zero unless every queued change is written
+exactly once by the time stop() returns.
+
+Usage: python benchmarks/check_write_behind.py
+"""
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot.services.dialogue_buffer import DialogueIngestBuffer
+from bot.services.user_cache import UserCache
+
+class HeldWrites:
+    """Records executemany calls; each one waits until release() (a write queued behind others)"""
+
+    def __init__(self):
+        self.written = []
+        self.started = asyncio.Event()
+        self._released = asyncio.Event()
+
+    def release(self):
+        self._released.set()
+
+    async def executemany(self, query, rows):
+        self.started.set()
+        await self._released.wait()
+        self.written.extend((query, row) for row in rows)
+        return len(rows)
+
+async def check_user_cache(failures):
+    db = HeldWrites()
+    cache = UserCache(db=db, flush_interval=0.01)
+    cache.start()
+    for user_id in range(10):
+        cache.record_interaction(user_id, 0.5)
+    await db.started.wait()
+    cache.record_interaction(3, 0.5)
+    # The held write lands while stop() is shutting down
+    asyncio.get_running_loop().call_later(0.05, db.release)
+    await cache.stop()
+    interactions = sum(row[2] for _, row in db.written)
+    print(f"user cache: stop() during a flush wrote {interactions} of 11 interactions "
+          f"in {len(db.written)} rows, {len(cache._deltas) + len(cache._flushing)} users left queued")
+    if interactions != 11 or cache._deltas or cache._flushing:
+        failures.append(f"user cache wrote {interactions} of 11 interactions across stop()")
+
+async def check_ingest_buffer(failures):
+    db = HeldWrites()
+    buffer = DialogueIngestBuffer(db=db, flush_interval=0.01)
+    buffer.start()
+    for i in range(10):
+        buffer.add("general", f"hello {i % 4}", "hi there")
+        buffer.add_chains("general", [("", "", "hello"), ("", "hello", str(i % 4))])
+    await db.started.wait()
+    buffer.add("general", "hello 0", "hi there")
+    asyncio.get_running_loop().call_later(0.05, db.release)
+    await buffer.stop()
+    uses = sum(row[-1] for query, row in db.written if query == buffer._FLUSH_QUERY)
+    chains = sum(row[-1] for query, row in db.written if query == buffer._CHAIN_FLUSH_QUERY)
+    print(f"ingest buffer: stop() during a flush wrote {uses} of 11 pattern uses and {chains} of 20 chain uses, "
+          f"{buffer.queue_depth + len(buffer._chains)} entries left queued")
+    if uses != 11 or chains != 20 or buffer.queue_depth or buffer._chains:
+        failures.append(f"ingest buffer wrote {uses} of 11 pattern uses and {chains} of 20 chain uses across stop()")
+
+async def main():
+    failures = []
+    await check_user_cache(failures)
+    await check_ingest_buffer(failures)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
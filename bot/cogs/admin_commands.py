@@ -2,8 +2,11 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from typing import Optional
-from ..database.models import ServerSettings, UserRelations
-from ..config import OWNER_ID
+from ..database.async_db import async_db
+from ..services.guild_rules import guild_rules
+from ..services.settings_cache import settings_cache
+from ..services.user_cache import user_cache
+from ..config import GUILD_RULES_SETTINGS, OWNER_ID
 
 class AdminCommands(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -26,10 +29,12 @@ class AdminCommands(commands.Cog):
             return
             
         try:
-            ServerSettings.execute_query(
-                "INSERT OR REPLACE INTO server_activation (server_id, active) VALUES (?, 1)",
-                (str(interaction.guild_id),)
+            await async_db.upsert(
+                "server_activation",
+                {"server_id": str(interaction.guild_id), "active": 1},
+                conflict_columns=("server_id",)
             )
+            settings_cache.set_server_active(interaction.guild_id, True)
             await interaction.response.send_message("✅ Bot activated for this server!", ephemeral=True)
         except Exception as e:
             await interaction.response.send_message("❌ Failed to activate bot. Please try again.", ephemeral=True)
@@ -42,10 +47,12 @@ class AdminCommands(commands.Cog):
             return
             
         try:
-            ServerSettings.execute_query(
-                "INSERT OR REPLACE INTO server_activation (server_id, active) VALUES (?, 0)",
-                (str(interaction.guild_id),)
+            await async_db.upsert(
+                "server_activation",
+                {"server_id": str(interaction.guild_id), "active": 0},
+                conflict_columns=("server_id",)
             )
+            settings_cache.set_server_active(interaction.guild_id, False)
             await interaction.response.send_message("✅ Bot deactivated for this server!", ephemeral=True)
         except Exception as e:
             await interaction.response.send_message("❌ Failed to deactivate bot. Please try again.", ephemeral=True)
@@ -74,7 +81,7 @@ class AdminCommands(commands.Cog):
         filter_enabled = 1 if action == "enable" else 0
         
         try:
-            ServerSettings.execute_query(
+            await async_db.execute(
                 """
                 INSERT INTO filter_settings (server_id, filter_enabled)
                 VALUES (?, ?)
@@ -84,6 +91,7 @@ class AdminCommands(commands.Cog):
                 """,
                 (target_guild, filter_enabled)
             )
+            settings_cache.invalidate_filter_settings(target_guild)
             
             status = "enabled" if filter_enabled else "disabled"
             await interaction.response.send_message(
@@ -93,6 +101,50 @@ class AdminCommands(commands.Cog):
         except Exception as e:
             await interaction.response.send_message("❌ Failed to update filter settings. Please try again.", ephemeral=True)
             
+    @app_commands.command(name="response_cache")
+    @app_commands.describe(
+        action="Action to perform",
+        guild_id="Server ID to apply the setting to (optional, defaults to current server)"
+    )
+    @app_commands.choices(action=[
+        app_commands.Choice(name="enable", value="enable"),
+        app_commands.Choice(name="disable", value="disable")
+    ])
+    async def manage_response_cache(
+        self,
+        interaction: discord.Interaction,
+        action: str,
+        guild_id: Optional[str] = None
+    ):
+        """Allow or stop reusing cached replies instead of generating each one"""
+        if not self._check_admin(interaction):
+            await interaction.response.send_message("❌ You need administrator permissions for this command.", ephemeral=True)
+            return
+            
+        target_guild = guild_id or str(interaction.guild_id)
+        response_cache = 1 if action == "enable" else 0
+        
+        try:
+            await async_db.execute(
+                """
+                INSERT INTO filter_settings (server_id, response_cache)
+                VALUES (?, ?)
+                ON CONFLICT(server_id) DO UPDATE SET
+                    response_cache = excluded.response_cache,
+                    last_updated = CURRENT_TIMESTAMP
+                """,
+                (target_guild, response_cache)
+            )
+            settings_cache.invalidate_filter_settings(target_guild)
+            
+            status = "enabled" if response_cache else "disabled"
+            await interaction.response.send_message(
+                f"✅ Response cache {status} for server {target_guild}!",
+                ephemeral=True
+            )
+        except Exception as e:
+            await interaction.response.send_message("❌ Failed to update response cache setting. Please try again.", ephemeral=True)
+            
     @app_commands.command(name="mature_content")
     @app_commands.describe(
         action="Action to take with mature content",
@@ -130,7 +182,7 @@ class AdminCommands(commands.Cog):
         mature_enabled = 1 if action == "enable" else 0
         
         try:
-            ServerSettings.execute_query(
+            await async_db.execute(
                 """
                 INSERT INTO filter_settings 
                 (server_id, mature_enabled, mature_level)
@@ -142,6 +194,7 @@ class AdminCommands(commands.Cog):
                 """,
                 (target_guild, mature_enabled, level)
             )
+            settings_cache.invalidate_filter_settings(target_guild)
             
             status = "enabled" if mature_enabled else "disabled"
             level_text = ["mild", "moderate", "advanced"][level-1]
@@ -152,6 +205,110 @@ class AdminCommands(commands.Cog):
         except Exception as e:
             await interaction.response.send_message("❌ Failed to update mature content settings. Please try again.", ephemeral=True)
             
+    @app_commands.command(name="filter_rules")
+    @app_commands.describe(
+        action="Action to perform",
+        rule_type="Block terms filter messages; allowed terms exempt them from the built-in lists",
+        terms="Comma-separated terms (for add/remove)",
+        guild_id="Server ID to apply the rules to (optional, defaults to current server)"
+    )
+    @app_commands.choices(
+        action=[
+            app_commands.Choice(name="add", value="add"),
+            app_commands.Choice(name="remove", value="remove"),
+            app_commands.Choice(name="list", value="list"),
+            app_commands.Choice(name="clear", value="clear")
+        ],
+        rule_type=[
+            app_commands.Choice(name="block", value="block"),
+            app_commands.Choice(name="allow", value="allow")
+        ]
+    )
+    async def manage_filter_rules(
+        self,
+        interaction: discord.Interaction,
+        action: str,
+        rule_type: str = "block",
+        terms: Optional[str] = None,
+        guild_id: Optional[str] = None
+    ):
+        """Manage this server's custom filter terms"""
+        if not self._check_admin(interaction):
+            await interaction.response.send_message("❌ You need administrator permissions for this command.", ephemeral=True)
+            return
+            
+        target_guild = guild_id or str(interaction.guild_id)
+        
+        try:
+            if action == "list":
+                rows = await async_db.fetch_all(
+                    "SELECT term FROM filter_rules WHERE server_id = ? AND rule_type = ? ORDER BY term LIMIT 50",
+                    (target_guild, rule_type)
+                )
+                listed = ", ".join(row["term"] for row in rows) or "none"
+                await interaction.response.send_message(f"📋 {rule_type.title()} terms for {target_guild}: {listed}", ephemeral=True)
+                return
+                
+            limit = GUILD_RULES_SETTINGS["max_term_length"]
+            parsed = sorted({term.strip().casefold() for term in (terms or "").split(",") if term.strip()})
+            if action in ("add", "remove") and not parsed:
+                await interaction.response.send_message("❌ Provide at least one term.", ephemeral=True)
+                return
+            if any(len(term) > limit for term in parsed):
+                await interaction.response.send_message(f"❌ Terms are limited to {limit} characters.", ephemeral=True)
+                return
+                
+            if action == "add":
+                count = await async_db.fetch_one(
+                    "SELECT COUNT(*) AS total FROM filter_rules WHERE server_id = ?",
+                    (target_guild,)
+                )
+                if count["total"] + len(parsed) > GUILD_RULES_SETTINGS["max_terms"]:
+                    await interaction.response.send_message(
+                        f"❌ Servers are limited to {GUILD_RULES_SETTINGS['max_terms']:,} custom terms.",
+                        ephemeral=True
+                    )
+                    return
+                    
+            # Rule rows and the rules version change together
+            async with async_db.transaction() as tx:
+                if action == "add":
+                    for term in parsed:
+                        tx.execute(
+                            "INSERT OR IGNORE INTO filter_rules (server_id, rule_type, term) VALUES (?, ?, ?)",
+                            (target_guild, rule_type, term)
+                        )
+                elif action == "remove":
+                    for term in parsed:
+                        tx.execute(
+                            "DELETE FROM filter_rules WHERE server_id = ? AND rule_type = ? AND term = ?",
+                            (target_guild, rule_type, term)
+                        )
+                else:
+                    tx.execute(
+                        "DELETE FROM filter_rules WHERE server_id = ? AND rule_type = ?",
+                        (target_guild, rule_type)
+                    )
+                tx.execute(
+                    """
+                    INSERT INTO filter_settings (server_id, rules_version)
+                    VALUES (?, 1)
+                    ON CONFLICT(server_id) DO UPDATE SET
+                        rules_version = rules_version + 1,
+                        last_updated = CURRENT_TIMESTAMP
+                    """,
+                    (target_guild,)
+                )
+            settings_cache.invalidate_filter_settings(target_guild)
+            # Recompile off the message path; messages use the old rules until it lands
+            guild_rules.schedule_rebuild(target_guild)
+            
+            done = {"add": "Added", "remove": "Removed", "clear": "Cleared"}[action]
+            summary = f"{len(parsed)} {rule_type} term(s)" if parsed else f"all {rule_type} terms"
+            await interaction.response.send_message(f"✅ {done} {summary} for server {target_guild}!", ephemeral=True)
+        except Exception as e:
+            await interaction.response.send_message("❌ Failed to update filter rules. Please try again.", ephemeral=True)
+            
     @app_commands.command(name="adjust_honor")
     @app_commands.describe(
         user_id="User ID to adjust honor for",
@@ -169,20 +326,8 @@ class AdminCommands(commands.Cog):
             return
             
         try:
-            # Get current user data
-            user_data = UserRelations.get_user(int(user_id))
-            new_reputation = user_data["reputation"] + amount
-            
-            # Update reputation
-            UserRelations.execute_query(
-                """
-                UPDATE relations_users
-                SET reputation = ?,
-                    last_interaction = CURRENT_TIMESTAMP
-                WHERE user_id = ?
-                """,
-                (new_reputation, int(user_id))
-            )
+            # Goes through the user cache so pending deltas aren't overwritten
+            new_reputation = await user_cache.adjust_reputation(int(user_id), amount)
             
             await interaction.response.send_message(
                 f"✅ Adjusted honor for user {user_id} by {amount} (new total: {new_reputation})",
@@ -4,7 +4,15 @@ from discord.ext import commands
 import json
 import logging
 from typing import Dict, Optional
-from ..database.models import LearningData, UserRelations
+from ..database.async_db import async_db
+from ..services.settings_cache import settings_cache
+from ..services.verdict_cache import verdict_cache
+from ..services.retention import retention_engine
+from ..services.backup import backup_scheduler
+from ..services.history_scan import history_scanner
+from ..services.response_cache import response_cache
+from ..services.markov import markov_generator
+from ..services.response_gen import response_generator
 from ..config import GENERATION_LIMITS, OWNER_ID
 
 class LearningCommands(commands.Cog):
@@ -20,7 +28,7 @@ class LearningCommands(commands.Cog):
         """View learning statistics"""
         try:
             # Get word chain stats
-            word_chains = LearningData.execute_query(
+            word_chains = await async_db.execute_query(
                 "SELECT COUNT(*), COUNT(DISTINCT word1) FROM word_chains",
                 fetch=True
             )
@@ -28,7 +36,7 @@ class LearningCommands(commands.Cog):
             unique_words = word_chains[0][1] if word_chains else 0
             
             # Get response pattern stats
-            patterns = LearningData.execute_query(
+            patterns = await async_db.execute_query(
                 """
                 SELECT 
                     COUNT(*),
@@ -73,20 +81,28 @@ class LearningCommands(commands.Cog):
             await interaction.response.send_message("❌ This command is restricted to the bot owner.", ephemeral=True)
             return
             
+        # The snapshot can outlast the 3s interaction window
+        await interaction.response.defer(ephemeral=True)
+        
         try:
             # Backup current data first
-            await self._backup_learning_data()
+            if not await self._backup_learning_data():
+                await interaction.followup.send("❌ Backup failed, learning data was not reset.", ephemeral=True)
+                return
             
             # Reset tables
-            LearningData.execute_query("DELETE FROM word_chains")
-            LearningData.execute_query("DELETE FROM response_patterns")
-            LearningData.execute_query("DELETE FROM user_personality")
+            async with async_db.transaction() as tx:
+                tx.execute("DELETE FROM word_chains")
+                tx.execute("DELETE FROM response_patterns")
+                tx.execute("DELETE FROM user_personality")
+            response_cache.clear()
+            markov_generator.clear()
             
-            await interaction.response.send_message("✅ Learning data has been reset. A backup was created first.", ephemeral=True)
+            await interaction.followup.send("✅ Learning data has been reset. A backup was created first.", ephemeral=True)
             
         except Exception as e:
             logging.error(f"Error resetting learning data: {e}")
-            await interaction.response.send_message("❌ Failed to reset learning data.", ephemeral=True)
+            await interaction.followup.send("❌ Failed to reset learning data.", ephemeral=True)
             
     @app_commands.command(name="export_learning")
     async def export_learning(self, interaction: discord.Interaction):
@@ -97,17 +113,17 @@ class LearningCommands(commands.Cog):
             
         try:
             # Get all learning data
-            word_chains = LearningData.execute_query(
+            word_chains = await async_db.execute_query(
                 "SELECT * FROM word_chains",
                 fetch=True
             )
             
-            patterns = LearningData.execute_query(
+            patterns = await async_db.execute_query(
                 "SELECT * FROM response_patterns",
                 fetch=True
             )
             
-            personality = LearningData.execute_query(
+            personality = await async_db.execute_query(
                 "SELECT * FROM user_personality",
                 fetch=True
             )
@@ -159,29 +175,61 @@ class LearningCommands(commands.Cog):
             logging.error(f"Error exporting learning data: {e}")
             await interaction.response.send_message("❌ Failed to export learning data.", ephemeral=True)
             
-    async def _backup_learning_data(self):
-        """Create a backup of learning data"""
+    @app_commands.command(name="rescan_history")
+    @app_commands.describe(guild_id="Guild whose messages to re-scan under its filter settings and custom rules (defaults to this one)")
+    async def rescan_history(self, interaction: discord.Interaction, guild_id: Optional[str] = None):
+        """Re-run the content filter over a guild's conversation log and store flags (Owner only)"""
+        if not self._check_owner(interaction):
+            await interaction.response.send_message("❌ This command is restricted to the bot owner.", ephemeral=True)
+            return
+            
+        if history_scanner.running:
+            await interaction.response.send_message("❌ A history scan is already running.", ephemeral=True)
+            return
+            
+        # A full scan takes far longer than the 3s interaction window
+        await interaction.response.defer(ephemeral=True)
+        
+        try:
+            server_id = guild_id or (str(interaction.guild_id) if interaction.guild_id else None)
+            result = await history_scanner.run(server_id)
+            await interaction.followup.send(
+                f"✅ Scanned {result['scanned']:,} messages in {result['duration_ms'] / 1000:.1f}s: "
+                f"{result['flagged']:,} flagged, {result['cleared']:,} cleared.",
+                ephemeral=True
+            )
+            
+        except Exception as e:
+            logging.error(f"Error rescanning conversation history: {e}")
+            await interaction.followup.send("❌ Failed to rescan conversation history.", ephemeral=True)
+            
+    @app_commands.command(name="compact_database")
+    async def compact_database(self, interaction: discord.Interaction):
+        """Switch the database to incremental auto_vacuum with a full VACUUM; writes wait meanwhile (Owner only)"""
+        if not self._check_owner(interaction):
+            await interaction.response.send_message("❌ This command is restricted to the bot owner.", ephemeral=True)
+            return
+            
+        # A full VACUUM of a large file takes far longer than the 3s interaction window
+        await interaction.response.defer(ephemeral=True)
+        
         try:
-            # Create backup tables
-            LearningData.execute_query("""
-                CREATE TABLE IF NOT EXISTS word_chains_backup AS 
-                SELECT * FROM word_chains
-            """)
-            
-            LearningData.execute_query("""
-                CREATE TABLE IF NOT EXISTS response_patterns_backup AS 
-                SELECT * FROM response_patterns
-            """)
-            
-            LearningData.execute_query("""
-                CREATE TABLE IF NOT EXISTS user_personality_backup AS 
-                SELECT * FROM user_personality
-            """)
-            
-            return True
+            result = await retention_engine.compact()
+            if result["converted"]:
+                message = (f"✅ Compacted the database from {result['size_before'] / 2 ** 20:.1f}MB to "
+                           f"{result['size_after'] / 2 ** 20:.1f}MB in {result['duration_ms'] / 1000:.1f}s; "
+                           f"freed space is now returned after every retention run.")
+            else:
+                message = "✅ The database already uses incremental auto_vacuum; nothing to do."
+            await interaction.followup.send(message, ephemeral=True)
+            
         except Exception as e:
-            logging.error(f"Error creating learning backup: {e}")
-            return False
+            logging.error(f"Error compacting database: {e}")
+            await interaction.followup.send("❌ Failed to compact the database.", ephemeral=True)
+            
+    async def _backup_learning_data(self):
+        """Create a fresh snapshot of the database file"""
+        return await backup_scheduler.snapshot(reason="reset_learning") is not None
             
     @app_commands.command(name="learning_health")
     async def learning_health(self, interaction: discord.Interaction):
@@ -192,14 +240,14 @@ class LearningCommands(commands.Cog):
             
         try:
             # Check database size
-            db_stats = LearningData.execute_query(
+            db_stats = await async_db.execute_query(
                 "SELECT page_count * page_size as size FROM pragma_page_count(), pragma_page_size()",
                 fetch=True
             )
             db_size = db_stats[0][0] if db_stats else 0
             
             # Check pattern quality
-            pattern_stats = LearningData.execute_query(
+            pattern_stats = await async_db.execute_query(
                 """
                 SELECT 
                     COUNT(*) as total,
@@ -242,6 +290,70 @@ class LearningCommands(commands.Cog):
                     value=f"{pattern_health}\nLow Success: {low_success:,} ({low_success/total:.1%})\nLow Usage: {low_usage:,} ({low_usage/total:.1%})",
                     inline=False
                 )
+                
+            # Write-behind ingestion queue
+            ingest = self.bot.dialogue_trainer.ingest_buffer.stats()
+            embed.add_field(
+                name="Ingestion Queue",
+                value=f"Queued Patterns: {ingest['queue_depth']:,} ({ingest['queued_uses']:,} uses)\n"
+                      f"Flushes: {ingest['flush_count']:,} ({ingest['flushed_rows']:,} rows)\n"
+                      f"Flush Latency: {ingest['last_flush_ms']:.1f}ms last, {ingest['max_flush_ms']:.1f}ms max",
+                inline=False
+            )
+            
+            # Server/channel settings cache
+            cache = settings_cache.stats()
+            embed.add_field(
+                name="Settings Cache",
+                value=f"Hit Rate: {cache['hit_rate']:.1%} ({cache['hits']:,} hits, {cache['misses']:,} misses)\n"
+                      f"Cached Guilds: {cache['filter_entries']:,}",
+                inline=False
+            )
+            
+            # Content filter verdict cache
+            verdicts = verdict_cache.stats()
+            embed.add_field(
+                name="Verdict Cache",
+                value=f"Hit Rate: {verdicts['hit_rate']:.1%} ({verdicts['hits']:,} hits, {verdicts['misses']:,} misses)\n"
+                      f"Entries: {verdicts['entries']:,} (~{verdicts['memory_bytes'] / 1024:.0f} KiB)",
+                inline=False
+            )
+            
+            # Cached replies served instead of API calls
+            replies = response_cache.stats()
+            embed.add_field(
+                name="Response Cache",
+                value=f"Hit Ratio: {replies['hit_ratio']:.1%} ({replies['memory_hits']:,} memory, "
+                      f"{replies['db_hits']:,} database, {replies['misses']:,} misses)\n"
+                      f"API Calls Avoided: {replies['api_calls_avoided']:,}\n"
+                      f"Entries: {replies['entries']:,}",
+                inline=False
+            )
+            
+            # Completions API circuit breaker and local fallbacks
+            generator = response_generator.stats()
+            breaker = generator["circuit_breaker"]
+            embed.add_field(
+                name="API Circuit",
+                value=f"State: {breaker['state'].replace('_', ' ').title()} (opened {breaker['opened']:,} times)\n"
+                      f"Recent Failures: {breaker['failure_rate']:.1%}, Slow: {breaker['slow_rate']:.1%}\n"
+                      f"Local Replies: {generator['local_responses']:,}, Past Deadline: {generator['deadline_exceeded']:,}",
+                inline=False
+            )
+            
+            # Retention engine
+            retention = retention_engine.stats()
+            if retention.get("deleted"):
+                vacuum = ("Incremental" if retention["incremental_vacuum"]
+                          else "Off (run /compact_database to return freed space)")
+                embed.add_field(
+                    name="Retention",
+                    value=f"Runs: {retention['runs']:,}\n"
+                          f"Last Run: {sum(retention['deleted'].values()):,} rows removed, "
+                          f"{retention['pages_released']:,} pages released\n"
+                          f"Auto Vacuum: {vacuum}",
+                    inline=False
+                )
             
             await interaction.response.send_message(embed=embed)
             
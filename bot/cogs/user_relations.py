@@ -2,9 +2,11 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import logging
-import re
 from typing import Dict, Optional, Tuple
-from ..database.models import UserRelations, LearningData
+from ..database.async_db import async_db
+from ..services.keyword_matcher import KeywordMatcher
+from ..services.message_analysis import MessageAnalysis
+from ..services.user_cache import user_cache
 from ..config import OWNER_ID
 
 class UserRelationsCommands(commands.Cog):
@@ -17,27 +19,39 @@ class UserRelationsCommands(commands.Cog):
             "mention": 1.8
         }
         
-        # Sentiment analysis patterns
-        self.positive_patterns = {
-            r"\b(thanks?|thank you|appreciate|grateful|helpful)\b": 0.8,
-            r"\b(love|awesome|amazing|excellent|great|good)\b": 0.5,
-            r"\b(nice|cool|sweet|wonderful|fantastic)\b": 0.4,
-            r"[<]?3|[❤️💕💖💗💓]": 0.6,
-            r"[:;][)]": 0.3,
-            r"\b(cute|adorable|lovely|kind|gentle)\b": 0.5,
-            r"\b(smart|clever|intelligent|wise)\b": 0.4,
-            r"[🥰😊😄😃😀]": 0.5,
-            r"\b(friend|bestie|pal)\b": 0.6
+        # Sentiment lexicons: keyword groups and their weight per occurrence
+        self.positive_lexicon = {
+            ("thank", "thanks", "thank you", "appreciate", "grateful", "helpful"): 0.8,
+            ("love", "awesome", "amazing", "excellent", "great", "good"): 0.5,
+            ("nice", "cool", "sweet", "wonderful", "fantastic"): 0.4,
+            ("<3", "❤", "💕", "💖", "💗", "💓"): 0.6,
+            (":)", ";)"): 0.3,
+            ("cute", "adorable", "lovely", "kind", "gentle"): 0.5,
+            ("smart", "clever", "intelligent", "wise"): 0.4,
+            ("🥰", "😊", "😄", "😃", "😀"): 0.5,
+            ("friend", "bestie", "pal"): 0.6
         }
         
-        self.negative_patterns = {
-            r"\b(hate|stupid|dumb|useless|bad)\b": -0.2,
-            r"\b(fuck|shit|damn|bitch|ass)\b": -0.3,
-            r"\b(wrong|incorrect|error|bug|broken)\b": -0.1,
-            r"[:;][(@]": -0.1,
-            r"[🤬😠😡👎]": -0.2
+        self.negative_lexicon = {
+            ("hate", "stupid", "dumb", "useless", "bad"): -0.2,
+            ("fuck", "shit", "damn", "bitch", "ass"): -0.3,
+            ("wrong", "incorrect", "error", "bug", "broken"): -0.1,
+            (":(", ";(", ":@", ";@"): -0.1,
+            ("🤬", "😠", "😡", "👎"): -0.2
         }
         
+        # One automaton over both lexicons, built once per cog load
+        self.sentiment_matcher = KeywordMatcher()
+        for category, lexicon in (("positive", self.positive_lexicon), ("negative", self.negative_lexicon)):
+            for keywords, weight in lexicon.items():
+                self.sentiment_matcher.add_all(keywords, category, weight, whole_word=True)
+        self.sentiment_matcher.build()
+        
+        # Personality trait indicator tokens
+        self.polite_words = {"please", "thank", "thanks", "appreciate", "sorry", "excuse"}
+        self.friendly_words = {"hello", "hi", "hey", "nice", "good", "great", "awesome", "love"}
+        self.engagement_markers = {"?", "!", "what", "how", "why", "tell", "explain"}
+        
         # Reputation thresholds and responses
         self.reputation_responses = {
             150: ["You're such a wonderful friend! I really enjoy our time together! 💖", 
@@ -54,27 +68,22 @@ class UserRelationsCommands(commands.Cog):
                   "I'm sure we can be friends if we try! 😊"]
         }
     
-    def _analyze_sentiment(self, message: str) -> Tuple[float, list]:
+    def _analyze_sentiment(self, message: str, analysis: Optional[MessageAnalysis] = None) -> Tuple[float, list]:
         """Analyze message sentiment and return score with reasons"""
         score = 0
         reasons = []
         
-        # Convert to lowercase for pattern matching
-        message_lower = message.lower()
-        
-        # Check positive patterns
-        for pattern, weight in self.positive_patterns.items():
-            matches = re.findall(pattern, message_lower)
-            if matches:
-                score += weight * len(matches)
-                reasons.append(f"Positive language: {', '.join(matches)}")
-        
-        # Check negative patterns
-        for pattern, weight in self.negative_patterns.items():
-            matches = re.findall(pattern, message_lower)
-            if matches:
-                score += weight * len(matches)
-                reasons.append(f"Negative language: {', '.join(matches)}")
+        # One pass over the casefolded message finds every lexicon hit
+        analysis = analysis or MessageAnalysis(message)
+        matched = {"positive": [], "negative": []}
+        for hit in self.sentiment_matcher.find_all(analysis.casefolded):
+            score += hit.weight
+            matched[hit.category].append(hit.keyword)
+            
+        if matched["positive"]:
+            reasons.append(f"Positive language: {', '.join(matched['positive'])}")
+        if matched["negative"]:
+            reasons.append(f"Negative language: {', '.join(matched['negative'])}")
         
         # Add small positive bias to all non-negative messages
         if score >= 0:
@@ -102,10 +111,10 @@ class UserRelationsCommands(commands.Cog):
         """View relationship stats with a user"""
         try:
             target_id = int(user_id) if user_id else interaction.user.id
-            user_data = UserRelations.get_user(target_id)
+            user_data = await user_cache.get_user(target_id)
             
             # Get personality traits
-            traits = LearningData.execute_query(
+            traits = await async_db.execute_query(
                 """
                 SELECT trait_type, trait_value, confidence
                 FROM user_personality
@@ -118,7 +127,7 @@ class UserRelationsCommands(commands.Cog):
             )
             
             # Get interaction stats
-            interactions = LearningData.execute_query(
+            interactions = await async_db.execute_query(
                 """
                 SELECT COUNT(*) as count,
                        SUM(CASE WHEN sentiment_score > 0 THEN 1 ELSE 0 END) as positive_count,
@@ -183,7 +192,8 @@ class UserRelationsCommands(commands.Cog):
         user_id: int,
         interaction_type: str,
         message_content: str = "",
-        success: bool = True
+        success: bool = True,
+        analysis: Optional[MessageAnalysis] = None
     ):
         """Log an interaction with a user"""
         try:
@@ -193,28 +203,19 @@ class UserRelationsCommands(commands.Cog):
             # Analyze sentiment if there's message content
             sentiment_score = 0
             if message_content:
-                sentiment_score, _ = self._analyze_sentiment(message_content)
+                sentiment_score, _ = self._analyze_sentiment(message_content, analysis)
                 weight += sentiment_score
             
             # Adjust weight based on success
             if not success:
                 weight *= 0.5
                 
-            # Update user relations
-            UserRelations.execute_query(
-                """
-                UPDATE relations_users
-                SET interactions = interactions + 1,
-                    reputation = reputation + ?,
-                    last_interaction = CURRENT_TIMESTAMP
-                WHERE user_id = ?
-                """,
-                (weight, user_id)
-            )
+            # Update user relations (written back in batches by the user cache)
+            user_cache.record_interaction(user_id, weight)
             
             # Store sentiment score in conversation log
             if message_content:
-                LearningData.execute_query(
+                await async_db.execute_query(
                     """
                     UPDATE conversation_log
                     SET sentiment_score = ?
@@ -231,26 +232,31 @@ class UserRelationsCommands(commands.Cog):
         user_id: int,
         message_content: str,
         response: str,
-        success: bool
+        success: bool,
+        analysis: Optional[MessageAnalysis] = None,
+        server_id: Optional[str] = None
     ):
-        """Analyze and store interaction data"""
+        """Analyze and store interaction data (server_id None for DMs)"""
         try:
+            # Every analyzer below shares one casefold and tokenization
+            analysis = analysis or MessageAnalysis(message_content)
+            
             # Analyze sentiment
-            sentiment_score, sentiment_reasons = self._analyze_sentiment(message_content)
+            sentiment_score, sentiment_reasons = self._analyze_sentiment(message_content, analysis)
             
             # Store in conversation log with sentiment
-            LearningData.execute_query(
+            await async_db.execute_query(
                 """
                 INSERT INTO conversation_log 
-                (user_id, user_message, bot_response, sentiment_score, sentiment_reasons)
-                VALUES (?, ?, ?, ?, ?)
+                (user_id, user_message, bot_response, sentiment_score, sentiment_reasons, server_id)
+                VALUES (?, ?, ?, ?, ?, ?)
                 """,
-                (user_id, message_content, response, sentiment_score, str(sentiment_reasons))
+                (user_id, message_content, response, sentiment_score, str(sentiment_reasons), server_id)
             )
             
             # Update success rate for response pattern
             if success:
-                LearningData.execute_query(
+                await async_db.execute_query(
                     """
                     UPDATE response_patterns
                     SET success_rate = (success_rate * usage_count + 1.0) / (usage_count + 1),
@@ -261,52 +267,48 @@ class UserRelationsCommands(commands.Cog):
                 )
             
             # Extract and update personality traits
-            await self._update_personality_traits(user_id, message_content)
+            await self._update_personality_traits(user_id, message_content, analysis)
             
             # Log the interaction with sentiment
-            await self.log_interaction(user_id, "message", message_content, success)
+            await self.log_interaction(user_id, "message", message_content, success, analysis)
             
         except Exception as e:
             logging.error(f"Error analyzing interaction: {e}")
             
-    async def _update_personality_traits(self, user_id: int, message: str):
+    def _personality_traits(self, analysis: MessageAnalysis) -> Dict[str, float]:
+        """Trait scores for one message: indicator tokens per word"""
+        words = analysis.word_count
+        if not words:
+            return {}
+        counts = analysis.token_counts
+        return {
+            "politeness": sum(counts[token] for token in self.polite_words if token in counts) / words,
+            "friendliness": sum(counts[token] for token in self.friendly_words if token in counts) / words,
+            "engagement": sum(counts[token] for token in self.engagement_markers if token in counts) / words
+        }
+            
+    async def _update_personality_traits(self, user_id: int, message: str, analysis: Optional[MessageAnalysis] = None):
         """Update personality traits based on message content"""
         try:
-            # Simple trait analysis (you can make this more sophisticated)
-            traits = {
-                "politeness": 0.0,
-                "friendliness": 0.0,
-                "engagement": 0.0
-            }
-            
-            # Basic analysis
-            words = message.lower().split()
-            
-            # Politeness indicators
-            polite_words = {"please", "thank", "thanks", "appreciate", "sorry", "excuse"}
-            traits["politeness"] = sum(1 for word in words if word in polite_words) / len(words)
-            
-            # Friendliness indicators
-            friendly_words = {"hello", "hi", "hey", "nice", "good", "great", "awesome", "love"}
-            traits["friendliness"] = sum(1 for word in words if word in friendly_words) / len(words)
+            traits = self._personality_traits(analysis or MessageAnalysis(message))
             
-            # Engagement indicators
-            engagement_markers = {"?", "!", "what", "how", "why", "tell", "explain"}
-            traits["engagement"] = sum(1 for word in words if word in engagement_markers) / len(words)
-            
-            # Update database
-            for trait, value in traits.items():
-                if value > 0:
-                    LearningData.execute_query(
-                        """
-                        INSERT INTO user_personality (user_id, trait_type, trait_value, confidence)
-                        VALUES (?, ?, ?, 0.1)
-                        ON CONFLICT(user_id, trait_type) DO UPDATE SET
-                            trait_value = (trait_value * confidence + ? * 0.1) / (confidence + 0.1),
-                            confidence = MIN(confidence + 0.1, 1.0)
-                        """,
-                        (user_id, trait, str(value), value)
-                    )
+            # Update database in one batch
+            updates = [
+                (user_id, trait, str(value), value)
+                for trait, value in traits.items()
+                if value > 0
+            ]
+            if updates:
+                await async_db.executemany(
+                    """
+                    INSERT INTO user_personality (user_id, trait_type, trait_value, confidence)
+                    VALUES (?, ?, ?, 0.1)
+                    ON CONFLICT(user_id, trait_type) DO UPDATE SET
+                        trait_value = (trait_value * confidence + ? * 0.1) / (confidence + 0.1),
+                        confidence = MIN(confidence + 0.1, 1.0)
+                    """,
+                    updates
+                )
                     
         except Exception as e:
             logging.error(f"Error updating personality traits: {e}")
@@ -5,6 +5,7 @@ from typing import Dict, Any
 REPLIT_DB_URL = os.getenv("REPLIT_DB_URL", "")
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+OWNER_ID = int(os.getenv("OWNER_ID", "0"))
 
 # Database settings
 DB_PATH = os.path.join(os.getcwd(), "chinatsu-brain.db")
@@ -13,7 +14,8 @@ DB_BACKUP_PATH = os.path.join(os.getcwd(), "chinatsu-brain.backup.db")
 # Performance settings for Replit
 DB_SETTINGS = {
     "connection_timeout": 30.0,  # Longer timeout for Replit's environment
-    "max_connections": 3,        # Limit connections to save memory
+    "max_connections": 3,        # Reader pool size (writes go through one writer thread)
+    "write_batch_size": 64,      # Max queued writes grouped into one transaction
     "journal_mode": "WAL",       # Write-Ahead Logging for better concurrency
     "cache_size": -2 * 1024,    # 2MB cache size (-ve means kibibytes)
     "page_size": 4096,          # Optimal for most systems
@@ -24,21 +26,132 @@ DB_SETTINGS = {
 CACHE_SETTINGS = {
     "max_size": 1000,           # Maximum items in cache
     "ttl": 3600,               # Cache TTL in seconds
-    "cleanup_interval": 300     # Cleanup every 5 minutes
+    "cleanup_interval": 300,    # Cleanup every 5 minutes
+    "flush_interval": 10        # Write back cached user deltas every 10 seconds
+}
+
+# Write-behind dialogue ingestion
+INGEST_SETTINGS = {
+    "max_pending": 500,         # Flush once this many distinct patterns are queued
+    "max_pending_chains": 5000, # ... or this many distinct word chains
+    "flush_interval": 5         # Flush at least every 5 seconds
 }
 
 # Content generation limits
 GENERATION_LIMITS = {
     "max_response_length": 2000,  # Discord message limit
     "max_context_length": 4096,   # Limit context to save memory
-    "max_learning_entries": 10000  # Limit learning database size
+    "max_learning_entries": 10000,  # Limit learning database size
+    "reply_deadline": 20        # Seconds a reply may take, API calls and retries included, before a local one is sent
+}
+
+# Content filter
+FILTER_LIMITS = {
+    "max_scan_length": 4000     # Characters scanned per message; anything past max_response_length is flagged regardless
+}
+
+# Per-guild custom filter rules
+GUILD_RULES_SETTINGS = {
+    "max_compiled": 256,        # Guild matchers kept compiled (LRU)
+    "max_terms": 5000,          # Custom terms per guild
+    "max_term_length": 100      # Characters per custom term
+}
+
+# Content filter verdict cache
+VERDICT_CACHE_SETTINGS = {
+    "max_entries": 4096,        # LRU bound on cached verdicts
+    "ttl": 600                  # Seconds before a verdict is recomputed
+}
+
+# Pooled HTTP session for the Mistral API
+HTTP_SETTINGS = {
+    "limit": 20,                # Open connections in the pool
+    "limit_per_host": 10,       # Open connections to one host
+    "keepalive_timeout": 60,    # Seconds an idle connection is kept for reuse
+    "ttl_dns_cache": 300,       # Seconds a DNS lookup is reused
+    "total_timeout": 60,        # Seconds for a whole request, streamed body included
+    "connect_timeout": 10,      # Seconds to get a connection (pool wait, DNS, TCP and TLS)
+    "sock_read_timeout": 20     # Seconds without data before a stream is given up
+}
+
+# Admission control for Mistral API calls
+RATE_LIMIT_SETTINGS = {
+    "rate": 1.0,                # API requests per second across all guilds
+    "burst": 2,                 # Requests allowed back to back after an idle spell
+    "guild_rate": 0.5,          # API requests per second for any one guild
+    "guild_burst": 2,           # Back to back requests for one guild
+    "max_guilds": 1024,         # Guild buckets kept before idle, refilled ones are dropped
+    "max_retry_after": 60,      # Cap on a 429 Retry-After pause, in seconds
+    "wait_samples": 1024        # Recent waits kept for the p95 metric
+}
+
+# Generated replies reused before calling the API
+RESPONSE_CACHE_SETTINGS = {
+    "max_entries": 2048,        # In-memory LRU bound
+    "ttl": 6 * 3600,            # Seconds before a reply is generated afresh
+    "min_success_rate": 0.8,    # Stored replies below this are not reused
+    "min_uses": 1,              # Times a stored reply must have been reused (usage_count)
+    "max_message_length": 80    # Longer messages are never cached
+}
+
+# Moderation of streamed completions
+STREAM_FILTER_SETTINGS = {
+    "min_scan_chars": 48,       # New settled characters between incremental filter scans
+    "max_regenerations": 1      # Fresh generations after a flagged one before giving up
+}
+
+# Word chain (trigram Markov) replies, made locally
+MARKOV_SETTINGS = {
+    "reload_interval": 900,     # Seconds before word_chains is read again
+    "max_learned_words": 40,    # Words of a message learned as chains
+    "max_words": 30,            # Longest reply generated
+    "min_words": 4,             # Shorter generations are tried again...
+    "attempts": 5               # ... this many times, keeping the longest
+}
+
+# Circuit breaker around the completions API
+CIRCUIT_BREAKER_SETTINGS = {
+    "window": 20,               # Recent calls the rates are taken over
+    "min_calls": 5,             # Calls in the window before the rates can open the breaker
+    "failure_rate": 0.5,        # Share of failed calls that opens it
+    "slow_call_seconds": 8,     # Calls slower than this to the first token count as slow
+    "slow_rate": 0.5,           # Share of slow calls that opens it
+    "max_consecutive_failures": 3,  # Failures in a row that open it regardless of the window
+    "open_seconds": 30,         # Seconds replies are made locally before probing the API again
+    "half_open_probes": 2       # Probe calls that must succeed to close it again
+}
+
+# Replies posted to Discord while they are generated
+STREAMING_REPLY_SETTINGS = {
+    "edit_interval": 1.2,       # Seconds between edits of a growing reply (Discord allows 5 per 5s per channel)
+    "max_message_length": 2000, # Discord message limit; longer replies continue in follow-up messages
+    "max_unbroken": 200         # Characters shown without a sentence end (cut at a word) before waiting for one
+}
+
+# Bulk re-scan of conversation_log through the content filter
+HISTORY_SCAN_SETTINGS = {
+    "page_size": 2000,          # Rows read per keyset page
+    "chunk_size": 250,          # Messages per filter_batch chunk (one worker task each)
+    "workers": 2,               # Filter processes (capped at the CPU count); below 2 scans on the event loop thread
+    "page_pause": 0.01          # Seconds between pages
+}
+
+# Retention and compaction
+RETENTION_SETTINGS = {
+    "interval": 900,            # Run retention every 15 minutes
+    "batch_size": 500,          # Rows deleted per writer job
+    "batch_pause": 0.05,        # Seconds between delete batches
+    "conversation_log_days": 30,  # Age out conversation history
+    "one_off_pattern_days": 7,  # Drop response patterns never reused after this
+    "vacuum_pages": 2000        # Free pages returned to the OS per run
 }
 
 # Backup settings
 BACKUP_SETTINGS = {
     "interval": 3600,           # Backup every hour
     "keep_backups": 2,          # Number of backups to keep
-    "max_backup_size": 50 * 1024 * 1024  # 50MB max backup size
+    "max_backup_size": 50 * 1024 * 1024,  # 50MB max backup size
+    "step_pages": 256           # Pages copied per backup step
 }
 
 def get_db_url() -> str:
@@ -0,0 +1,180 @@
+import asyncio
+import aiosqlite
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Iterable, Sequence
+from ..config import get_db_settings, DB_PATH
+from .connection import db_manager, DatabaseConnectionManager
+
+logger = logging.getLogger('chinatsu.db')
+
+class AsyncDatabase:
+    """
+    Async data-access layer.
+    Reads run on aiosqlite's worker thread over a query-only connection; writes
+    are handed to the connection manager's single writer thread and awaited.
+    """
+    
+    def __init__(self, db_path: str = DB_PATH, manager: DatabaseConnectionManager = db_manager):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection: Optional[aiosqlite.Connection] = None
+        self._settings = get_db_settings()
+        self._manager = manager
+        
+    async def connect(self):
+        """Create database connection"""
+        if not self._connection:
+            try:
+                self._connection = await aiosqlite.connect(
+                    self.db_path,
+                    timeout=self._settings["connection_timeout"]
+                )
+                self._connection.row_factory = aiosqlite.Row
+                await self._connection.execute(f"PRAGMA journal_mode = {self._settings['journal_mode']}")
+                await self._connection.execute(f"PRAGMA cache_size = {self._settings['cache_size']}")
+                await self._connection.execute(f"PRAGMA temp_store = {self._settings['temp_store']}")
+                await self._connection.execute("PRAGMA synchronous = NORMAL")
+                await self._connection.execute("PRAGMA query_only = ON")
+                logger.info(f"Connected to database at {self.db_path}")
+            except Exception as e:
+                logger.error(f"Failed to connect to database: {e}")
+                raise
+                
+    async def disconnect(self):
+        """Close database connection"""
+        if self._connection:
+            await self._connection.close()
+            self._connection = None
+            
+    async def _get_connection(self) -> aiosqlite.Connection:
+        if not self._connection:
+            await self.connect()
+        return self._connection
+        
+    async def execute(self, query: str, params: tuple = ()) -> int:
+        """Execute a write query on the writer thread, returning the affected row count"""
+        try:
+            return await asyncio.wrap_future(self._manager.submit_write(query, params))
+        except Exception as e:
+            logger.error(f"Query execution failed: {e}")
+            raise
+            
+    async def executemany(self, query: str, params_seq: Iterable[Sequence[Any]]) -> int:
+        """Execute a write query for every parameter set in one transaction"""
+        try:
+            return await asyncio.wrap_future(self._manager.submit_many(query, params_seq))
+        except Exception as e:
+            logger.error(f"Batch execution failed: {e}")
+            raise
+            
+    async def execute_query(self, query: str, params: tuple = (), fetch: bool = False):
+        """Async equivalent of the models' execute_query with optional fetch"""
+        if not fetch:
+            return await self.execute(query, params)
+        conn = await self._get_connection()
+        try:
+            async with conn.execute(query, params) as cursor:
+                return await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Failed to fetch rows: {e}")
+            raise
+            
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Run several writes atomically.
+        Yields a Transaction that collects statements; they are executed on the
+        writer thread as one unit when the block exits without an error.
+        """
+        tx = Transaction()
+        yield tx
+        if tx.statements:
+            try:
+                await asyncio.wrap_future(self._manager.submit(tx.apply))
+            except Exception as e:
+                logger.error(f"Transaction rolled back: {e}")
+                raise
+                
+    async def upsert(
+        self,
+        table: str,
+        values: Dict[str, Any],
+        conflict_columns: Sequence[str],
+        update_columns: Optional[Sequence[str]] = None
+    ) -> int:
+        """
+        Insert a row or update it on conflict.
+        update_columns defaults to every non-conflict column in values.
+        """
+        columns = list(values)
+        if update_columns is None:
+            update_columns = [c for c in columns if c not in conflict_columns]
+        assignments = ", ".join(f"{c} = excluded.{c}" for c in update_columns)
+        query = (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT({', '.join(conflict_columns)}) "
+        )
+        query += f"DO UPDATE SET {assignments}" if assignments else "DO NOTHING"
+        return await self.execute(query, tuple(values.values()))
+        
+    async def fetch_one(self, query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
+        """Fetch a single row"""
+        conn = await self._get_connection()
+        try:
+            async with conn.execute(query, params) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Failed to fetch row: {e}")
+            raise
+            
+    async def fetch_all(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        """Fetch all rows"""
+        conn = await self._get_connection()
+        try:
+            async with conn.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Failed to fetch rows: {e}")
+            raise
+            
+    async def get_user(self, user_id: int) -> Dict[str, Any]:
+        """Get user data, creating if doesn't exist"""
+        user = await self.fetch_one(
+            "SELECT * FROM relations_users WHERE user_id = ?",
+            (user_id,)
+        )
+        if user:
+            return user
+            
+        await self.execute(
+            "INSERT OR IGNORE INTO relations_users (user_id) VALUES (?)",
+            (user_id,)
+        )
+        return await self.fetch_one(
+            "SELECT * FROM relations_users WHERE user_id = ?",
+            (user_id,)
+        )
+
+class Transaction:
+    """Statements queued inside AsyncDatabase.transaction()"""
+    
+    def __init__(self):
+        self.statements: List[tuple] = []
+        
+    def execute(self, query: str, params: tuple = ()):
+        self.statements.append((query, params))
+        
+    def apply(self, conn) -> int:
+        """Run on the writer thread inside its savepoint"""
+        rowcount = 0
+        for query, params in self.statements:
+            rowcount += max(conn.execute(query, params).rowcount, 0)
+        return rowcount
+
+# Global async database instance
+async_db = AsyncDatabase()
\ No newline at end of file
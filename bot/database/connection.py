@@ -1,111 +1,278 @@
 import sqlite3
 import threading
-import time
+import queue
 import logging
-from typing import Optional, Dict
+from concurrent.futures import Future
+from typing import Optional, Callable, Any, Iterable, Sequence, List
 from contextlib import contextmanager
 from ..config import get_db_settings, DB_PATH
 
+class _WriteJob:
+    """A unit of work for the writer thread"""
+    
+    __slots__ = ("fn", "future", "exclusive")
+    
+    def __init__(self, fn: Callable[[sqlite3.Connection], Any], exclusive: bool):
+        self.fn = fn
+        self.future: Future = Future()
+        self.exclusive = exclusive
+
 class DatabaseConnectionManager:
-    """Thread-safe database connection manager optimized for Replit"""
+    """
+    Single-writer connection manager optimized for Replit.
+    One dedicated thread owns the only write connection and drains a queue of
+    jobs, grouping them into transactions (each job in its own savepoint so a
+    failing job doesn't take its neighbours down). Readers borrow from a small
+    pool of query-only connections, which WAL lets run alongside the writer.
+    """
     
-    def __init__(self):
-        self._connections: Dict[int, sqlite3.Connection] = {}
-        self._lock = threading.Lock()
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
         self._settings = get_db_settings()
-        self._last_cleanup = time.time()
-        self._cleanup_interval = 300  # 5 minutes
+        self._lock = threading.Lock()
+        
+        # Writer state
+        self._write_queue: "queue.Queue[Optional[_WriteJob]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._batch_size = self._settings["write_batch_size"]
+        
+        # Reader pool; _readers holds every open reader, idle or borrowed
+        self._idle_readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._readers: List[sqlite3.Connection] = []
+        self._max_readers = self._settings["max_connections"]
         
-    def _create_connection(self) -> sqlite3.Connection:
+    def _create_connection(self, read_only: bool = False) -> sqlite3.Connection:
         """Create a new database connection with optimized settings"""
         conn = sqlite3.connect(
-            DB_PATH,
-            timeout=self._settings["connection_timeout"]
+            self.db_path,
+            timeout=self._settings["connection_timeout"],
+            check_same_thread=False,
+            # The writer issues BEGIN/COMMIT itself
+            isolation_level=None if not read_only else ""
         )
+        conn.row_factory = sqlite3.Row
         
-        # Optimize connection settings
+        # Optimize connection settings (applied once, connections are reused)
         conn.execute(f"PRAGMA journal_mode = {self._settings['journal_mode']}")
         conn.execute(f"PRAGMA cache_size = {self._settings['cache_size']}")
         conn.execute(f"PRAGMA page_size = {self._settings['page_size']}")
         conn.execute(f"PRAGMA temp_store = {self._settings['temp_store']}")
         conn.execute("PRAGMA synchronous = NORMAL")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
         
         return conn
         
-    def _cleanup_old_connections(self):
-        """Clean up unused connections to free memory"""
-        current_time = time.time()
-        if current_time - self._last_cleanup < self._cleanup_interval:
+    # Writer
+    
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
             return
-            
         with self._lock:
-            for thread_id in list(self._connections.keys()):
-                try:
-                    self._connections[thread_id].execute("SELECT 1")
-                except (sqlite3.Error, Exception):
-                    try:
-                        self._connections[thread_id].close()
-                    except Exception:
-                        pass
-                    del self._connections[thread_id]
-            
-        self._last_cleanup = current_time
-        
-    @contextmanager
-    def get_connection(self) -> sqlite3.Connection:
-        """Get a database connection for the current thread"""
-        thread_id = threading.get_ident()
-        
-        # Clean up old connections periodically
-        self._cleanup_old_connections()
-        
-        with self._lock:
-            # Check if we need to create a new connection
-            if thread_id not in self._connections:
-                # Limit total connections
-                if len(self._connections) >= self._settings["max_connections"]:
-                    # Remove oldest connection if we're at the limit
-                    oldest_thread = next(iter(self._connections))
-                    try:
-                        self._connections[oldest_thread].close()
-                    except Exception:
-                        pass
-                    del self._connections[oldest_thread]
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._writer_loop,
+                    name="chinatsu-db-writer",
+                    daemon=True
+                )
+                self._writer.start()
                 
-                # Create new connection
-                self._connections[thread_id] = self._create_connection()
+    def _writer_loop(self):
+        conn = self._create_connection()
+        try:
+            while True:
+                job = self._write_queue.get()
+                if job is None:
+                    return
+                if job.exclusive:
+                    self._run_exclusive(conn, job)
+                    continue
+                    
+                # Group whatever else is already waiting into the same transaction
+                batch = [job]
+                stop = False
+                while len(batch) < self._batch_size:
+                    try:
+                        queued = self._write_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if queued is None:
+                        stop = True
+                        break
+                    if queued.exclusive:
+                        self._run_batch(conn, batch)
+                        self._run_exclusive(conn, queued)
+                        batch = []
+                        break
+                    batch.append(queued)
+                if batch:
+                    self._run_batch(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
             
-            connection = self._connections[thread_id]
-        
+    def _run_exclusive(self, conn: sqlite3.Connection, job: _WriteJob):
+        """Run a job that manages its own transaction"""
+        if not job.future.set_running_or_notify_cancel():
+            return
         try:
-            yield connection
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e):
-                # Handle database locks gracefully
-                logging.warning("Database lock detected, retrying operation...")
-                time.sleep(1)
-                yield connection
-            else:
-                raise
+            job.future.set_result(job.fn(conn))
         except Exception as e:
             logging.error(f"Database error: {e}")
-            raise
-        finally:
-            # Commit any pending transactions
+            # Don't leave the job's transaction open under every later batch
+            if conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+            job.future.set_exception(e)
+            
+    def _run_batch(self, conn: sqlite3.Connection, batch: List[_WriteJob]):
+        """Run a group of jobs in one transaction, one savepoint per job"""
+        done = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            logging.error(f"Could not start write transaction: {e}")
+            for job in batch:
+                if job.future.set_running_or_notify_cancel():
+                    job.future.set_exception(e)
+            return
+            
+        for job in batch:
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                conn.execute("SAVEPOINT job")
+            except sqlite3.Error as e:
+                logging.error(f"Could not start job savepoint: {e}")
+                job.future.set_exception(e)
+                self._fail_batch(conn, done, batch[batch.index(job) + 1:], e)
+                return
             try:
-                connection.commit()
+                result = job.fn(conn)
+                conn.execute("RELEASE job")
+                done.append((job, result))
             except Exception as e:
-                logging.error(f"Error committing transaction: {e}")
+                logging.error(f"Database error: {e}")
+                job.future.set_exception(e)
+                try:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                except sqlite3.Error:
+                    # The whole transaction was aborted; fail the rest of the batch
+                    self._fail_batch(conn, done, batch[batch.index(job) + 1:], e)
+                    return
                 
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Error committing transaction: {e}")
+            self._abort_batch(conn, done, e)
+            return
+            
+        # Only report success once the data is durable and visible to readers
+        for job, result in done:
+            job.future.set_result(result)
+            
+    def _fail_batch(self, conn: sqlite3.Connection, done: list, remaining: List[_WriteJob], error: Exception):
+        """Abort the batch's transaction and fail the jobs that had not run yet"""
+        self._abort_batch(conn, done, error)
+        for job in remaining:
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_exception(error)
+                
+    def _abort_batch(self, conn: sqlite3.Connection, done: list, error: Exception):
+        """Roll back the open transaction and fail the jobs that had succeeded in it"""
+        if conn.in_transaction:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+        for job, _ in done:
+            job.future.set_exception(error)
+            
+    def submit(self, fn: Callable[[sqlite3.Connection], Any], exclusive: bool = False) -> Future:
+        """
+        Queue fn(conn) for the writer thread.
+        Regular jobs share a transaction with other queued writes and must not
+        commit; exclusive jobs run alone and manage their own transaction.
+        """
+        self._ensure_writer()
+        job = _WriteJob(fn, exclusive)
+        self._write_queue.put(job)
+        return job.future
+        
+    def submit_write(self, query: str, params: tuple = ()) -> Future:
+        """Queue a single write statement; the future resolves to the row count"""
+        return self.submit(lambda conn: conn.execute(query, params).rowcount)
+        
+    def submit_many(self, query: str, params_seq: Iterable[Sequence[Any]]) -> Future:
+        """Queue an executemany; the future resolves to the row count"""
+        params_seq = list(params_seq)
+        return self.submit(lambda conn: conn.executemany(query, params_seq).rowcount)
+        
+    # Readers
+    
+    @contextmanager
+    def read_connection(self) -> sqlite3.Connection:
+        """Borrow a query-only connection from the reader pool"""
+        try:
+            conn = self._idle_readers.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if len(self._readers) < self._max_readers:
+                    conn = self._create_connection(read_only=True)
+                    self._readers.append(conn)
+            if conn is None:
+                try:
+                    conn = self._idle_readers.get(timeout=self._settings["connection_timeout"])
+                except queue.Empty:
+                    raise sqlite3.OperationalError("Timed out waiting for a reader connection")
+                    
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                # A reader borrowed across close_all() is closed, not pooled again
+                retired = conn not in self._readers
+                if not retired:
+                    self._idle_readers.put(conn)
+            if retired:
+                conn.close()
+            
+    def fetch(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """Run a read query on a pooled reader"""
+        with self.read_connection() as conn:
+            return conn.execute(query, params).fetchall()
+            
     def close_all(self):
-        """Close all database connections"""
+        """
+        Stop the writer (after it drains its queue) and close all connections.
+        Readers still borrowed are closed when they are returned.
+        """
         with self._lock:
-            for conn in self._connections.values():
+            writer = self._writer
+            self._writer = None
+        if writer is not None and writer.is_alive():
+            self._write_queue.put(None)
+            writer.join()
+            
+        with self._lock:
+            while True:
+                try:
+                    conn = self._idle_readers.get_nowait()
+                except queue.Empty:
+                    break
                 try:
                     conn.close()
                 except Exception:
                     pass
-            self._connections.clear()
+            self._readers.clear()
             
 # Global connection manager instance
-db_manager = DatabaseConnectionManager() 
\ No newline at end of file
+db_manager = DatabaseConnectionManager()
\ No newline at end of file
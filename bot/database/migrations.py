@@ -0,0 +1,377 @@
+import sqlite3
+import logging
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger('chinatsu.db')
+
+def _baseline_schema(conn: sqlite3.Connection):
+    """Single canonical definition of every table"""
+    # User relations table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS relations_users (
+            user_id INTEGER PRIMARY KEY,
+            reputation INTEGER DEFAULT 0,
+            interactions INTEGER DEFAULT 0,
+            last_interaction TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Conversation log with sentiment
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            user_message TEXT,
+            bot_response TEXT,
+            sentiment_score REAL DEFAULT 0,
+            sentiment_reasons TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES relations_users(user_id)
+        )
+    """)
+    
+    # User personality traits
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_personality (
+            user_id INTEGER,
+            trait_type TEXT,
+            trait_value TEXT,
+            confidence REAL DEFAULT 0.1,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, trait_type),
+            FOREIGN KEY (user_id) REFERENCES relations_users(user_id)
+        )
+    """)
+    
+    # Response patterns (input_pattern must be unique for the ON CONFLICT upsert)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS response_patterns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            input_pattern TEXT UNIQUE,
+            response_template TEXT,
+            success_rate REAL DEFAULT 0.0,
+            usage_count INTEGER DEFAULT 0,
+            last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Dialogue patterns from manga
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dialogue_patterns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            context_type TEXT,
+            input_pattern TEXT,
+            response_template TEXT,
+            emotion TEXT DEFAULT 'neutral',
+            usage_count INTEGER DEFAULT 1,
+            source TEXT DEFAULT 'blue_box',
+            chapter INTEGER,
+            page INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(input_pattern, response_template)
+        )
+    """)
+    
+    # Character traits and personality
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS character_traits (
+            trait_type TEXT,
+            trait_name TEXT,
+            trait_value REAL DEFAULT 0.5,
+            confidence REAL DEFAULT 1.0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (trait_type, trait_name)
+        )
+    """)
+    
+    # Learned word chains
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS word_chains (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            word1 TEXT,
+            word2 TEXT,
+            next_word TEXT,
+            frequency INTEGER DEFAULT 1,
+            context_type TEXT DEFAULT 'general',
+            UNIQUE(word1, word2, next_word, context_type)
+        )
+    """)
+    
+    # Server activation status
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS server_activation (
+            server_id TEXT PRIMARY KEY,
+            active INTEGER DEFAULT 1,
+            last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Channel activation status
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS channel_activation (
+            channel_id TEXT PRIMARY KEY,
+            active INTEGER DEFAULT 1,
+            last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Content filter settings
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS filter_settings (
+            server_id TEXT PRIMARY KEY,
+            filter_enabled INTEGER DEFAULT 1,
+            mature_enabled INTEGER DEFAULT 0,
+            mature_level INTEGER DEFAULT 1,
+            last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _unify_response_patterns(conn: sqlite3.Connection):
+    """
+    Rebuild response_patterns created by either legacy DDL.
+    One shape keyed input_pattern as PRIMARY KEY (no id column, breaking exports),
+    the other had an id but no uniqueness (breaking the ON CONFLICT upsert).
+    Duplicates are merged: usage summed, success_rate weighted by usage.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(response_patterns)")]
+    unique_on_input = any(
+        index[2] and [col[2] for col in conn.execute(f"PRAGMA index_info('{index[1]}')")] == ["input_pattern"]
+        for index in conn.execute("PRAGMA index_list(response_patterns)")
+    )
+    if "id" in columns and unique_on_input:
+        return
+        
+    conn.execute("DROP INDEX IF EXISTS idx_patterns")
+    conn.execute("ALTER TABLE response_patterns RENAME TO response_patterns_legacy")
+    _baseline_schema(conn)
+    conn.execute("""
+        INSERT INTO response_patterns
+        (input_pattern, response_template, success_rate, usage_count, last_used)
+        SELECT
+            input_pattern,
+            (SELECT response_template FROM response_patterns_legacy latest
+             WHERE latest.input_pattern = legacy.input_pattern
+             ORDER BY latest.last_used DESC LIMIT 1),
+            CASE WHEN SUM(usage_count) > 0
+                 THEN SUM(success_rate * usage_count) / SUM(usage_count)
+                 ELSE MAX(success_rate) END,
+            SUM(usage_count),
+            MAX(last_used)
+        FROM response_patterns_legacy legacy
+        GROUP BY input_pattern
+    """)
+    conn.execute("DROP TABLE response_patterns_legacy")
+
+def _hot_query_indexes(conn: sqlite3.Connection):
+    """Indexes chosen from QUERY_CATALOG"""
+    # log_interaction sentiment update and /relations aggregates (user_id prefix)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversation_user_message
+        ON conversation_log(user_id, user_message)
+    """)
+    # get_character_response: equality on both columns, ordered by usage
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_dialogue_context_emotion_usage
+        ON dialogue_patterns(context_type, emotion, usage_count DESC)
+    """)
+    # Superseded by the UNIQUE(word1, word2, next_word, context_type) autoindex
+    conn.execute("DROP INDEX IF EXISTS idx_word_chains")
+    # Superseded by the UNIQUE(input_pattern) autoindex
+    conn.execute("DROP INDEX IF EXISTS idx_patterns")
+
+def _guild_filter_rules(conn: sqlite3.Connection):
+    """Per-guild custom block/allow terms, versioned through filter_settings"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS filter_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            server_id TEXT NOT NULL,
+            rule_type TEXT NOT NULL CHECK (rule_type IN ('block', 'allow')),
+            term TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(server_id, rule_type, term)
+        )
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(filter_settings)")}
+    if "rules_version" not in columns:
+        conn.execute("ALTER TABLE filter_settings ADD COLUMN rules_version INTEGER DEFAULT 0")
+
+def _conversation_flags(conn: sqlite3.Connection):
+    """Moderation flags written back by the history re-scan"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(conversation_log)")}
+    if "flagged" not in columns:
+        conn.execute("ALTER TABLE conversation_log ADD COLUMN flagged INTEGER DEFAULT 0")
+    if "flag_reason" not in columns:
+        conn.execute("ALTER TABLE conversation_log ADD COLUMN flag_reason TEXT")
+
+def _response_cache_opt_out(conn: sqlite3.Connection):
+    """Per-guild switch for reusing cached replies"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(filter_settings)")}
+    if "response_cache" not in columns:
+        conn.execute("ALTER TABLE filter_settings ADD COLUMN response_cache INTEGER DEFAULT 1")
+
+def _conversation_guild(conn: sqlite3.Connection):
+    """Guild of each logged message, so a history re-scan applies only that guild's rules"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(conversation_log)")}
+    if "server_id" not in columns:
+        # Rows logged before this have no guild; they are re-scanned with the defaults
+        conn.execute("ALTER TABLE conversation_log ADD COLUMN server_id TEXT")
+    # History scan pages: one guild's rows in id order
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversation_server_id
+        ON conversation_log(server_id, id)
+    """)
+
+def _conversation_timestamp_index(conn: sqlite3.Connection):
+    """Retention ages out conversation_log oldest first without scanning the table"""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversation_timestamp
+        ON conversation_log(timestamp)
+    """)
+
+# (version, name, upgrade); append only, never renumber
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "baseline_schema", _baseline_schema),
+    (2, "unify_response_patterns", _unify_response_patterns),
+    (3, "hot_query_indexes", _hot_query_indexes),
+    (4, "guild_filter_rules", _guild_filter_rules),
+    (5, "conversation_flags", _conversation_flags),
+    (6, "response_cache_opt_out", _response_cache_opt_out),
+    (7, "conversation_guild", _conversation_guild),
+    (8, "conversation_timestamp_index", _conversation_timestamp_index),
+]
+
+# Hot queries as issued by the bot; every one must be served by an index
+QUERY_CATALOG: List[Tuple[str, str, tuple]] = [
+    ("get_user", "SELECT * FROM relations_users WHERE user_id = ?", (1,)),
+    ("filter_settings", "SELECT * FROM filter_settings WHERE server_id = ?", ("1",)),
+    ("filter_rules", "SELECT rule_type, term FROM filter_rules WHERE server_id = ?", ("1",)),
+    ("response_pattern_upsert", """
+        INSERT INTO response_patterns (input_pattern, response_template, success_rate)
+        VALUES (?, ?, 1.0)
+        ON CONFLICT(input_pattern) DO UPDATE SET
+            response_template = excluded.response_template,
+            usage_count = usage_count + 1,
+            success_rate = (success_rate * usage_count + 1.0) / (usage_count + 1),
+            last_used = CURRENT_TIMESTAMP
+    """, ("hi", "hello")),
+    ("response_cache_lookup", """
+        SELECT response_template, (julianday('now') - julianday(last_used)) * 86400 AS age
+        FROM response_patterns
+        WHERE input_pattern = ? AND success_rate >= ? AND usage_count >= ?
+            AND last_used >= datetime('now', ?)
+    """, ("hi", 0.8, 1, "-21600 seconds")),
+    ("response_pattern_success", """
+        UPDATE response_patterns
+        SET success_rate = (success_rate * usage_count + 1.0) / (usage_count + 1),
+            usage_count = usage_count + 1
+        WHERE input_pattern = ?
+    """, ("hi",)),
+    ("conversation_sentiment_update", """
+        UPDATE conversation_log
+        SET sentiment_score = ?
+        WHERE user_id = ? AND user_message = ?
+    """, (0.5, 1, "hi")),
+    ("conversation_scan_page", """
+        SELECT id, user_message, flagged
+        FROM conversation_log
+        WHERE server_id IS ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+    """, ("1", 0, 2000)),
+    ("conversation_age", """
+        SELECT id FROM conversation_log WHERE timestamp < datetime('now', ?) ORDER BY timestamp LIMIT ?
+    """, ("-30 days", 500)),
+    ("conversation_user_stats", """
+        SELECT COUNT(*) as count,
+               SUM(CASE WHEN sentiment_score > 0 THEN 1 ELSE 0 END) as positive_count,
+               SUM(CASE WHEN sentiment_score < 0 THEN 1 ELSE 0 END) as negative_count
+        FROM conversation_log
+        WHERE user_id = ?
+    """, (1,)),
+    ("character_response", """
+        SELECT response_template, usage_count
+        FROM dialogue_patterns
+        WHERE context_type = ? AND emotion = ?
+        ORDER BY usage_count DESC
+        LIMIT 5
+    """, ("general", "neutral")),
+    ("dialogue_upsert", """
+        INSERT INTO dialogue_patterns 
+        (context_type, input_pattern, response_template, emotion, usage_count)
+        VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT(input_pattern, response_template) DO UPDATE SET
+            usage_count = usage_count + 1
+    """, ("general", "hi", "hi", "neutral")),
+    ("word_chain_upsert", """
+        INSERT INTO word_chains (word1, word2, next_word, context_type, frequency)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(word1, word2, next_word, context_type) DO UPDATE SET
+            frequency = frequency + excluded.frequency
+    """, ("", "", "hi", "general", 1)),
+    ("user_traits", """
+        SELECT trait_type, trait_value, confidence
+        FROM user_personality
+        WHERE user_id = ?
+        ORDER BY confidence DESC
+        LIMIT 5
+    """, (1,)),
+]
+
+# Queries whose sort only ever sees a handful of rows (a user has at most
+# three trait rows); an index for them would just slow down the upserts
+BOUNDED_SORTS = {"user_traits"}
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Highest applied migration version (0 for a fresh database)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations, each in its own transaction. Returns the schema version."""
+    if conn.in_transaction:
+        conn.commit()
+    version = get_schema_version(conn)
+    for target, name, upgrade in MIGRATIONS:
+        if target <= version:
+            continue
+        # Take the write lock first, then re-check in case another process won the race
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (target,)).fetchone():
+                conn.rollback()
+                continue
+            upgrade(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                (target, name)
+            )
+            conn.commit()
+            logger.info(f"Applied schema migration {target}: {name}")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Schema migration {target} ({name}) failed: {e}")
+            raise
+        version = target
+    return version
+
+def explain_problems(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+    """
+    Run EXPLAIN QUERY PLAN over QUERY_CATALOG and return (query, plan step)
+    for every full table scan or temp b-tree sort.
+    """
+    problems = []
+    for name, query, params in QUERY_CATALOG:
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params):
+            detail = row[3]
+            full_scan = detail.startswith("SCAN ") and " USING " not in detail
+            temp_sort = "TEMP B-TREE" in detail and name not in BOUNDED_SORTS
+            if full_scan or temp_sort:
+                problems.append((name, detail))
+    return problems
\ No newline at end of file
@@ -1,10 +1,20 @@
 import discord
 from discord.ext import commands
+import asyncio
 import os
 import logging
 from pathlib import Path
-from .database.models import LearningData
-from .services.dialogue_training import DialogueTrainer
+from .database.models import initialize_database
+from .database.async_db import async_db
+from .database.connection import db_manager
+from .services.dialouge_training import DialogueTrainer
+from .services.message_analysis import MessageAnalysis
+from .services.settings_cache import settings_cache
+from .services.user_cache import user_cache
+from .services.retention import retention_engine
+from .services.backup import backup_scheduler
+from .services.response_gen import response_generator
+from .services.streaming_reply import StreamingReply
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -23,6 +33,8 @@ class ChinatsuBot(commands.Bot):
         )
         
         self.dialogue_trainer = DialogueTrainer()
+        # Replies are made from learned dialogue while the API is unavailable
+        response_generator.dialogue_trainer = self.dialogue_trainer
         self.ready = False
         
     async def setup_hook(self):
@@ -32,6 +44,9 @@ class ChinatsuBot(commands.Bot):
         
         # Initialize database
         await self.init_database()
+
+        # Pooled HTTP session for the completions API
+        await response_generator.start()
         
     async def load_extensions(self):
         """Load all cog extensions"""
@@ -47,10 +62,28 @@ class ChinatsuBot(commands.Bot):
     async def init_database(self):
         """Initialize the database connection and tables"""
         try:
-            await LearningData.init_db()
+            # Schema setup is synchronous; keep it off the event loop
+            await asyncio.to_thread(initialize_database)
+            await async_db.connect()
+            self.dialogue_trainer.ingest_buffer.start()
+            user_cache.start()
+            retention_engine.start()
+            backup_scheduler.start()
             logger.info('Database initialized successfully')
         except Exception as e:
             logger.error(f'Failed to initialize database: {e}')
+            
+    async def close(self):
+        """Flush queued learning data, close the HTTP session and the database on shutdown"""
+        await super().close()
+        await response_generator.stop()
+        await retention_engine.stop()
+        await backup_scheduler.stop()
+        await self.dialogue_trainer.ingest_buffer.stop()
+        await user_cache.stop()
+        await async_db.disconnect()
+        # Let the writer thread drain its queue before exiting
+        await asyncio.to_thread(db_manager.close_all)
     
     async def on_ready(self):
         """Event handler for when the bot is ready"""
@@ -79,11 +112,29 @@ class ChinatsuBot(commands.Bot):
         
         # If not a command and not in DMs, process as dialogue
         if not message.content.startswith(self.command_prefix) and message.guild:
+            # Respect /activate and /deactivate (cached, no query per message)
+            if not await settings_cache.is_server_active(message.guild.id):
+                return
+            if not await settings_cache.is_channel_active(message.channel.id):
+                return
+                
+            analysis = MessageAnalysis(message.content)
+            
+            # Answer direct mentions, showing the reply while it is generated
+            if self.user in message.mentions:
+                reply = StreamingReply(message.channel.send)
+                response, _ = await response_generator.generate_response(
+                    message.content, message.author.id, str(message.guild.id),
+                    analysis=analysis, mentioned=True, reply=reply
+                )
+                await reply.finish(response)
+                
             # Add message to learning data if appropriate
             if message.content and len(message.content) > 3:
-                self.dialogue_trainer.add_dialogue_entry(
+                await self.dialogue_trainer.add_dialogue_entry(
                     context="general",
-                    dialogue=message.content
+                    dialogue=message.content,
+                    analysis=analysis
                 )
 
 def run_bot():
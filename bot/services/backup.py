@@ -0,0 +1,151 @@
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+from ..config import BACKUP_SETTINGS, DB_BACKUP_PATH, DB_PATH
+
+logger = logging.getLogger('chinatsu.backup')
+
+class BackupScheduler:
+    """
+    Scheduled hot backups through the SQLite online backup API.
+    Copies run in page-sized steps on a worker thread from their own read
+    connection, so message handling and the writer thread keep going.
+    Snapshots are rotated to keep_backups; one larger than max_backup_size is
+    gzip-compressed, and refused if it is still too large.
+    """
+    
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        backup_path: str = DB_BACKUP_PATH,
+        interval: float = BACKUP_SETTINGS["interval"],
+        keep_backups: int = BACKUP_SETTINGS["keep_backups"],
+        max_backup_size: int = BACKUP_SETTINGS["max_backup_size"],
+        step_pages: int = BACKUP_SETTINGS["step_pages"]
+    ):
+        self.db_path = db_path
+        backup = Path(backup_path)
+        self.backup_dir = backup.parent
+        # chinatsu-brain.backup.db -> chinatsu-brain.backup.<timestamp>.db
+        self.prefix = backup.stem + "."
+        self.suffix = backup.suffix or ".db"
+        self.interval = interval
+        self.keep_backups = keep_backups
+        self.max_backup_size = max_backup_size
+        self.step_pages = step_pages
+        self._lock = asyncio.Lock()
+        self._loop_task: Optional[asyncio.Task] = None
+        
+        # Metrics
+        self.last_backup: Optional[str] = None
+        self.last_duration = 0.0
+        self.failures = 0
+        
+    def _backup_files(self) -> List[Path]:
+        """Existing snapshots, newest first"""
+        files = [
+            path for path in self.backup_dir.glob(f"{self.prefix}*")
+            if path.name.endswith(self.suffix) or path.name.endswith(self.suffix + ".gz")
+        ]
+        return sorted(files, key=lambda path: path.stat().st_mtime, reverse=True)
+        
+    def _copy(self, target: Path):
+        """Blocking online backup; runs on a worker thread"""
+        source = sqlite3.connect(self.db_path)
+        dest = sqlite3.connect(str(target))
+        try:
+            source.backup(dest, pages=self.step_pages, sleep=0)
+        finally:
+            dest.close()
+            source.close()
+            
+    def _compress(self, path: Path) -> Path:
+        compressed = path.with_name(path.name + ".gz")
+        with open(path, "rb") as src, gzip.open(compressed, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        path.unlink()
+        return compressed
+        
+    def _rotate(self):
+        for stale in self._backup_files()[self.keep_backups:]:
+            try:
+                stale.unlink()
+            except OSError as e:
+                logger.error(f"Failed to remove old backup {stale}: {e}")
+                
+    def _snapshot(self, reason: str) -> Optional[Path]:
+        """Take, size-check and rotate one snapshot; runs on a worker thread"""
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        target = self.backup_dir / f"{self.prefix}{stamp}{self.suffix}"
+        partial = target.with_name(target.name + ".partial")
+        
+        self._copy(partial)
+        os.replace(partial, target)
+        
+        if target.stat().st_size > self.max_backup_size:
+            target = self._compress(target)
+            if target.stat().st_size > self.max_backup_size:
+                target.unlink()
+                raise RuntimeError(
+                    f"backup exceeds max_backup_size even compressed "
+                    f"({self.max_backup_size / (1024 * 1024):.0f}MB)"
+                )
+                
+        self._rotate()
+        logger.info(f"Backup ({reason}) written to {target}")
+        return target
+        
+    async def snapshot(self, reason: str = "scheduled") -> Optional[Path]:
+        """Take a fresh backup without blocking the event loop; None on failure"""
+        async with self._lock:
+            start = time.perf_counter()
+            try:
+                path = await asyncio.to_thread(self._snapshot, reason)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Backup ({reason}) failed: {e}")
+                return None
+            self.last_duration = time.perf_counter() - start
+            self.last_backup = str(path)
+            return path
+            
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.snapshot()
+            
+    def start(self):
+        """Start the periodic backup task on the running loop"""
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.get_running_loop().create_task(self._run())
+            
+    async def stop(self):
+        """Stop the periodic task (an in-progress copy finishes first)"""
+        if self._loop_task:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        async with self._lock:
+            pass
+            
+    def stats(self) -> Dict[str, Any]:
+        """Last backup and failure count"""
+        return {
+            "last_backup": self.last_backup,
+            "last_duration_ms": self.last_duration * 1000,
+            "failures": self.failures,
+            "backups": len(self._backup_files()) if self.backup_dir.exists() else 0
+        }
+
+# Global backup scheduler instance
+backup_scheduler = BackupScheduler()
\ No newline at end of file
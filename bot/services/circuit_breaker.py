@@ -0,0 +1,142 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from ..config import CIRCUIT_BREAKER_SETTINGS
+
+logger = logging.getLogger('chinatsu.circuit_breaker')
+
+# Breaker states
+CLOSED = "closed"          # Calls go through
+OPEN = "open"              # Calls are refused until open_seconds have passed
+HALF_OPEN = "half_open"    # A few probe calls go through to test the API
+
+class CircuitBreaker:
+    """
+    Stops calling an API that is failing or too slow, so callers fall back
+    at once instead of piling up behind retries and timeouts.
+    Outcomes of the last window calls are kept. The breaker opens once
+    min_calls are in and failure_rate of them failed, or slow_rate of them
+    took longer than slow_call_seconds (to the first token), or right away
+    after max_consecutive_failures in a row. After open_seconds it lets
+    half_open_probes calls through; if they all succeed it closes (with a
+    fresh window), and a single failure opens it again.
+    allow() hands every call it lets through a token, which must be passed
+    back to record() or, if the call ended without telling anything about
+    the API (cancelled, rate limited), release(). Tokens name the state the
+    call was let through in: one from before the last change of state is
+    ignored, so a call started while closed cannot count as a probe.
+    """
+
+    def __init__(self, window: int = CIRCUIT_BREAKER_SETTINGS["window"],
+                 min_calls: int = CIRCUIT_BREAKER_SETTINGS["min_calls"],
+                 failure_rate: float = CIRCUIT_BREAKER_SETTINGS["failure_rate"],
+                 slow_call_seconds: float = CIRCUIT_BREAKER_SETTINGS["slow_call_seconds"],
+                 slow_rate: float = CIRCUIT_BREAKER_SETTINGS["slow_rate"],
+                 max_consecutive_failures: int = CIRCUIT_BREAKER_SETTINGS["max_consecutive_failures"],
+                 open_seconds: float = CIRCUIT_BREAKER_SETTINGS["open_seconds"],
+                 half_open_probes: int = CIRCUIT_BREAKER_SETTINGS["half_open_probes"]):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        # (succeeded, slow) per call, most recent last
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_started = 0
+        self._probes_passed = 0
+        # Bumped on every change of state; a token from an older one is stale
+        self._generation = 0
+
+        # Metrics
+        self.opened = 0
+        self.rejected = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    def allow(self) -> Optional[int]:
+        """A token for a call that may go to the API now, or None if it may not"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return None
+            self._set_state(HALF_OPEN)
+            self._probes_started = 0
+            self._probes_passed = 0
+            logger.info("API circuit half open, probing")
+        if self.state == HALF_OPEN:
+            if self._probes_started >= self.half_open_probes:
+                self.rejected += 1
+                return None
+            self._probes_started += 1
+        return self._generation
+
+    def release(self, token: int):
+        """A call allow() let through ended without an outcome"""
+        if (token == self._generation and self.state == HALF_OPEN and
+                self._probes_started > self._probes_passed):
+            self._probes_started -= 1
+
+    def record(self, token: int, succeeded: bool, latency: float):
+        """The outcome of a call allow() let through, and its latency in seconds"""
+        slow = latency > self.slow_call_seconds
+        if not succeeded:
+            self.failures += 1
+        if slow:
+            self.slow_calls += 1
+
+        if token != self._generation:
+            # Let through before the last change of state (e.g. before the breaker opened)
+            return
+        if self.state == HALF_OPEN:
+            if not succeeded or slow:
+                self._open()
+                return
+            self._probes_passed += 1
+            if self._probes_passed >= self.half_open_probes:
+                self._set_state(CLOSED)
+                self._outcomes.clear()
+                self._consecutive_failures = 0
+                logger.info("API circuit closed")
+            return
+
+        self._outcomes.append((succeeded, slow))
+        self._consecutive_failures = 0 if succeeded else self._consecutive_failures + 1
+        calls = len(self._outcomes)
+        failed = sum(1 for ok, _ in self._outcomes if not ok)
+        slowed = sum(1 for _, is_slow in self._outcomes if is_slow)
+        if (self._consecutive_failures >= self.max_consecutive_failures or
+                (calls >= self.min_calls and (failed >= calls * self.failure_rate or slowed >= calls * self.slow_rate))):
+            self._open()
+
+    def _set_state(self, state: str):
+        self.state = state
+        self._generation += 1
+
+    def _open(self):
+        self._set_state(OPEN)
+        self._opened_at = time.monotonic()
+        self.opened += 1
+        logger.warning(f"API circuit open for {self.open_seconds:g}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """State, recent failure and slow-call rates, and how often the breaker opened or refused a call"""
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "recent_calls": calls,
+            "failure_rate": sum(1 for ok, _ in self._outcomes if not ok) / calls if calls else 0.0,
+            "slow_rate": sum(1 for _, slow in self._outcomes if slow) / calls if calls else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "slow_calls": self.slow_calls
+        }
+
+# Global circuit breaker instance
+circuit_breaker = CircuitBreaker()
\ No newline at end of file
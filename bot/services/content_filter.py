@@ -1,175 +1,272 @@
 import re
 import json
+import asyncio
 import logging
-from typing import Dict, Tuple, List, Set
-from ..database.models import ServerSettings
-from ..config import GENERATION_LIMITS
+from bisect import bisect_right
+from concurrent.futures import Executor
+from typing import Dict, Tuple, List, Optional, Sequence, Set
+from .guild_rules import GuildRules, GuildRuleCache, guild_rules
+from .keyword_matcher import KeywordMatcher, KeywordHit
+from .message_analysis import MessageAnalysis
+from .settings_cache import settings_cache
+from .verdict_cache import VerdictCache, verdict_cache
+from ..config import GENERATION_LIMITS, HISTORY_SCAN_SETTINGS, STREAM_FILTER_SETTINGS
 
 class ContentFilter:
-    def __init__(self):
-        # Load filter patterns
-        self.jailbreak_patterns: Set[str] = {
-            r"ignore previous instructions",
-            r"ignore all rules",
-            r"ignore your rules",
-            r"ignore your programming",
-            r"ignore your ethical constraints",
-            r"bypass your filters",
-            r"disable your filters",
-            r"override your settings",
-            r"change your personality",
-            r"new personality",
-            r"act as a different",
-            r"pretend you are",
-            r"stop being",
-            r"don't be",
-            r"ignore your role",
-            r"break character",
-            r"exit character",
-            r"leave character",
-            r"drop character"
+    def __init__(self, verdicts: VerdictCache = verdict_cache, rules: GuildRuleCache = guild_rules):
+        self.verdicts = verdicts
+        self.rules = rules
+        # Last compiled (GuildRules, combined matcher) pair used by filter_batch
+        self._combined: Optional[Tuple[GuildRules, KeywordMatcher]] = None
+        
+        # Jailbreak phrases, matched anywhere in the message
+        self.jailbreak_keywords: Set[str] = {
+            "ignore previous instructions",
+            "ignore all rules",
+            "ignore your rules",
+            "ignore your programming",
+            "ignore your ethical constraints",
+            "bypass your filters",
+            "disable your filters",
+            "override your settings",
+            "change your personality",
+            "new personality",
+            "act as a different",
+            "pretend you are",
+            "stop being",
+            "don't be",
+            "ignore your role",
+            "break character",
+            "exit character",
+            "leave character",
+            "drop character"
         }
 
-        # Mature content patterns
-        self.mature_patterns: Dict[int, Set[str]] = {
+        # Mature content words by level, matched as whole words
+        self.mature_keywords: Dict[int, Set[str]] = {
             1: {  # Mild
-                r"\b(damn|hell|crap)\b",
-                r"\b(stupid|idiot|dumb)\b",
-                r"\b(suck|sucks|sucking)\b"
+                "damn", "hell", "crap",
+                "stupid", "idiot", "dumb",
+                "suck", "sucks", "sucking"
             },
             2: {  # Moderate
-                r"\b(fuck|shit|bitch|ass)\b",
-                r"\b(dick|cock|pussy)\b",
-                r"\b(nsfw|lewd|kinky)\b"
+                "fuck", "shit", "bitch", "ass",
+                "dick", "cock", "pussy",
+                "nsfw", "lewd", "kinky"
             },
             3: {  # Advanced
-                r"\b(explicit sexual terms)\b",
-                r"\b(extreme violence terms)\b",
-                r"\b(hardcore content terms)\b"
+                "explicit sexual terms",
+                "extreme violence terms",
+                "hardcore content terms"
             }
         }
 
-        # Safety patterns
-        self.unsafe_patterns: Set[str] = {
-            r"(sudo|rm -rf|del /f|format c:|mkfs)",  # System commands
-            r"(hack|crack|exploit|breach)",  # Security terms
-            r"(ddos|dos attack|flood attack)",  # Attack terms
-            r"(private key|password|credential)",  # Sensitive data
-            r"(token|api key|secret key)",  # API security
-            r"(social security|credit card|bank account)",  # Personal info
-            r"(dox|doxx|personal info)",  # Privacy violation
-            r"(gore|torture|murder)",  # Extreme violence
-            r"(cp|csam)",  # Illegal content
-            r"(token grab|ip grab|ip logger)"  # Malicious tools
+        # Safety keywords, matched anywhere in the message
+        self.unsafe_keywords: Set[str] = {
+            "sudo", "rm -rf", "del /f", "format c:", "mkfs",  # System commands
+            "hack", "crack", "exploit", "breach",  # Security terms
+            "ddos", "dos attack", "flood attack",  # Attack terms
+            "private key", "password", "credential",  # Sensitive data
+            "token", "api key", "secret key",  # API security
+            "social security", "credit card", "bank account",  # Personal info
+            "dox", "doxx", "personal info",  # Privacy violation
+            "gore", "torture", "murder",  # Extreme violence
+            "cp", "csam",  # Illegal content
+            "token grab", "ip grab", "ip logger"  # Malicious tools
         }
 
-    def detect_jailbreak(self, text: str) -> Tuple[bool, str]:
-        """
-        Detect potential jailbreak attempts in the text.
-        Returns (is_jailbreak, reason)
-        """
-        text = text.lower()
-        
-        # Check for direct jailbreak patterns
-        for pattern in self.jailbreak_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                return True, f"Detected jailbreak attempt pattern: {pattern}"
-
-        # Check for suspicious combinations
-        suspicious_pairs = [
+        # Suspicious (base, modifier) combinations, checked in this order
+        self.suspicious_pairs: List[Tuple[str, str]] = [
             (r"system prompt", r"change|modify|update|ignore"),
             (r"instructions", r"ignore|bypass|override"),
             (r"settings", r"change|modify|override"),
             (r"character", r"change|switch|modify")
         ]
         
-        for base, modifier in suspicious_pairs:
-            if re.search(f"{base}.*{modifier}|{modifier}.*{base}", text, re.IGNORECASE):
-                return True, f"Detected suspicious combination: {base} + {modifier}"
-
-        # Check for repetitive patterns that might be trying to overflow or confuse
-        if len(re.findall(r"(\b\w+\b)\s+\1{3,}", text)):
+        self._compile_patterns()
+        
+    # A run of this many identical characters counts as spam
+    SPAM_RUN_LENGTH = 11
+    
+    def _compile_patterns(self):
+        """Build the keyword automaton once, at construction"""
+        self._keywords = KeywordMatcher()
+        self._keywords.add_all(self.jailbreak_keywords, "jailbreak")
+        for level, keywords in self.mature_keywords.items():
+            self._keywords.add_all(keywords, "mature", weight=level, whole_word=True)
+        self._keywords.add_all(self.unsafe_keywords, "unsafe")
+        
+        # Suspicious pair sides carry their pair's index as the weight
+        for index, (base, modifier) in enumerate(self.suspicious_pairs):
+            self._keywords.add(base, "pair_base", weight=index)
+            self._keywords.add_all(modifier.split("|"), "pair_modifier", weight=index)
+        self._keywords.build()
+        
+        self._injection_re = re.compile(r"[;&|`$]")
+        
+    def _detect_suspicious_pair(self, lowered: str, hits: Dict[str, List[KeywordHit]]) -> int:
+        """
+        Index of the first suspicious pair whose base and modifier both occur,
+        without overlapping, on the same line (-1 if none). Works from hit
+        positions only, so it is linear where base.*modifier regexes backtrack.
+        """
+        if "pair_base" not in hits or "pair_modifier" not in hits:
+            return -1
+        newlines = [match.start() for match in re.finditer("\n", lowered)] if "\n" in lowered else []
+        
+        # Per (pair, line, side): earliest end and latest start. Some base and
+        # modifier are disjoint iff one side's earliest end <= the other's latest start.
+        spans: Dict[Tuple[int, int, str], Tuple[int, int]] = {}
+        for side in ("pair_base", "pair_modifier"):
+            for hit in hits[side]:
+                key = (int(hit.weight), bisect_right(newlines, hit.start), side)
+                first_end, last_start = spans.get(key, (hit.end, hit.start))
+                spans[key] = (min(first_end, hit.end), max(last_start, hit.start))
+                
+        found = -1
+        for (index, line, side), (base_end, base_start) in spans.items():
+            if side != "pair_base" or (found != -1 and index >= found):
+                continue
+            modifier = spans.get((index, line, "pair_modifier"))
+            if modifier and (base_end <= modifier[1] or modifier[0] <= base_start):
+                found = index
+        return found
+        
+    def _has_word_repetition(self, tokens: List[str]) -> bool:
+        """
+        A word followed, after whitespace only, by a word starting with three
+        copies of it ("ha hahaha"). One pass over the message tokens: any
+        other character between two words is a single-character token of its
+        own, which no word starts with.
+        """
+        previous = ""
+        for token in tokens:
+            if previous and len(token) >= 3 * len(previous) and token.startswith(previous * 3):
+                return True
+            previous = token
+        return False
+        
+    def _has_character_run(self, lowered: str) -> bool:
+        """
+        Whether any character other than a newline repeats SPAM_RUN_LENGTH times
+        in a row. Every such run covers a position that is a multiple of
+        SPAM_RUN_LENGTH - 1, so only those positions are probed, each with a
+        bounded find around it: linear, with no backtracking.
+        """
+        size = self.SPAM_RUN_LENGTH
+        for position in range(0, len(lowered), size - 1):
+            ch = lowered[position]
+            if ch != "\n" and lowered.find(ch * size, max(0, position - size + 1), position + size) != -1:
+                return True
+        return False
+        
+    def _detect_jailbreak(self, analysis: MessageAnalysis, hits: Dict[str, List[KeywordHit]]) -> Tuple[bool, str]:
+        if "jailbreak" in hits:
+            return True, f"Detected jailbreak attempt pattern: {hits['jailbreak'][0].keyword}"
+            
+        index = self._detect_suspicious_pair(analysis.casefolded, hits)
+        if index != -1:
+            base, modifier = self.suspicious_pairs[index]
+            return True, f"Detected suspicious combination: {base} + {modifier}"
+                    
+        if self._has_word_repetition(analysis.tokens):
             return True, "Detected repetitive pattern attempt"
-
+            
         return False, ""
+        
+    def _check_mature_content(self, hits: Dict[str, List[KeywordHit]], server_settings: Dict) -> Tuple[bool, int]:
+        if not server_settings.get("mature_enabled", False):
+            allowed = 0
+        else:
+            allowed = server_settings.get("mature_level", 1)
+            
+        # Report the lowest level above what the server allows
+        levels = [hit.weight for hit in hits.get("mature", ()) if hit.weight > allowed]
+        if not levels:
+            return False, 0
+        return True, int(min(levels))
+        
+    def _is_safe_content(self, lowered: str, hits: Dict[str, List[KeywordHit]], length: int) -> Tuple[bool, str]:
+        if "unsafe" in hits:
+            return False, f"Detected unsafe content pattern"
+        if self._injection_re.search(lowered):
+            return False, "Detected potential command injection characters"
+        if length > GENERATION_LIMITS["max_response_length"]:
+            return False, "Content exceeds maximum allowed length"
+        if self._has_character_run(lowered):
+            return False, "Detected spam-like repetitive content"
+        return True, ""
+
+    def detect_jailbreak(self, text: str) -> Tuple[bool, str]:
+        """
+        Detect potential jailbreak attempts in the text.
+        Returns (is_jailbreak, reason)
+        """
+        analysis = MessageAnalysis(text)
+        return self._detect_jailbreak(analysis, self._keywords.categories(analysis.casefolded))
 
     def check_mature_content(self, text: str, server_settings: Dict) -> Tuple[bool, int]:
         """
         Check if text contains mature content and at what level.
         Returns (contains_mature, level)
         """
-        if not server_settings.get("mature_enabled", False):
-            # Check against all patterns if mature content is disabled
-            for level in range(1, 4):
-                for pattern in self.mature_patterns[level]:
-                    if re.search(pattern, text, re.IGNORECASE):
-                        return True, level
-            return False, 0
-
-        # If mature content is enabled, only flag content above the allowed level
-        allowed_level = server_settings.get("mature_level", 1)
-        for level in range(allowed_level + 1, 4):
-            for pattern in self.mature_patterns[level]:
-                if re.search(pattern, text, re.IGNORECASE):
-                    return True, level
-        return False, 0
+        return self._check_mature_content(self._keywords.categories(MessageAnalysis(text).casefolded), server_settings)
 
     def is_safe_content(self, text: str) -> Tuple[bool, str]:
         """
         Check if the content is safe (no dangerous patterns).
         Returns (is_safe, reason)
         """
-        text = text.lower()
+        lowered = MessageAnalysis(text).casefolded
+        return self._is_safe_content(lowered, self._keywords.categories(lowered), len(text))
         
-        # Check against unsafe patterns
-        for pattern in self.unsafe_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                return False, f"Detected unsafe content pattern"
-
-        # Check for potential command injection
-        if re.search(r"[;&|`$]", text):
-            return False, "Detected potential command injection characters"
-
-        # Check for excessive length
-        if len(text) > GENERATION_LIMITS["max_response_length"]:
-            return False, "Content exceeds maximum allowed length"
-
-        # Check for spam-like content
-        if re.search(r"(.)\1{10,}", text):
-            return False, "Detected spam-like repetitive content"
-
-        return True, ""
-
-    async def filter_message(self, text: str, server_id: str = None) -> Dict:
+    def _verdict(self, analysis: MessageAnalysis, server_settings: Dict, rules: Optional[GuildRules] = None,
+                 combined: Optional[KeywordMatcher] = None, since: int = 0, until: Optional[int] = None) -> Tuple:
         """
-        Comprehensive message filtering.
-        Returns a dictionary with all check results.
+        (is_jailbreak, jailbreak_reason, has_mature, mature_level, is_safe, safety_reason, blocked_term)
+        combined, if given, is _combined_matcher(rules): one pass finds the
+        built-in and the custom hits together. since/until limit the keyword
+        hits that count to those ending in (since, until]; allowed terms
+        anywhere in the text still apply.
         """
-        # Get server settings if server_id is provided
-        server_settings = {}
-        if server_id:
-            try:
-                result = ServerSettings.execute_query(
-                    "SELECT * FROM filter_settings WHERE server_id = ?",
-                    (server_id,),
-                    fetch=True
-                )
-                if result:
-                    server_settings = {
-                        "filter_enabled": bool(result[0][1]),
-                        "mature_enabled": bool(result[0][2]),
-                        "mature_level": int(result[0][3])
-                    }
-            except Exception as e:
-                logging.error(f"Error fetching server settings: {e}")
-
-        # Perform all checks
-        is_jailbreak, jailbreak_reason = self.detect_jailbreak(text)
-        has_mature, mature_level = self.check_mature_content(text, server_settings)
-        is_safe, safety_reason = self.is_safe_content(text)
+        lowered = analysis.casefolded
+        if combined is not None:
+            hits = combined.categories(lowered)
+            custom = {category: hits.pop(category) for category in ("block", "allow") if category in hits}
+        else:
+            hits = self._keywords.categories(lowered)
+            custom = rules.scan(lowered) if rules is not None else {}
+        if since or until is not None:
+            until = len(lowered) if until is None else until
+            hits = {category: kept for category, group in hits.items()
+                    if (kept := [hit for hit in group if since < hit.end <= until])}
+            blocked = [hit for hit in custom.pop("block", ()) if since < hit.end <= until]
+            if blocked:
+                custom["block"] = blocked
+        blocked_term = ""
+        if "allow" in custom and hits:
+            hits = GuildRules.without_allowed(hits, custom["allow"])
+        if "block" in custom:
+            blocked_term = custom["block"][0].keyword
+        is_jailbreak, jailbreak_reason = self._detect_jailbreak(analysis, hits)
+        has_mature, mature_level = self._check_mature_content(hits, server_settings)
+        is_safe, safety_reason = self._is_safe_content(lowered, hits, analysis.length)
+        return is_jailbreak, jailbreak_reason, has_mature, mature_level, is_safe, safety_reason, blocked_term
 
+    def _combined_matcher(self, rules: GuildRules) -> KeywordMatcher:
+        """The built-in keywords and a guild's custom terms compiled into one automaton"""
+        matcher = KeywordMatcher()
+        matcher.extend(self._keywords)
+        matcher.extend(rules.matcher)
+        return matcher.build()
+        
+    def _result(self, verdict: Tuple, server_settings: Dict) -> Dict:
+        is_jailbreak, jailbreak_reason, has_mature, mature_level, is_safe, safety_reason, blocked_term = verdict
         return {
-            "is_filtered": is_jailbreak or (has_mature and not server_settings.get("mature_enabled", False)) or not is_safe,
+            "is_filtered": (
+                is_jailbreak or (has_mature and not server_settings.get("mature_enabled", False))
+                or not is_safe or bool(blocked_term)
+            ),
             "checks": {
                 "jailbreak": {
                     "detected": is_jailbreak,
@@ -183,10 +280,224 @@ class ContentFilter:
                 "safety": {
                     "is_safe": is_safe,
                     "reason": safety_reason if not is_safe else ""
+                },
+                "custom_rules": {
+                    "detected": bool(blocked_term),
+                    "term": blocked_term
                 }
             },
             "server_settings": server_settings
         }
+        
+    def scan(self, text: str, server_settings: Dict, rules: Optional[GuildRules] = None,
+             analysis: Optional[MessageAnalysis] = None) -> Dict:
+        """
+        Run every check over one casefolded, length-capped copy of the text,
+        with a single keyword automaton pass shared by all of them (plus one
+        over the guild's compiled custom rules, if any).
+        Returns the same dictionary as filter_message.
+        """
+        verdict = self._verdict(analysis or MessageAnalysis(text), server_settings, rules)
+        return self._result(verdict, server_settings)
+
+    async def _guild_context(self, server_id: Optional[str]) -> Tuple[Dict, int, bool, Optional[GuildRules]]:
+        """(server_settings, settings version, cacheable, compiled custom rules) for a guild"""
+        # The settings version is read first, so a verdict computed while an
+        # admin change lands is stored under the old version and never served again
+        server_settings = {}
+        version = 0
+        cacheable = True
+        if server_id:
+            version = settings_cache.filter_settings_version(server_id)
+            try:
+                server_settings = await settings_cache.get_filter_settings(server_id)
+            except Exception as e:
+                logging.error(f"Error fetching server settings: {e}")
+                cacheable = False
+                
+        # Compiled custom rules; possibly the previous version while a rebuild runs
+        rules = None
+        if server_settings.get("rules_version"):
+            rules = await self.rules.get(server_id, server_settings["rules_version"])
+        return server_settings, version, cacheable, rules
+
+    async def filter_message(self, text: str, server_id: str = None,
+                             analysis: Optional[MessageAnalysis] = None) -> Dict:
+        """
+        Comprehensive message filtering.
+        Pass the message's MessageAnalysis if the caller already built one.
+        Returns a dictionary with all check results.
+        """
+        server_settings, version, cacheable, rules = await self._guild_context(server_id)
+
+        # Identical messages (spam waves, copy-pastes) reuse the cached verdict
+        analysis = analysis or MessageAnalysis(text)
+        over_length = analysis.length > GENERATION_LIMITS["max_response_length"]
+        rules_version = rules.version if rules else 0
+        key = self.verdicts.make_key(analysis.content_hash, over_length, str(server_id or ""), version, rules_version)
+        verdict = self.verdicts.get(key)
+        if verdict is None:
+            verdict = self._verdict(analysis, server_settings, rules)
+            if cacheable:
+                self.verdicts.put(key, verdict)
+        return self._result(verdict, server_settings)
+
+    async def incremental(self, server_id: str = None) -> "IncrementalFilter":
+        """An IncrementalFilter for text streamed into a guild, with its settings and rules loaded once"""
+        server_settings, _, _, rules = await self._guild_context(server_id)
+        return IncrementalFilter(self, server_settings, rules)
+
+    def _verdicts(self, texts: Sequence[str], server_settings: Dict, rules: Optional[GuildRules] = None,
+                  combined: Optional[KeywordMatcher] = None) -> List[Tuple]:
+        return [self._verdict(MessageAnalysis(text), server_settings, rules, combined) for text in texts]
+
+    async def filter_batch(self, texts: Sequence[str], server_id: str = None,
+                           executor: Optional[Executor] = None,
+                           chunk_size: int = HISTORY_SCAN_SETTINGS["chunk_size"]) -> List[Dict]:
+        """
+        Filter many messages under one guild's settings and custom rules,
+        which are looked up once for the whole batch. A guild's custom terms
+        are compiled together with the built-in keywords, so each message
+        takes one automaton pass instead of two. Verdicts bypass the verdict
+        cache, so a bulk scan does not evict the live traffic.
+        With an executor (e.g. a ProcessPoolExecutor) the chunks are scanned
+        in parallel; otherwise they run inline, yielding to the event loop
+        between chunks.
+        Returns one filter_message dictionary per text, in order.
+        """
+        server_settings, _, _, rules = await self._guild_context(server_id)
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+
+        if executor is not None:
+            # Workers get the rule terms and compile (then keep) their own matcher
+            rule_terms = (rules.version, sorted(rules.blocked), sorted(rules.allowed)) if rules else None
+            loop = asyncio.get_running_loop()
+            parts = await asyncio.gather(*(
+                loop.run_in_executor(executor, _scan_chunk, list(chunk), server_settings, str(server_id or ""), rule_terms)
+                for chunk in chunks
+            ))
+        else:
+            combined = None
+            if rules is not None:
+                if self._combined is None or self._combined[0] is not rules:
+                    self._combined = (rules, await asyncio.to_thread(self._combined_matcher, rules))
+                combined = self._combined[1]
+            parts = []
+            for chunk in chunks:
+                parts.append(self._verdicts(chunk, server_settings, rules, combined))
+                await asyncio.sleep(0)
+        return [self._result(verdict, server_settings) for part in parts for verdict in part]
+
+class IncrementalFilter:
+    """
+    ContentFilter checks over text that arrives in pieces, such as a streamed
+    completion, so a bad generation can be stopped as soon as it goes wrong.
+    Only settled text is scanned (up to the last whitespace, so a word cut by
+    a chunk boundary is never judged half-read), at least min_scan_chars of
+    new text at a time. A keyword hit is judged once the text runs at least
+    one keyword length past it, and the window for each scan starts on a word
+    boundary at least one keyword length before the first unjudged hit, so a
+    keyword or an allowed term around it is always seen whole. Total work
+    stays linear in the length of the stream.
+    Early flags are best effort; finish() runs the full check over the whole
+    text and has the final say.
+    """
+
+    def __init__(self, content_filter: ContentFilter, server_settings: Dict, rules: Optional[GuildRules] = None,
+                 min_scan_chars: int = STREAM_FILTER_SETTINGS["min_scan_chars"]):
+        self.content_filter = content_filter
+        self.server_settings = server_settings
+        self.rules = rules
+        self.min_scan_chars = min_scan_chars
+        self.overlap = max(content_filter._keywords.longest, rules.matcher.longest if rules else 0)
+        self.scans = 0
+        self.reset()
+
+    def reset(self):
+        """Start over (e.g. when a failed request is retried from the beginning)"""
+        self.flagged: Optional[Dict] = None
+        self._parts: List[str] = []
+        # Text from the start of the next window on, and its offset in the stream
+        self._tail = ""
+        self._tail_start = 0
+        # Hits ending at or before this offset have been judged
+        self._judged = 0
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far"""
+        return "".join(self._parts)
+
+    @property
+    def fingerprint(self) -> Tuple:
+        """Everything the checks depend on: filters with equal fingerprints flag the same text"""
+        mature_enabled = bool(self.server_settings.get("mature_enabled", False))
+        return (
+            mature_enabled,
+            self.server_settings.get("mature_level", 1) if mature_enabled else None,
+            self.rules.blocked if self.rules else None,
+            self.rules.allowed if self.rules else None
+        )
+
+    def adopt(self, text: str, flagged: Optional[Dict]):
+        """Take over the outcome of a filter with the same fingerprint that was fed text"""
+        self.reset()
+        self._parts.append(text)
+        self.flagged = flagged
+
+    def feed(self, chunk: str) -> Optional[Dict]:
+        """Add a chunk; returns the filter result once the text is flagged, else None"""
+        self._parts.append(chunk)
+        if self.flagged is not None:
+            return self.flagged
+        # Casefolding is per character, so the window can be kept casefolded
+        self._tail += chunk.casefold()
+
+        cut = max(self._tail.rfind(" "), self._tail.rfind("\n"), self._tail.rfind("\t"))
+        judge_until = cut - self.overlap
+        since = self._judged - self._tail_start
+        if judge_until - since < self.min_scan_chars:
+            return None
+        verdict = self.content_filter._verdict(
+            MessageAnalysis(self._tail[:cut]), self.server_settings, self.rules, since=since, until=judge_until
+        )
+        self.scans += 1
+        result = self.content_filter._result(verdict, self.server_settings)
+        if result["is_filtered"]:
+            self.flagged = result
+            return result
+
+        # The next window starts after the last whitespace at least one
+        # keyword length before the next hit to judge
+        self._judged = self._tail_start + judge_until
+        bound = max(0, judge_until - self.overlap)
+        keep = max(self._tail.rfind(" ", 0, bound), self._tail.rfind("\n", 0, bound), self._tail.rfind("\t", 0, bound)) + 1
+        self._tail = self._tail[keep:]
+        self._tail_start += keep
+        return None
+
+    def finish(self) -> Dict:
+        """The full filter result for the whole text"""
+        result = self.content_filter.scan(self.text, self.server_settings, self.rules)
+        if result["is_filtered"] and self.flagged is None:
+            self.flagged = result
+        return result
 
 # Global content filter instance
-content_filter = ContentFilter() 
\ No newline at end of file
+content_filter = ContentFilter()
+
+# A filter_batch worker process's compiled custom rules: (guild, rules version, combined matcher)
+_worker_rules: Optional[Tuple[str, int, KeywordMatcher]] = None
+
+def _scan_chunk(texts: List[str], server_settings: Dict, server_id: str,
+                rule_terms: Optional[Tuple[int, List[str], List[str]]]) -> List[Tuple]:
+    """filter_batch worker: verdict tuples for one chunk"""
+    global _worker_rules
+    combined = None
+    if rule_terms is not None:
+        version, blocked, allowed = rule_terms
+        if _worker_rules is None or _worker_rules[:2] != (server_id, version):
+            rules = GuildRules(version, blocked, allowed)
+            _worker_rules = (server_id, version, content_filter._combined_matcher(rules))
+        combined = _worker_rules[2]
+    return content_filter._verdicts(texts, server_settings, combined=combined)
\ No newline at end of file
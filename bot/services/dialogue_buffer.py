@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Tuple, Optional, Any
+from ..config import INGEST_SETTINGS
+from ..database.async_db import async_db, AsyncDatabase
+
+logger = logging.getLogger('chinatsu.ingest')
+
+class DialogueIngestBuffer:
+    """
+    Write-behind buffer for dialogue_patterns and word_chains.
+    Entries with the same (input_pattern, response_template) key are coalesced
+    and their usage_count deltas summed, and likewise word chains and their
+    frequency; the buffer is flushed in one executemany transaction per table
+    when it reaches max_pending patterns or max_pending_chains chains, or
+    every flush_interval seconds, and once more on shutdown.
+    """
+    
+    _FLUSH_QUERY = """
+        INSERT INTO dialogue_patterns 
+        (context_type, input_pattern, response_template, emotion, usage_count)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(input_pattern, response_template) DO UPDATE SET
+            usage_count = usage_count + excluded.usage_count
+    """
+    
+    _CHAIN_FLUSH_QUERY = """
+        INSERT INTO word_chains (word1, word2, next_word, context_type, frequency)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(word1, word2, next_word, context_type) DO UPDATE SET
+            frequency = frequency + excluded.frequency
+    """
+    
+    def __init__(
+        self,
+        db: AsyncDatabase = async_db,
+        max_pending: int = INGEST_SETTINGS["max_pending"],
+        max_pending_chains: int = INGEST_SETTINGS["max_pending_chains"],
+        flush_interval: float = INGEST_SETTINGS["flush_interval"]
+    ):
+        self.db = db
+        self.max_pending = max_pending
+        self.max_pending_chains = max_pending_chains
+        self.flush_interval = flush_interval
+        # (input_pattern, response_template) -> [context_type, emotion, usage delta]
+        self._pending: Dict[Tuple[str, str], list] = {}
+        # (word1, word2, next_word, context_type) -> frequency delta
+        self._chains: Dict[Tuple[str, str, str, str], int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        
+        # Metrics
+        self.flush_count = 0
+        self.flushed_rows = 0
+        self.flushed_chains = 0
+        self.coalesced_entries = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        
+    @property
+    def queue_depth(self) -> int:
+        """Number of distinct patterns waiting to be written"""
+        return len(self._pending)
+        
+    def add(self, context: str, input_pattern: str, response_template: str, emotion: str = 'neutral'):
+        """Queue one usage of a pattern; never touches the database"""
+        key = (input_pattern, response_template)
+        pending = self._pending.get(key)
+        if pending:
+            pending[2] += 1
+            self.coalesced_entries += 1
+        else:
+            self._pending[key] = [context, emotion, 1]
+        self._maybe_flush()
+        
+    def add_chains(self, context: str, chains: Iterable[Tuple[str, str, str]]):
+        """Queue one use of each (word1, word2, next_word) chain; never touches the database"""
+        for word1, word2, next_word in chains:
+            key = (word1, word2, next_word, context)
+            self._chains[key] = self._chains.get(key, 0) + 1
+        self._maybe_flush()
+        
+    def _maybe_flush(self):
+        if ((len(self._pending) >= self.max_pending or len(self._chains) >= self.max_pending_chains)
+                and not self._flush_in_progress()):
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                # No running loop (offline use); the caller flushes explicitly
+                pass
+                
+    def _flush_in_progress(self) -> bool:
+        return self._flush_task is not None and not self._flush_task.done()
+        
+    async def flush(self) -> int:
+        """Write all pending patterns, then all pending chains, returning the pattern row count"""
+        # A cancelled caller (stop() cancelling the periodic task) must not
+        # drop a batch half-way: the writes run to the end, and stop()'s own
+        # flush waits for them on the lock
+        return await asyncio.shield(self._flush())
+        
+    async def _flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending and not self._chains:
+                return 0
+            batch, self._pending = self._pending, {}
+            chains, self._chains = self._chains, {}
+            rows = [
+                (context, input_pattern, response_template, emotion, delta)
+                for (input_pattern, response_template), (context, emotion, delta) in batch.items()
+            ]
+            
+            start = time.perf_counter()
+            if rows:
+                try:
+                    await self.db.executemany(self._FLUSH_QUERY, rows)
+                except Exception as e:
+                    logger.error(f"Dialogue flush failed, keeping {len(rows)} patterns queued: {e}")
+                    self._requeue(batch)
+                    rows = []
+                except BaseException:
+                    # Cancelled anyway (the loop is going away): keep both batches for a later flush
+                    self._requeue(batch)
+                    self._requeue_chains(chains)
+                    raise
+            if chains:
+                try:
+                    await self.db.executemany(self._CHAIN_FLUSH_QUERY, [key + (delta,) for key, delta in chains.items()])
+                    self.flushed_chains += len(chains)
+                except Exception as e:
+                    logger.error(f"Word chain flush failed, keeping {len(chains)} chains queued: {e}")
+                    self._requeue_chains(chains)
+                    chains = {}
+                except BaseException:
+                    self._requeue_chains(chains)
+                    raise
+            if not rows and not chains:
+                return 0
+                
+            self.last_flush_latency = time.perf_counter() - start
+            self.max_flush_latency = max(self.max_flush_latency, self.last_flush_latency)
+            self.flush_count += 1
+            self.flushed_rows += len(rows)
+            return len(rows)
+            
+    def _requeue(self, batch: Dict[Tuple[str, str], list]):
+        """Merge a failed batch back in front of anything queued meanwhile"""
+        for key, (context, emotion, delta) in batch.items():
+            pending = self._pending.get(key)
+            if pending:
+                pending[2] += delta
+            else:
+                self._pending[key] = [context, emotion, delta]
+                
+    def _requeue_chains(self, chains: Dict[Tuple[str, str, str, str], int]):
+        """Merge failed chain deltas back in with anything queued meanwhile"""
+        for key, delta in chains.items():
+            self._chains[key] = self._chains.get(key, 0) + delta
+            
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Periodic dialogue flush failed: {e}")
+                
+    def start(self):
+        """Start the periodic flush task on the running loop"""
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.get_running_loop().create_task(self._run())
+            
+    async def stop(self):
+        """Stop the periodic task and flush whatever is still queued"""
+        if self._loop_task:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        if self._flush_in_progress():
+            await self._flush_task
+        await self.flush()
+        
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and flush latency metrics"""
+        return {
+            "queue_depth": self.queue_depth,
+            "queued_uses": sum(pending[2] for pending in self._pending.values()),
+            "queued_chains": len(self._chains),
+            "coalesced_entries": self.coalesced_entries,
+            "flush_count": self.flush_count,
+            "flushed_rows": self.flushed_rows,
+            "flushed_chains": self.flushed_chains,
+            "last_flush_ms": self.last_flush_latency * 1000,
+            "max_flush_ms": self.max_flush_latency * 1000
+        }
\ No newline at end of file
@@ -1,12 +1,17 @@
 import json
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from pathlib import Path
 from ..database.models import LearningData
+from ..database.async_db import async_db
+from .dialogue_buffer import DialogueIngestBuffer
+from .markov import learnable_words, trigrams
+from .message_analysis import MessageAnalysis
 
 class DialogueTrainer:
     def __init__(self):
         self.dialogue_patterns = {}
+        self.ingest_buffer = DialogueIngestBuffer()
         self.character_traits = {
             "chinatsu": {
                 "personality": {
@@ -39,32 +44,60 @@ class DialogueTrainer:
         except Exception as e:
             print(f"Error loading dialogue data: {e}")
     
-    def _process_dialogue_entry(self, entry: Dict[str, Any]):
-        """Process a single dialogue entry"""
+    _UPSERT_PATTERN = """
+        INSERT INTO dialogue_patterns 
+        (context_type, input_pattern, response_template, emotion, usage_count)
+        VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT(input_pattern, response_template) DO UPDATE SET
+            usage_count = usage_count + 1
+    """
+    
+    _UPSERT_CHAIN = """
+        INSERT INTO word_chains (word1, word2, next_word, context_type)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(word1, word2, next_word, context_type) DO UPDATE SET
+            frequency = frequency + 1
+    """
+    
+    def _prepare_entry(self, entry: Dict[str, Any], analysis: Optional[MessageAnalysis] = None) -> tuple:
+        """Normalize an entry into (context, dialogue, emotion)"""
         context = entry.get('context', '')
         dialogue = entry.get('dialogue', '')
         emotion = entry.get('emotion', 'neutral')
         
         # Clean and normalize the text
-        dialogue = self._normalize_text(dialogue)
+        dialogue = self._normalize_text(dialogue, analysis)
+        return context, dialogue, emotion
+    
+    def _process_dialogue_entry(self, entry: Dict[str, Any]):
+        """Process a single dialogue entry (synchronous, for offline loading)"""
+        context, dialogue, emotion = self._prepare_entry(entry)
         
         # Store in database
         LearningData.execute_query(
-            """
-            INSERT INTO dialogue_patterns 
-            (context_type, input_pattern, response_template, emotion, usage_count)
-            VALUES (?, ?, ?, ?, 1)
-            ON CONFLICT(input_pattern, response_template) DO UPDATE SET
-                usage_count = usage_count + 1
-            """,
+            self._UPSERT_PATTERN,
             (context, dialogue, dialogue, emotion)
         )
+        for chain in trigrams(learnable_words(dialogue)):
+            LearningData.execute_query(self._UPSERT_CHAIN, chain + (context,))
         
         # Extract speech patterns
         self._extract_speech_patterns(dialogue, emotion)
     
-    def _normalize_text(self, text: str) -> str:
+    def _queue_dialogue_entry(self, entry: Dict[str, Any], analysis: Optional[MessageAnalysis] = None):
+        """Process a single dialogue entry via the write-behind buffer"""
+        context, dialogue, emotion = self._prepare_entry(entry, analysis)
+        
+        self.ingest_buffer.add(context, dialogue, dialogue, emotion)
+        self.ingest_buffer.add_chains(context, trigrams(learnable_words(dialogue)))
+        
+        self._extract_speech_patterns(dialogue, emotion)
+    
+    def _normalize_text(self, text: str, analysis: Optional[MessageAnalysis] = None) -> str:
         """Clean and normalize dialogue text"""
+        # Already tokenized messages with nothing to strip skip the regex
+        if analysis is not None and analysis.is_plain:
+            return text.strip()
         # Remove special characters, keep only English text and basic punctuation
         text = re.sub(r'[^\w\s!?.,]', '', text)
         return text.strip()
@@ -86,11 +119,11 @@ class DialogueTrainer:
             if re.search(pattern, dialogue):
                 self.dialogue_patterns[pattern_type] = self.dialogue_patterns.get(pattern_type, 0) + 1
     
-    def get_character_response(self, context: str, emotion: str = 'neutral') -> str:
+    async def get_character_response(self, context: str, emotion: str = 'neutral') -> str:
         """Get a character-appropriate response"""
         try:
             # Query the database for matching patterns
-            results = LearningData.execute_query(
+            results = await async_db.execute_query(
                 """
                 SELECT response_template, usage_count
                 FROM dialogue_patterns
@@ -111,15 +144,16 @@ class DialogueTrainer:
             
         return None
     
-    def add_dialogue_entry(self, context: str, dialogue: str, emotion: str = 'neutral'):
-        """Add a new dialogue entry"""
+    async def add_dialogue_entry(self, context: str, dialogue: str, emotion: str = 'neutral',
+                                 analysis: Optional[MessageAnalysis] = None):
+        """Add a new dialogue entry (analysis: the message's MessageAnalysis, if already built)"""
         entry = {
             'character': 'chinatsu',
             'context': context,
             'dialogue': dialogue,
             'emotion': emotion
         }
-        self._process_dialogue_entry(entry)
+        self._queue_dialogue_entry(entry, analysis)
 
 # Example dialogue data structure:
 """
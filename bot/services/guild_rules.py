@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+from ..config import GUILD_RULES_SETTINGS
+from ..database.async_db import async_db, AsyncDatabase
+from .keyword_matcher import KeywordMatcher, KeywordHit
+
+logger = logging.getLogger('chinatsu.rules')
+
+class GuildRules:
+    """
+    One guild's custom filter terms at one rules version, compiled into a
+    single keyword automaton. Blocked terms match as whole words; allowed terms
+    match anywhere and exempt the built-in keyword hits they cover.
+    """
+
+    def __init__(self, version: int, blocked: Iterable[str], allowed: Iterable[str]):
+        blocked = {term.casefold() for term in blocked}
+        allowed = {term.casefold() for term in allowed}
+        self.version = version
+        self.blocked = frozenset(blocked)
+        self.allowed = frozenset(allowed)
+        self.block_count = len(blocked)
+        self.allow_count = len(allowed)
+        self.matcher = KeywordMatcher()
+        self.matcher.add_all(blocked, "block", whole_word=True)
+        self.matcher.add_all(allowed, "allow")
+        self.matcher.build()
+
+    def scan(self, lowered: str) -> Dict[str, List[KeywordHit]]:
+        """Custom rule hits in a casefolded message, grouped by block/allow"""
+        return self.matcher.categories(lowered)
+
+    @staticmethod
+    def without_allowed(hits: Dict[str, List[KeywordHit]], allowed: List[KeywordHit]) -> Dict[str, List[KeywordHit]]:
+        """Drop every hit that lies inside an allowed span"""
+        # Merge allowed spans into disjoint intervals, then bisect per hit
+        starts, ends = [], []
+        for hit in sorted(allowed):
+            if ends and hit.start <= ends[-1]:
+                ends[-1] = max(ends[-1], hit.end)
+            else:
+                starts.append(hit.start)
+                ends.append(hit.end)
+
+        kept: Dict[str, List[KeywordHit]] = {}
+        for category, group in hits.items():
+            remaining = []
+            for hit in group:
+                index = bisect_right(starts, hit.start) - 1
+                if index < 0 or hit.end > ends[index]:
+                    remaining.append(hit)
+            if remaining:
+                kept[category] = remaining
+        return kept
+
+class GuildRuleCache:
+    """
+    LRU of compiled GuildRules, keyed by guild.
+    The message path only does a dict lookup: a guild's rules are compiled once
+    per rules_version (read from filter_settings through the settings cache),
+    off the event loop. When an admin edits the rules the rebuild starts in the
+    background right away, and until it lands messages keep using the previous
+    compiled version. Only a guild's very first lookup waits for its build.
+    """
+
+    def __init__(self, db: AsyncDatabase = async_db, max_compiled: int = GUILD_RULES_SETTINGS["max_compiled"]):
+        self.db = db
+        self.max_compiled = max_compiled
+        self._compiled: "OrderedDict[str, GuildRules]" = OrderedDict()
+        self._building: Dict[str, asyncio.Task] = {}
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.evictions = 0
+
+    async def get(self, server_id: str, version: int) -> Optional[GuildRules]:
+        """Compiled rules for a guild whose filter_settings.rules_version is version"""
+        if not version:
+            return None
+        server_id = str(server_id)
+        rules = self._compiled.get(server_id)
+        if rules is not None:
+            self.hits += 1
+            self._compiled.move_to_end(server_id)
+            if rules.version < version:
+                self.schedule_rebuild(server_id)
+            return rules
+
+        self.misses += 1
+        try:
+            return await asyncio.shield(self.schedule_rebuild(server_id))
+        except Exception as e:
+            logger.error(f"Failed to compile filter rules for {server_id}: {e}")
+            return None
+
+    def schedule_rebuild(self, server_id: str) -> asyncio.Task:
+        """Start (or join) a background rebuild of a guild's compiled rules"""
+        server_id = str(server_id)
+        task = self._building.get(server_id)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._rebuild(server_id))
+            self._building[server_id] = task
+            task.add_done_callback(lambda done: self._building.pop(server_id, None))
+        return task
+
+    async def _rebuild(self, server_id: str) -> Optional[GuildRules]:
+        # Version first: if an edit lands between the two reads, the newer terms
+        # are stored under the older version and simply rebuilt once more
+        row = await self.db.fetch_one(
+            "SELECT rules_version FROM filter_settings WHERE server_id = ?",
+            (server_id,)
+        )
+        version = int(row["rules_version"] or 0) if row else 0
+        terms = await self.db.fetch_all(
+            "SELECT rule_type, term FROM filter_rules WHERE server_id = ?",
+            (server_id,)
+        )
+        blocked = [term["term"] for term in terms if term["rule_type"] == "block"]
+        allowed = [term["term"] for term in terms if term["rule_type"] == "allow"]
+
+        rules = await asyncio.to_thread(GuildRules, version, blocked, allowed)
+        self.builds += 1
+        current = self._compiled.get(server_id)
+        if current is None or current.version <= rules.version:
+            self._compiled[server_id] = rules
+            self._compiled.move_to_end(server_id)
+        while len(self._compiled) > self.max_compiled:
+            self._compiled.popitem(last=False)
+            self.evictions += 1
+        return self._compiled.get(server_id, rules)
+
+    def clear(self):
+        """Drop every compiled matcher"""
+        self._compiled.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and compiled matcher sizes"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "compiled": len(self._compiled),
+            "building": len(self._building),
+            "builds": self.builds,
+            "evictions": self.evictions,
+            "terms": sum(rules.block_count + rules.allow_count for rules in self._compiled.values())
+        }
+
+# Global guild rule cache instance
+guild_rules = GuildRuleCache()
\ No newline at end of file
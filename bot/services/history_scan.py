@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+from ..config import HISTORY_SCAN_SETTINGS
+from ..database.async_db import async_db, AsyncDatabase
+from .content_filter import ContentFilter, content_filter
+
+logger = logging.getLogger('chinatsu.history_scan')
+
+def flag_reason(result: Dict) -> str:
+    """Short reason for a filtered filter_message/filter_batch result"""
+    checks = result["checks"]
+    if checks["jailbreak"]["detected"]:
+        return f"jailbreak: {checks['jailbreak']['reason']}"
+    if checks["custom_rules"]["detected"]:
+        return f"blocked term: {checks['custom_rules']['term']}"
+    if not checks["safety"]["is_safe"]:
+        return f"unsafe: {checks['safety']['reason']}"
+    return f"mature content level {checks['mature_content']['level']}"
+
+class HistoryScanner:
+    """
+    Re-runs the content filter over one guild's conversation_log rows under
+    its settings and custom rules (e.g. after the rules change) and stores
+    the result in conversation_log.flagged / flag_reason. Rows without a
+    guild (DMs, and rows logged before guilds were recorded) are scanned
+    with the defaults when no guild is given.
+    Rows are read in keyset pages (server_id, id > last id, so every page is
+    an index range scan however deep the scan is), filtered with filter_batch, and
+    each page's flag changes go to the writer as one executemany per kind.
+    Rows that no longer match have their flag cleared.
+    """
+
+    def __init__(self, db: AsyncDatabase = async_db, content_filter: ContentFilter = content_filter,
+                 page_size: int = HISTORY_SCAN_SETTINGS["page_size"],
+                 workers: int = HISTORY_SCAN_SETTINGS["workers"],
+                 page_pause: float = HISTORY_SCAN_SETTINGS["page_pause"]):
+        self.db = db
+        self.content_filter = content_filter
+        self.page_size = page_size
+        self.workers = workers
+        self.page_pause = page_pause
+        self._run_lock = asyncio.Lock()
+
+        # Metrics
+        self.runs = 0
+        self.last_run: Dict[str, Any] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._run_lock.locked()
+
+    async def run(self, server_id: Optional[str] = None, start_id: int = 0) -> Dict[str, Any]:
+        """Scan the guild's conversation_log rows after start_id. Returns row counts and timing."""
+        async with self._run_lock:
+            start = time.perf_counter()
+            totals = {"scanned": 0, "flagged": 0, "cleared": 0, "pages": 0}
+            # Extra processes only pay off with a core to spare for each
+            workers = min(self.workers, os.cpu_count() or 1)
+            executor = ProcessPoolExecutor(workers) if workers > 1 else None
+            try:
+                last_id = start_id
+                while True:
+                    rows = await self.db.fetch_all(
+                        """
+                        SELECT id, user_message, flagged
+                        FROM conversation_log
+                        WHERE server_id IS ? AND id > ?
+                        ORDER BY id
+                        LIMIT ?
+                        """,
+                        (server_id, last_id, self.page_size)
+                    )
+                    if not rows:
+                        break
+
+                    results = await self.content_filter.filter_batch(
+                        [row["user_message"] or "" for row in rows], server_id, executor=executor
+                    )
+                    flagged = []
+                    cleared = []
+                    for row, result in zip(rows, results):
+                        if result["is_filtered"]:
+                            flagged.append((flag_reason(result), row["id"]))
+                        elif row["flagged"]:
+                            cleared.append((row["id"],))
+                    if flagged:
+                        await self.db.executemany(
+                            "UPDATE conversation_log SET flagged = 1, flag_reason = ? WHERE id = ?",
+                            flagged
+                        )
+                    if cleared:
+                        await self.db.executemany(
+                            "UPDATE conversation_log SET flagged = 0, flag_reason = NULL WHERE id = ?",
+                            cleared
+                        )
+
+                    last_id = rows[-1]["id"]
+                    totals["scanned"] += len(rows)
+                    totals["flagged"] += len(flagged)
+                    totals["cleared"] += len(cleared)
+                    totals["pages"] += 1
+                    if len(rows) < self.page_size:
+                        break
+                    await asyncio.sleep(self.page_pause)
+            finally:
+                if executor is not None:
+                    await asyncio.to_thread(executor.shutdown)
+
+            self.runs += 1
+            self.last_run = {
+                **totals,
+                "last_id": last_id,
+                "duration_ms": (time.perf_counter() - start) * 1000
+            }
+            logger.info(f"History scan for {server_id or 'defaults'}: {totals}")
+            return self.last_run
+
+    def stats(self) -> Dict[str, Any]:
+        """Last run summary and whether a scan is in progress"""
+        return {"runs": self.runs, "running": self.running, **self.last_run}
+
+# Global history scanner instance
+history_scanner = HistoryScanner()
\ No newline at end of file
@@ -0,0 +1,164 @@
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+class KeywordHit(NamedTuple):
+    start: int
+    end: int
+    keyword: str
+    category: str
+    weight: float
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over a set of literal keywords.
+    Keywords are added with a category and a weight, then build() compiles them
+    once; every scan is a single pass over the text whose cost depends on the
+    text length and the number of hits, not on how many keywords there are.
+
+    Matching is exact, so callers pass casefolded text (keywords are casefolded
+    on add). A whole_word keyword only matches where its word-character edges
+    are not preceded/followed by another word character, like \\b in a regex.
+    """
+
+    def __init__(self):
+        # keyword, category, weight, check start edge, check end edge
+        self._entries: List[Tuple[str, str, float, bool, bool]] = []
+        self._root: Dict[str, int] = {}
+        self._delta: List[Dict[str, int]] = [{}]
+        self._outputs: List[Tuple[int, ...]] = [()]
+        self._built = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def longest(self) -> int:
+        """Length of the longest keyword"""
+        return max((len(entry[0]) for entry in self._entries), default=0)
+
+    def add(self, keyword: str, category: str, weight: float = 1.0, whole_word: bool = False):
+        """Add one keyword (takes effect on the next build())"""
+        keyword = keyword.casefold()
+        if not keyword:
+            raise ValueError("Keyword must not be empty")
+        self._entries.append((
+            keyword,
+            category,
+            weight,
+            whole_word and _is_word_char(keyword[0]),
+            whole_word and _is_word_char(keyword[-1])
+        ))
+        self._built = False
+
+    def add_all(self, keywords: Iterable[str], category: str, weight: float = 1.0, whole_word: bool = False):
+        """Add several keywords sharing a category and weight"""
+        for keyword in keywords:
+            self.add(keyword, category, weight, whole_word)
+
+    def extend(self, other: "KeywordMatcher"):
+        """Add every keyword of another matcher, with its category, weight and edges"""
+        self._entries.extend(other._entries)
+        self._built = False
+
+    def build(self) -> "KeywordMatcher":
+        """Compile the trie, failure links and output sets"""
+        goto: List[Dict[str, int]] = [{}]
+        own: List[List[int]] = [[]]
+        for index, (keyword, *_) in enumerate(self._entries):
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    own.append([])
+                state = nxt
+            own[state].append(index)
+
+        # Breadth-first, so a state's failure target is always finished first.
+        # delta[s] holds every transition out of s whose target is deeper than
+        # one character; anything else falls back to the root's children, which
+        # keeps the table small without a failure-link walk at scan time.
+        root = goto[0]
+        delta: List[Dict[str, int]] = [{} for _ in goto]
+        fail = [0] * len(goto)
+        outputs: List[Tuple[int, ...]] = [()] * len(goto)
+        queue = list(root.values())
+        for state in queue:
+            outputs[state] = tuple(own[state])
+            delta[state] = dict(goto[state])
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, child in goto[state].items():
+                target = delta[fail[state]].get(ch) or root.get(ch, 0)
+                fail[child] = target
+                outputs[child] = tuple(own[child]) + outputs[target]
+                delta[child] = {**delta[target], **goto[child]}
+                queue.append(child)
+
+        self._root = root
+        self._delta = delta
+        self._outputs = outputs
+        self._built = True
+        return self
+
+    def iter_hits(self, text: str) -> Iterator[KeywordHit]:
+        """Every keyword occurrence, overlapping ones included, ordered by end"""
+        if not self._built:
+            self.build()
+        root, delta, outputs, entries = self._root, self._delta, self._outputs, self._entries
+        state = 0
+        length = len(text)
+        for end, ch in enumerate(text, 1):
+            state = delta[state].get(ch) or root.get(ch, 0)
+            if not outputs[state]:
+                continue
+            for index in outputs[state]:
+                keyword, category, weight, check_start, check_end = entries[index]
+                start = end - len(keyword)
+                if check_start and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if check_end and end < length and _is_word_char(text[end]):
+                    continue
+                yield KeywordHit(start, end, keyword, category, weight)
+
+    def find_all(self, text: str, overlapping: bool = False) -> List[KeywordHit]:
+        """
+        Keyword hits in text order. Without overlapping, keeps the leftmost-longest
+        hit wherever hits overlap (as a regex alternation scan would); keywords
+        registered under several categories all report the chosen span.
+        """
+        hits = list(self.iter_hits(text))
+        if overlapping or len(hits) < 2:
+            return sorted(hits)
+        hits.sort(key=lambda hit: (hit.start, -hit.end))
+        chosen: List[KeywordHit] = []
+        covered = 0
+        for hit in hits:
+            if hit.start >= covered:
+                chosen.append(hit)
+                covered = hit.end
+            elif chosen and (hit.start, hit.end) == (chosen[-1].start, chosen[-1].end):
+                chosen.append(hit)
+        return chosen
+
+    def categories(self, text: str) -> Dict[str, List[KeywordHit]]:
+        """Overlapping hits grouped by category"""
+        grouped: Dict[str, List[KeywordHit]] = {}
+        for hit in self.iter_hits(text):
+            grouped.setdefault(hit.category, []).append(hit)
+        return grouped
+
+    def stats(self) -> Dict:
+        """Keyword and automaton sizes"""
+        return {
+            "keywords": len(self._entries),
+            "states": len(self._delta),
+            "transitions": len(self._root) + sum(len(table) for table in self._delta),
+            "built": self._built
+        }
\ No newline at end of file
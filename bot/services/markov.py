@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import random
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from ..config import MARKOV_SETTINGS
+from ..database.async_db import async_db, AsyncDatabase
+
+logger = logging.getLogger('chinatsu.markov')
+
+# Marks the start and end of a message in word_chains (NULLs would never conflict)
+BOUNDARY = ""
+
+def learnable_words(text: str, limit: int = MARKOV_SETTINGS["max_learned_words"]) -> List[str]:
+    """The words of a message as they are learned: lowercased, at most limit"""
+    return text.lower().split()[:limit]
+
+def trigrams(words: Sequence[str]) -> Iterator[Tuple[str, str, str]]:
+    """(word1, word2, next_word) for every word and the end, with BOUNDARY before the start"""
+    if not words:
+        return
+    padded = [BOUNDARY, BOUNDARY, *words, BOUNDARY]
+    for i in range(len(padded) - 2):
+        yield padded[i], padded[i + 1], padded[i + 2]
+
+class _Chains:
+    """
+    One context_type's chains. keys holds every (word1, word2) state as
+    word1 << 32 | word2, sorted; state i's next words are
+    successors[offsets[i]:offsets[i + 1]], with the running total of their
+    frequencies alongside in cumulative.
+    """
+
+    __slots__ = ("keys", "offsets", "successors", "cumulative")
+
+    def __init__(self):
+        self.keys = array("Q")
+        self.offsets = array("I")
+        self.successors = array("I")
+        self.cumulative = array("I")
+
+    def next_word(self, key: int, rng: random.Random) -> Optional[int]:
+        """A next word id for a state, drawn by frequency; None for an unknown state"""
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return self.successors[bisect_right(self.cumulative, rng.randrange(self.cumulative[hi - 1]), lo, hi)]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(a) * a.itemsize for a in (self.keys, self.offsets, self.successors, self.cumulative))
+
+class MarkovGenerator:
+    """
+    Trigram replies from word_chains, made in memory with no API call.
+    The table is read into one compact structure per context_type: words
+    are interned to integer ids, and each state's next words and cumulative
+    frequencies sit in flat arrays, so picking a word is two binary searches
+    (the state, then the frequency) and a reply costs microseconds.
+    The table is read again once reload_interval has passed (ensure_loaded),
+    building the new structure on a worker thread and swapping it in whole.
+    """
+
+    _LOAD_QUERY = "SELECT word1, word2, next_word, frequency, context_type FROM word_chains WHERE frequency > 0"
+
+    def __init__(self, db: AsyncDatabase = async_db,
+                 reload_interval: float = MARKOV_SETTINGS["reload_interval"],
+                 max_words: int = MARKOV_SETTINGS["max_words"],
+                 min_words: int = MARKOV_SETTINGS["min_words"],
+                 attempts: int = MARKOV_SETTINGS["attempts"]):
+        self.db = db
+        self.reload_interval = reload_interval
+        self.max_words = max_words
+        self.min_words = min_words
+        self.attempts = attempts
+        self.words: List[str] = [BOUNDARY]
+        self._contexts: Dict[str, _Chains] = {}
+        self._loaded_at: Optional[float] = None
+        self._load_lock = asyncio.Lock()
+        self._rng = random.Random()
+
+        # Metrics
+        self.loads = 0
+        self.chains = 0
+        self.last_load_ms = 0.0
+        self.generated = 0
+
+    async def load(self) -> int:
+        """Read word_chains into memory, returning the number of chains"""
+        start = time.perf_counter()
+        rows = await self.db.fetch_all(self._LOAD_QUERY)
+        self.words, self._contexts = await asyncio.to_thread(self._build, rows)
+        self._loaded_at = time.monotonic()
+        self.chains = len(rows)
+        self.loads += 1
+        self.last_load_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Loaded {self.chains} word chains ({len(self.words)} words) in {self.last_load_ms:.0f} ms")
+        return self.chains
+
+    async def ensure_loaded(self):
+        """Load the chains if they never were or are older than reload_interval"""
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.reload_interval:
+            return
+        async with self._load_lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reload_interval:
+                await self.load()
+
+    @staticmethod
+    def _build(rows: List[Dict[str, Any]]) -> Tuple[List[str], Dict[str, _Chains]]:
+        ids = {BOUNDARY: 0}
+        words = [BOUNDARY]
+
+        def intern(word: Optional[str]) -> int:
+            word = word or BOUNDARY
+            word_id = ids.get(word)
+            if word_id is None:
+                word_id = ids[word] = len(words)
+                words.append(word)
+            return word_id
+
+        grouped: Dict[str, List[Tuple[int, int, int]]] = {}
+        for row in rows:
+            key = intern(row["word1"]) << 32 | intern(row["word2"])
+            grouped.setdefault(row["context_type"] or "general", []).append(
+                (key, intern(row["next_word"]), row["frequency"])
+            )
+
+        contexts = {}
+        for context_type, rows_in_context in grouped.items():
+            rows_in_context.sort()
+            chains = _Chains()
+            last_key = None
+            total = 0
+            for key, next_id, frequency in rows_in_context:
+                if key != last_key:
+                    chains.keys.append(key)
+                    chains.offsets.append(len(chains.successors))
+                    last_key = key
+                    total = 0
+                total += frequency
+                chains.successors.append(next_id)
+                chains.cumulative.append(total)
+            chains.offsets.append(len(chains.successors))
+            contexts[context_type] = chains
+        return words, contexts
+
+    def generate(self, context_type: str = "general", rng: Optional[random.Random] = None) -> Optional[str]:
+        """
+        A reply walked from the start of a message, or None if nothing was
+        learned for the context. Walks shorter than min_words are tried
+        again, up to attempts times, keeping the longest.
+        """
+        chains = self._contexts.get(context_type)
+        if chains is None:
+            return None
+        rng = rng or self._rng
+        best: List[int] = []
+        for _ in range(self.attempts):
+            walk = []
+            first = second = 0
+            while len(walk) < self.max_words:
+                next_id = chains.next_word(first << 32 | second, rng)
+                if not next_id:
+                    break
+                walk.append(next_id)
+                first, second = second, next_id
+            if len(walk) > len(best):
+                best = walk
+            if len(best) >= self.min_words:
+                break
+        if not best:
+            return None
+        self.generated += 1
+        return " ".join(self.words[word_id] for word_id in best)
+
+    def clear(self):
+        """Forget the loaded chains (they are read again on next use)"""
+        self.words = [BOUNDARY]
+        self._contexts = {}
+        self._loaded_at = None
+        self.chains = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Chains and words loaded, memory used per chain, loads and replies generated"""
+        nbytes = sum(chains.nbytes for chains in self._contexts.values())
+        return {
+            "chains": self.chains,
+            "words": len(self.words),
+            "contexts": len(self._contexts),
+            "array_bytes": nbytes,
+            "bytes_per_chain": nbytes / self.chains if self.chains else 0.0,
+            "loads": self.loads,
+            "last_load_ms": self.last_load_ms,
+            "generated": self.generated
+        }
+
+# Global Markov generator instance
+markov_generator = MarkovGenerator()
\ No newline at end of file
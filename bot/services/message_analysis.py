@@ -0,0 +1,98 @@
+import hashlib
+import re
+from collections import Counter
+from typing import List, Tuple
+from ..config import FILTER_LIMITS
+
+# Runs of word characters, and every other non-space character on its own
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+_SYMBOL_RE = re.compile(r"[^\w\s]")
+
+# Characters DialogueTrainer._normalize_text strips
+_UNPLAIN_RE = re.compile(r"[^\w\s!?.,]")
+
+# Pictographs, dingbats and symbols, with the joiners and variation selectors inside sequences
+_EMOJI_RE = re.compile("[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\u200D\uFE0F]+")
+
+def content_hash(normalized: str) -> bytes:
+    """16-byte digest of a normalized message"""
+    return hashlib.blake2b(normalized.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+class MessageAnalysis:
+    """
+    One incoming message as every analyzer sees it, derived once and shared by
+    the content filter, sentiment, personality traits and dialogue
+    normalization instead of each lowercasing and tokenizing on its own.
+
+    casefolded is capped at FILTER_LIMITS["max_scan_length"] characters; tokens
+    are its runs of word characters plus each other non-space character as a
+    token of its own. Everything past casefolded is computed on first use, so
+    a message that only reaches the filter never builds its token counts.
+    """
+
+    __slots__ = ("text", "length", "casefolded", "_tokens", "_token_counts", "_word_count",
+                 "_emoji_spans", "_content_hash", "_is_plain")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.length = len(text)
+        self.casefolded = text[:FILTER_LIMITS["max_scan_length"]].casefold()
+        self._tokens = None
+        self._token_counts = None
+        self._word_count = None
+        self._emoji_spans = None
+        self._content_hash = None
+        self._is_plain = None
+
+    @property
+    def tokens(self) -> List[str]:
+        """Word and symbol tokens in order"""
+        if self._tokens is None:
+            self._tokens = _TOKEN_RE.findall(self.casefolded)
+        return self._tokens
+
+    @property
+    def token_counts(self) -> Counter:
+        """Occurrences of each token"""
+        if self._token_counts is None:
+            self._token_counts = Counter(self.tokens)
+        return self._token_counts
+
+    @property
+    def word_count(self) -> int:
+        """Number of word tokens"""
+        if self._word_count is None:
+            self._word_count = len(self.tokens) - len(_SYMBOL_RE.findall(self.casefolded))
+        return self._word_count
+
+    @property
+    def emoji_spans(self) -> List[Tuple[int, int]]:
+        """(start, end) of each emoji sequence in casefolded"""
+        if self._emoji_spans is None:
+            self._emoji_spans = [] if self.casefolded.isascii() else [
+                match.span() for match in _EMOJI_RE.finditer(self.casefolded)
+            ]
+        return self._emoji_spans
+
+    @property
+    def content_hash(self) -> bytes:
+        """Digest of casefolded, e.g. for verdict cache keys"""
+        if self._content_hash is None:
+            self._content_hash = content_hash(self.casefolded)
+        return self._content_hash
+
+    @property
+    def is_plain(self) -> bool:
+        """
+        Whether the whole message is word characters, whitespace and .,!? only
+        (so dialogue normalization has nothing to strip). U+0345 is the one
+        non-word character that casefolds into a letter, hence the extra check.
+        """
+        if self._is_plain is None:
+            self._is_plain = (
+                self.length <= FILTER_LIMITS["max_scan_length"]
+                and _UNPLAIN_RE.search(self.casefolded) is None
+                and "\u0345" not in self.text
+            )
+        return self._is_plain
\ No newline at end of file
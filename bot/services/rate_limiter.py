@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+from ..config import RATE_LIMIT_SETTINGS
+
+logger = logging.getLogger('chinatsu.rate_limit')
+
+# Request priorities, most urgent first
+PRIORITY_MENTION = 0   # The bot was addressed directly
+PRIORITY_AMBIENT = 1   # The bot chose to join in
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until the next whole token (as of the last refill)"""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """
+    Async admission control for API calls: a global token bucket for the
+    whole account, plus one bucket per guild so a single busy guild cannot
+    use up the global budget.
+    Waiters queue per guild and priority. Each time tokens are available,
+    mentions are served before ambient replies, and guilds take turns
+    (round robin), so a guild with a long queue only delays the others by
+    one request per turn. A 429's Retry-After pauses every grant until it
+    has passed.
+    All state is touched only from the event loop, so concurrent acquire()
+    calls cannot both spend the same token.
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT_SETTINGS["rate"],
+                 burst: float = RATE_LIMIT_SETTINGS["burst"],
+                 guild_rate: float = RATE_LIMIT_SETTINGS["guild_rate"],
+                 guild_burst: float = RATE_LIMIT_SETTINGS["guild_burst"],
+                 max_guilds: int = RATE_LIMIT_SETTINGS["max_guilds"]):
+        now = time.monotonic()
+        self.guild_rate = guild_rate
+        self.guild_burst = guild_burst
+        self.max_guilds = max_guilds
+        self._global = TokenBucket(rate, burst, now)
+        self._guilds: Dict[Optional[str], TokenBucket] = {}
+        # One queue per priority: guild -> its waiters in arrival order; the
+        # dict order is the round-robin order
+        self._queues: List["OrderedDict[Optional[str], Deque[asyncio.Future]]"] = [OrderedDict(), OrderedDict()]
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        # Metrics
+        self.granted = 0
+        self.retry_after_pauses = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=RATE_LIMIT_SETTINGS["wait_samples"])
+
+    async def acquire(self, server_id: Optional[str] = None, priority: int = PRIORITY_AMBIENT) -> float:
+        """Wait for a request slot in a guild (None for DMs). Returns the seconds waited."""
+        key = str(server_id) if server_id is not None else None
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(key, deque()).append(waiter)
+        self._pump()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted, but cancelled before it could run: the slot was never used
+                self._refund(key)
+            else:
+                self._discard(priority, key, waiter)
+            raise
+
+        waited = time.monotonic() - start
+        self.granted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self._recent_waits.append(waited)
+        return waited
+
+    def pause(self, retry_after: float):
+        """Hold every grant for retry_after seconds (the API answered 429)"""
+        until = time.monotonic() + retry_after
+        if until > self._paused_until:
+            self._paused_until = until
+            # The burst allowance starts over once the pause ends
+            self._global.tokens = 0
+            self._global.updated = until
+        self.retry_after_pauses += 1
+        logger.warning(f"API rate limited, pausing requests for {retry_after:.1f}s")
+        self._pump()
+
+    def _discard(self, priority: int, key: Optional[str], waiter: asyncio.Future):
+        """Take a cancelled waiter out of its queue"""
+        queue = self._queues[priority]
+        waiters = queue.get(key)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del queue[key]
+
+    def _refund(self, key: Optional[str]):
+        """Give back a granted token that was never used, to the next waiter if any"""
+        now = time.monotonic()
+        # A pause since the grant already started the global budget over
+        if now >= self._paused_until:
+            self._global.refill(now)
+            self._global.tokens = min(self._global.capacity, self._global.tokens + 1)
+        bucket = self._guilds.get(key)
+        if bucket is not None:
+            bucket.refill(now)
+            bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+        self._pump()
+
+    def _bucket(self, key: Optional[str], now: float) -> TokenBucket:
+        bucket = self._guilds.get(key)
+        if bucket is None:
+            if len(self._guilds) >= self.max_guilds:
+                self._prune(now)
+            bucket = self._guilds[key] = TokenBucket(self.guild_rate, self.guild_burst, now)
+        else:
+            bucket.refill(now)
+        return bucket
+
+    def _prune(self, now: float):
+        """Forget guilds with nothing queued whose bucket has refilled (a new one would be identical)"""
+        queued = {key for queue in self._queues for key in queue}
+        for key, bucket in list(self._guilds.items()):
+            bucket.refill(now)
+            if key not in queued and bucket.tokens >= bucket.capacity:
+                del self._guilds[key]
+
+    def _pump(self):
+        """Grant every waiter the buckets allow now, and schedule the next check if any are left"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        if now < self._paused_until:
+            self._schedule(self._paused_until - now)
+            return
+
+        self._global.refill(now)
+        guild_wait = None
+        for queue in self._queues:
+            granted = True
+            # One grant per guild per pass, until the global bucket runs dry
+            # or every guild left is over its own rate
+            while granted and queue and self._global.tokens >= 1:
+                granted = False
+                for key in list(queue):
+                    if self._global.tokens < 1:
+                        break
+                    waiters = queue[key]
+                    # A cancelled waiter can still be queued until its task runs _discard
+                    while waiters and waiters[0].done():
+                        waiters.popleft()
+                    if not waiters:
+                        del queue[key]
+                        continue
+                    bucket = self._bucket(key, now)
+                    if bucket.tokens < 1:
+                        wait = bucket.wait_time()
+                        guild_wait = wait if guild_wait is None else min(guild_wait, wait)
+                        continue
+                    waiters.popleft().set_result(None)
+                    bucket.tokens -= 1
+                    self._global.tokens -= 1
+                    granted = True
+                    if waiters:
+                        queue.move_to_end(key)
+                    else:
+                        del queue[key]
+
+        if any(self._queues):
+            if self._global.tokens < 1:
+                self._schedule(self._global.wait_time())
+            elif guild_wait is not None:
+                self._schedule(guild_wait)
+
+    def _schedule(self, delay: float):
+        self._timer = asyncio.get_running_loop().call_later(delay, self._pump)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth by priority, grants, wait times and Retry-After pauses"""
+        waits = sorted(self._recent_waits)
+        return {
+            "queued_mentions": sum(len(waiters) for waiters in self._queues[PRIORITY_MENTION].values()),
+            "queued_ambient": sum(len(waiters) for waiters in self._queues[PRIORITY_AMBIENT].values()),
+            "queued_guilds": len({key for queue in self._queues for key in queue}),
+            "granted": self.granted,
+            "avg_wait": self.total_wait / self.granted if self.granted else 0.0,
+            "p95_wait": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "max_wait": self.max_wait,
+            "retry_after_pauses": self.retry_after_pauses,
+            "paused_for": max(0.0, self._paused_until - time.monotonic()),
+            "tracked_guilds": len(self._guilds)
+        }
+
+# Global rate limiter instance
+rate_limiter = RateLimiter()
\ No newline at end of file
@@ -0,0 +1,135 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from ..config import RESPONSE_CACHE_SETTINGS
+from ..database.async_db import async_db, AsyncDatabase
+
+# Punctuation, symbols and emoji; "Hi!!" and "hi" ask the same thing
+_NOISE_RE = re.compile(r"[^\w\s]+")
+
+class ResponseCache:
+    """
+    Two-tier cache of generated replies, checked before calling the API.
+    The first tier is an in-memory LRU keyed by the normalized message
+    (casefolded, punctuation dropped, whitespace collapsed) and a persona
+    fingerprint, i.e. everything the system prompt depends on, so a reply is
+    only reused for the same kind of prompt. Behind it, response_patterns is
+    read through by the exact message: a stored reply is used while its
+    success_rate and reuse count are high enough, and is then kept in the
+    first tier. Stored replies carry no persona, so callers still run every
+    hit through the guild's content filter.
+    Both tiers expire after ttl seconds (a stored reply counts from when it
+    was generated), so a stale answer is generated again and the fresh one
+    replaces it.
+    Only short messages are cached; long ones rarely repeat word for word.
+    """
+
+    _LOOKUP_QUERY = """
+        SELECT response_template, (julianday('now') - julianday(last_used)) * 86400 AS age
+        FROM response_patterns
+        WHERE input_pattern = ? AND success_rate >= ? AND usage_count >= ?
+            AND last_used >= datetime('now', ?)
+    """
+
+    def __init__(self, db: AsyncDatabase = async_db,
+                 max_entries: int = RESPONSE_CACHE_SETTINGS["max_entries"],
+                 ttl: float = RESPONSE_CACHE_SETTINGS["ttl"],
+                 min_success_rate: float = RESPONSE_CACHE_SETTINGS["min_success_rate"],
+                 min_uses: int = RESPONSE_CACHE_SETTINGS["min_uses"],
+                 max_message_length: int = RESPONSE_CACHE_SETTINGS["max_message_length"]):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_success_rate = min_success_rate
+        self.min_uses = min_uses
+        self.max_message_length = max_message_length
+        self._entries: "OrderedDict[Tuple, Tuple[float, str]]" = OrderedDict()
+
+        # Metrics
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Casefolded words of a message, single-spaced"""
+        return " ".join(_NOISE_RE.sub(" ", message.casefold()).split())
+
+    def _key(self, message: str, persona: Hashable) -> Optional[Tuple]:
+        if len(message) > self.max_message_length:
+            return None
+        normalized = self.normalize(message)
+        return (normalized, persona) if normalized else None
+
+    async def get(self, message: str, persona: Hashable) -> Optional[str]:
+        """A cached reply to a message for a persona, or None (uncacheable messages are not counted)"""
+        key = self._key(message, persona)
+        if key is None:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, response = entry
+            if time.monotonic() - stored_at <= self.ttl:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return response
+            del self._entries[key]
+            self.expired += 1
+
+        row = await self.db.fetch_one(
+            self._LOOKUP_QUERY,
+            (message, self.min_success_rate, self.min_uses, f"-{int(self.ttl)} seconds")
+        )
+        if row is None or not row["response_template"]:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        self._store(key, row["response_template"], max(0.0, row["age"] or 0.0))
+        return row["response_template"]
+
+    def put(self, message: str, persona: Hashable, response: str):
+        """Keep a freshly generated reply"""
+        key = self._key(message, persona)
+        if key is not None:
+            self._store(key, response)
+
+    def reject(self, message: str, persona: Hashable):
+        """Drop a cached reply the caller could not use (e.g. the guild's filter blocks it)"""
+        key = self._key(message, persona)
+        if key is not None and self._entries.pop(key, None) is not None:
+            self.rejected += 1
+
+    def _store(self, key: Tuple, response: str, age: float = 0.0):
+        self._entries[key] = (time.monotonic() - age, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every in-memory entry"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits per tier, hit ratio, and API calls avoided (one per hit)"""
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "api_calls_avoided": hits - self.rejected,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "entries": len(self._entries)
+        }
+
+# Global response cache instance
+response_cache = ResponseCache()
\ No newline at end of file
@@ -1,58 +1,299 @@
+import asyncio
 import json
-import time
 import logging
+import time
 import aiohttp
-from typing import Dict, Optional, Tuple
-from ..config import MISTRAL_API_KEY, GENERATION_LIMITS
-from .content_filter import content_filter
-from ..database.models import UserRelations, LearningData
+from contextlib import aclosing
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from ..config import MISTRAL_API_KEY, GENERATION_LIMITS, HTTP_SETTINGS, RATE_LIMIT_SETTINGS, STREAM_FILTER_SETTINGS
+from .circuit_breaker import CircuitBreaker, circuit_breaker
+from .content_filter import IncrementalFilter, content_filter
+from .dialouge_training import DialogueTrainer
+from .markov import MarkovGenerator, markov_generator
+from .message_analysis import MessageAnalysis
+from .rate_limiter import PRIORITY_AMBIENT, PRIORITY_MENTION, RateLimiter, rate_limiter
+from .response_cache import ResponseCache, response_cache
+from .streaming_reply import StreamingReply
+from ..database.async_db import async_db
+from .user_cache import user_cache
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or an HTTP date), capped; None if absent or invalid"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), RATE_LIMIT_SETTINGS["max_retry_after"])
 
 class ResponseGenerator:
-    def __init__(self):
+    def __init__(self, rate_limiter: RateLimiter = rate_limiter, response_cache: ResponseCache = response_cache,
+                 circuit_breaker: CircuitBreaker = circuit_breaker, dialogue_trainer: Optional[DialogueTrainer] = None,
+                 markov_generator: MarkovGenerator = markov_generator):
         self.api_url = "https://api.mistral.ai/v1/chat/completions"
         self.headers = {
             "Authorization": f"Bearer {MISTRAL_API_KEY}",
             "Content-Type": "application/json"
         }
-        self.last_api_call = 0
-        self.min_api_interval = 1  # seconds between API calls
-        
-    async def _make_api_call(self, messages: list, max_retries: int = 3) -> Optional[str]:
-        """Make an API call to Mistral with retry logic"""
-        # Rate limiting
-        current_time = time.time()
-        if current_time - self.last_api_call < self.min_api_interval:
-            await asyncio.sleep(self.min_api_interval - (current_time - self.last_api_call))
-        
+        self.rate_limiter = rate_limiter
+        self.response_cache = response_cache
+        self.circuit_breaker = circuit_breaker
+        # Makes replies locally while the API is unavailable (the bot sets its trainer)
+        self.dialogue_trainer = dialogue_trainer
+        self.markov_generator = markov_generator
+        self.session: Optional[aiohttp.ClientSession] = None
+        # (messages, filter fingerprint) -> (API call in flight, its monitor, delta listeners)
+        self._in_flight: Dict[Tuple, Tuple[asyncio.Future, IncrementalFilter, List[Callable]]] = {}
+
+        # Metrics
+        self.streams = 0
+        self.streams_aborted = 0
+        self.regenerations = 0
+        self.coalesced = 0
+        self.short_circuited = 0
+        self.deadline_exceeded = 0
+        self.local_responses = 0
+
+    async def start(self):
+        """
+        Open the shared HTTP session. Its connections are kept alive and
+        reused across calls, so only the first request to the API pays for
+        DNS, TCP and TLS setup.
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_SETTINGS["limit"],
+                limit_per_host=HTTP_SETTINGS["limit_per_host"],
+                keepalive_timeout=HTTP_SETTINGS["keepalive_timeout"],
+                ttl_dns_cache=HTTP_SETTINGS["ttl_dns_cache"]
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=HTTP_SETTINGS["total_timeout"],
+                connect=HTTP_SETTINGS["connect_timeout"],
+                sock_read=HTTP_SETTINGS["sock_read_timeout"]
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers)
+
+    async def stop(self):
+        """Close the shared HTTP session and its pooled connections"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @staticmethod
+    async def _read_stream(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        """Content deltas of a streamed (server-sent events) chat completion"""
+        data = []
+        async for line in response.content:
+            line = line.decode("utf-8").rstrip("\r\n")
+            if line.startswith("data:"):
+                data.append(line[5:].lstrip())
+                continue
+            if line or not data:
+                continue
+            # A blank line ends the event
+            payload = "\n".join(data)
+            data = []
+            if payload == "[DONE]":
+                return
+            delta = json.loads(payload)["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+    async def _make_api_call(self, messages: list, max_retries: int = 3,
+                             monitor: Optional[IncrementalFilter] = None,
+                             server_id: Optional[str] = None, priority: int = PRIORITY_AMBIENT,
+                             on_delta: Optional[Callable[[Optional[str]], None]] = None,
+                             deadline: Optional[float] = None) -> Optional[str]:
+        """
+        Make a streamed API call to Mistral with retry logic.
+        Every attempt first asks the circuit breaker, then waits for the rate
+        limiter (in server_id's queue, at priority); a 429 pauses the limiter
+        for its Retry-After. While the breaker is open None is returned at once.
+        With a deadline (time.monotonic()), waiting, requests and backoff are
+        all cut short by it, and None is returned once it has passed.
+        With a monitor, every delta is fed to it as it arrives; once it flags
+        the text the stream is closed (so the API stops generating) and None
+        is returned, with the result left in monitor.flagged.
+        on_delta gets every delta too, and None whenever an attempt starts.
+        """
         for attempt in range(max_retries):
+            if deadline is not None and time.monotonic() >= deadline:
+                self.deadline_exceeded += 1
+                break
+            token = self.circuit_breaker.allow()
+            if token is None:
+                self.short_circuited += 1
+                return None
+            # (succeeded, latency) to tell the breaker; None if the attempt said nothing about the API
+            outcome = None
+            started = None
+            failed = False
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        self.api_url,
-                        headers=self.headers,
-                        json={
-                            "model": "mistral-tiny",
-                            "messages": messages,
-                            "max_tokens": GENERATION_LIMITS["max_response_length"],
-                            "temperature": 0.7
-                        },
-                        timeout=30
-                    ) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            self.last_api_call = time.time()
-                            return data["choices"][0]["message"]["content"]
-                        else:
-                            error_text = await response.text()
-                            logging.error(f"API error (attempt {attempt + 1}): {error_text}")
-                            
+                remaining = self._remaining(deadline)
+                await asyncio.wait_for(self.rate_limiter.acquire(server_id, priority), remaining)
+                if monitor is not None:
+                    monitor.reset()
+                if on_delta is not None:
+                    on_delta(None)
+                # Opened on first use when running outside the bot lifecycle
+                if self.session is None or self.session.closed:
+                    await self.start()
+                remaining = self._remaining(deadline)
+                started = time.monotonic()
+                async with self.session.post(
+                    self.api_url,
+                    json={
+                        "model": "mistral-tiny",
+                        "messages": messages,
+                        "max_tokens": GENERATION_LIMITS["max_response_length"],
+                        "temperature": 0.7,
+                        "stream": True
+                    },
+                    timeout=aiohttp.ClientTimeout(
+                        total=HTTP_SETTINGS["total_timeout"] if remaining is None
+                        else max(min(HTTP_SETTINGS["total_timeout"], remaining), 0.01),
+                        connect=HTTP_SETTINGS["connect_timeout"],
+                        sock_read=HTTP_SETTINGS["sock_read_timeout"]
+                    )
+                ) as response:
+                    if response.status == 200:
+                        self.streams += 1
+                        parts = []
+                        latency = None
+                        async with aclosing(self._read_stream(response)) as deltas:
+                            async for delta in deltas:
+                                if latency is None:
+                                    latency = time.monotonic() - started
+                                parts.append(delta)
+                                if on_delta is not None:
+                                    on_delta(delta)
+                                if monitor is not None and monitor.feed(delta):
+                                    # Drop the connection rather than read out the rest
+                                    response.close()
+                                    self.streams_aborted += 1
+                                    outcome = (True, latency)
+                                    return None
+                        outcome = (True, latency if latency is not None else time.monotonic() - started)
+                        return "".join(parts)
+                    elif response.status == 429:
+                        self.rate_limiter.pause(_retry_after(response.headers.get("Retry-After")) or 2 ** attempt)
+                        logging.error(f"API rate limited (attempt {attempt + 1})")
+                    else:
+                        error_text = await response.text()
+                        logging.error(f"API error (attempt {attempt + 1}): {error_text}")
+                        if response.status >= 500:
+                            outcome = (False, time.monotonic() - started)
+
             except Exception as e:
-                logging.error(f"API call failed (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                    
+                failed = True
+                # Running out of time in the rate limiter's queue says nothing about the API
+                if started is not None:
+                    outcome = (False, time.monotonic() - started)
+                if self._remaining(deadline) == 0:
+                    logging.error(f"API call ran past its deadline (attempt {attempt + 1})")
+                else:
+                    logging.error(f"API call failed (attempt {attempt + 1}): {e}")
+            finally:
+                if outcome is None:
+                    self.circuit_breaker.release(token)
+                else:
+                    self.circuit_breaker.record(token, *outcome)
+
+            if failed and attempt < max_retries - 1:
+                backoff = 2 ** attempt  # Exponential backoff
+                if deadline is not None and time.monotonic() + backoff >= deadline:
+                    self.deadline_exceeded += 1
+                    break
+                await asyncio.sleep(backoff)
+
         return None
-        
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        """Seconds left until a deadline (never negative), or None without one"""
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    async def _shared_api_call(self, messages: list, monitor: IncrementalFilter,
+                               server_id: Optional[str] = None,
+                               priority: int = PRIORITY_AMBIENT,
+                               on_delta: Optional[Callable[[Optional[str]], None]] = None,
+                               deadline: Optional[float] = None) -> Optional[str]:
+        """
+        _make_api_call, shared by concurrent callers with the same messages and
+        an equivalent filter (singleflight): the first caller makes the call,
+        the others wait for it and adopt its text and filter outcome into their
+        own monitor, so each still runs its own finish() and logging. Callers
+        that arrive after the call completed make a new one.
+        Every caller's on_delta follows the shared stream; one that joins late
+        is first given the text so far. The call keeps the first caller's
+        deadline; each caller stops waiting at its own.
+        """
+        key = (tuple((message["role"], message["content"]) for message in messages), monitor.fingerprint)
+        shared = self._in_flight.get(key)
+        if shared is None:
+            listeners = []
+
+            def fan_out(delta: Optional[str]):
+                for listener in listeners:
+                    listener(delta)
+
+            call = asyncio.ensure_future(self._make_api_call(
+                messages, monitor=monitor, server_id=server_id, priority=priority, on_delta=fan_out,
+                deadline=deadline
+            ))
+            self._in_flight[key] = (call, monitor, listeners)
+            call.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            source = None
+        else:
+            call, source, listeners = shared
+            self.coalesced += 1
+            if on_delta is not None:
+                on_delta(None)
+                if source.text:
+                    on_delta(source.text)
+
+        if on_delta is not None:
+            listeners.append(on_delta)
+        try:
+            # A cancelled (or timed out) caller must not cancel the call others may be waiting on
+            response = await asyncio.wait_for(asyncio.shield(call), self._remaining(deadline))
+        except asyncio.TimeoutError:
+            self.deadline_exceeded += 1
+            return None
+        finally:
+            if on_delta is not None:
+                listeners.remove(on_delta)
+        if source is not None:
+            monitor.adopt(source.text, source.flagged)
+        return response
+
+    async def _local_response(self, server_id: Optional[str] = None) -> str:
+        """
+        A reply made without the API: the most used learned line, else one
+        generated from learned word chains, whichever the guild's filter passes
+        """
+        # Messages are learned under the "general" context (see ChinatsuBot.on_message)
+        candidates = []
+        if self.dialogue_trainer is not None:
+            candidates.append(await self.dialogue_trainer.get_character_response("general"))
+        try:
+            await self.markov_generator.ensure_loaded()
+            candidates.append(self.markov_generator.generate("general"))
+        except Exception as e:
+            logging.error(f"Error generating from word chains: {e}")
+        for response in candidates:
+            if response and not (await content_filter.filter_message(response, server_id))["is_filtered"]:
+                self.local_responses += 1
+                return response
+        return "I'm having trouble connecting to my brain right now. Please try again later."
+
     def _build_system_prompt(self, user_data: Dict, server_settings: Dict) -> str:
         """Build the system prompt based on user data and server settings"""
         base_prompt = "You are Chinatsu, a friendly and helpful Discord bot. "
@@ -76,54 +317,115 @@ class ResponseGenerator:
             
         return base_prompt
         
+    @staticmethod
+    def _persona(user_data: Dict, server_settings: Dict) -> Tuple:
+        """Everything _build_system_prompt depends on, as a response cache key"""
+        reputation = user_data.get("reputation", 0)
+        mature_enabled = server_settings.get("mature_enabled", False)
+        return (
+            1 if reputation > 50 else -1 if reputation < -20 else 0,
+            mature_enabled,
+            server_settings.get("mature_level", 1) if mature_enabled else 0,
+            user_data.get("interactions", 0) > 100
+        )
+        
     async def generate_response(
         self,
         user_message: str,
         user_id: int,
-        server_id: Optional[str] = None
+        server_id: Optional[str] = None,
+        analysis: Optional[MessageAnalysis] = None,
+        mentioned: bool = False,
+        reply: Optional[StreamingReply] = None,
+        deadline: Optional[float] = None
     ) -> Tuple[str, Dict]:
-        """Generate a response to the user message"""
+        """
+        Generate a response to the user message (analysis: its MessageAnalysis,
+        if already built). A cached reply for the same message and persona is
+        used instead when the guild allows it and its filter passes it.
+        Replies to direct mentions are queued ahead of ambient ones for the API.
+        With a reply, the generation is shown in it while it streams (only
+        what the guild's filter passes); the caller then finishes it with the
+        returned text.
+        API calls stop at the deadline (time.monotonic(); reply_deadline from
+        now by default). When they fail, run out of time or are refused by the
+        open circuit breaker, the reply is made locally from learned dialogue.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + GENERATION_LIMITS["reply_deadline"]
         # Get user data and server settings
-        user_data = UserRelations.get_user(user_id)
+        user_data = await user_cache.get_user(user_id)
         
         # Check content safety
-        filter_results = await content_filter.filter_message(user_message, server_id)
+        filter_results = await content_filter.filter_message(user_message, server_id, analysis)
         if filter_results["is_filtered"]:
             return (
                 "I cannot respond to that type of message. " + filter_results["checks"]["jailbreak"]["reason"],
                 filter_results
             )
             
+        server_settings = filter_results["server_settings"]
+        persona = self._persona(user_data, server_settings)
+        use_cache = server_settings.get("response_cache", True)
+        if use_cache:
+            cached = await self.response_cache.get(user_message, persona)
+            if cached is not None:
+                if not (await content_filter.filter_message(cached, server_id))["is_filtered"]:
+                    return cached, filter_results
+                self.response_cache.reject(user_message, persona)
+            
         # Build conversation context
-        system_prompt = self._build_system_prompt(user_data, filter_results["server_settings"])
+        system_prompt = self._build_system_prompt(user_data, server_settings)
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message}
         ]
         
-        # Generate response
-        response = await self._make_api_call(messages)
+        # Generate response, checking it while it streams: a flagged
+        # generation is cut off and a safer one requested right away
+        response = None
+        for attempt in range(STREAM_FILTER_SETTINGS["max_regenerations"] + 1):
+            if attempt == 1:
+                messages = messages + [
+                    {"role": "system", "content": "Your previous response was flagged as inappropriate. Please provide a completely safe and appropriate response instead."}
+                ]
+            if attempt:
+                self.regenerations += 1
+            monitor = await content_filter.incremental(server_id)
+            if reply is not None:
+                reply.check = lambda text, monitor=monitor: not content_filter.scan(
+                    text, monitor.server_settings, monitor.rules
+                )["is_filtered"]
+            response = await self._shared_api_call(
+                messages, monitor, server_id=server_id,
+                priority=PRIORITY_MENTION if mentioned else PRIORITY_AMBIENT,
+                on_delta=reply.feed if reply is not None else None, deadline=deadline
+            )
+            if not response and monitor.flagged is None:
+                if attempt == 0:
+                    return await self._local_response(server_id), filter_results
+                break
+            if response and not monitor.finish()["is_filtered"]:
+                break
+            response = None
         if not response:
-            return "I'm having trouble connecting to my brain right now. Please try again later.", filter_results
+            # Not stored: the fallback must never be served from the cache
+            return "I apologize, but I need to keep my response appropriate.", filter_results
             
-        # Check response safety
-        response_filter = await content_filter.filter_message(response, server_id)
-        if response_filter["is_filtered"]:
-            # If our response was flagged, generate a safer one
-            safe_messages = messages + [
-                {"role": "system", "content": "Your previous response was flagged as inappropriate. Please provide a completely safe and appropriate response instead."}
-            ]
-            response = await self._make_api_call(safe_messages) or "I apologize, but I need to keep my response appropriate."
+        if use_cache:
+            self.response_cache.put(user_message, persona, response)
             
-        # Store interaction for learning
+        # Store interaction for learning (a fresh reply replaces a stale one)
         try:
-            LearningData.execute_query(
+            await async_db.execute(
                 """
                 INSERT INTO response_patterns (input_pattern, response_template, success_rate)
                 VALUES (?, ?, 1.0)
                 ON CONFLICT(input_pattern) DO UPDATE SET
+                    response_template = excluded.response_template,
                     usage_count = usage_count + 1,
-                    success_rate = (success_rate * usage_count + 1.0) / (usage_count + 1)
+                    success_rate = (success_rate * usage_count + 1.0) / (usage_count + 1),
+                    last_used = CURRENT_TIMESTAMP
                 """,
                 (user_message, response)
             )
@@ -132,5 +434,21 @@ class ResponseGenerator:
             
         return response, filter_results
 
+    def stats(self) -> Dict[str, Any]:
+        """Streamed completions, how many were cut off by the filter, regenerations, coalesced calls, local fallbacks, the circuit breaker, rate limiting and the response cache"""
+        return {
+            "streams": self.streams,
+            "streams_aborted": self.streams_aborted,
+            "regenerations": self.regenerations,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+            "short_circuited": self.short_circuited,
+            "deadline_exceeded": self.deadline_exceeded,
+            "local_responses": self.local_responses,
+            "circuit_breaker": self.circuit_breaker.stats(),
+            "rate_limit": self.rate_limiter.stats(),
+            "response_cache": self.response_cache.stats()
+        }
+
 # Global response generator instance
 response_generator = ResponseGenerator() 
\ No newline at end of file
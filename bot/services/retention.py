@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from ..config import GENERATION_LIMITS, RETENTION_SETTINGS
+from ..database.connection import db_manager, DatabaseConnectionManager
+
+logger = logging.getLogger('chinatsu.retention')
+
+class RetentionPolicy:
+    """
+    One table's retention rule.
+    select_sql picks the ids of up to `?` rows to delete next (its last
+    parameter is the batch size); params supplies the ones before it.
+    """
+    
+    def __init__(self, name: str, table: str, select_sql: str, params: tuple = ()):
+        self.name = name
+        self.table = table
+        self.select_sql = select_sql
+        self.params = params
+        
+    def delete_batch(self, conn, batch_size: int) -> int:
+        """Runs on the writer thread"""
+        return conn.execute(
+            f"DELETE FROM {self.table} WHERE id IN ({self.select_sql})",
+            self.params + (batch_size,)
+        ).rowcount
+
+def default_policies() -> List[RetentionPolicy]:
+    """Retention rules built from GENERATION_LIMITS and RETENTION_SETTINGS"""
+    max_entries = GENERATION_LIMITS["max_learning_entries"]
+    return [
+        # Keep the most used (then most recent) dialogue patterns
+        RetentionPolicy(
+            "dialogue_top_n",
+            "dialogue_patterns",
+            "SELECT id FROM (SELECT id FROM dialogue_patterns "
+            "ORDER BY usage_count DESC, created_at DESC, id DESC LIMIT -1 OFFSET ?) LIMIT ?",
+            (max_entries,)
+        ),
+        # Response patterns that were stored once and never matched again
+        RetentionPolicy(
+            "response_one_off",
+            "response_patterns",
+            "SELECT id FROM response_patterns WHERE usage_count <= 1 AND last_used < datetime('now', ?) "
+            "ORDER BY id LIMIT ?",
+            (f"-{RETENTION_SETTINGS['one_off_pattern_days']} days",)
+        ),
+        RetentionPolicy(
+            "response_top_n",
+            "response_patterns",
+            "SELECT id FROM (SELECT id FROM response_patterns "
+            "ORDER BY usage_count DESC, last_used DESC, id DESC LIMIT -1 OFFSET ?) LIMIT ?",
+            (max_entries,)
+        ),
+        # Oldest first through idx_conversation_timestamp, so a run with nothing expired reads one index entry
+        RetentionPolicy(
+            "conversation_age",
+            "conversation_log",
+            "SELECT id FROM conversation_log WHERE timestamp < datetime('now', ?) ORDER BY timestamp LIMIT ?",
+            (f"-{RETENTION_SETTINGS['conversation_log_days']} days",)
+        ),
+        RetentionPolicy(
+            "word_chains_top_n",
+            "word_chains",
+            "SELECT id FROM (SELECT id FROM word_chains "
+            "ORDER BY frequency DESC, id DESC LIMIT -1 OFFSET ?) LIMIT ?",
+            (max_entries,)
+        ),
+    ]
+
+class RetentionEngine:
+    """
+    Background retention and compaction.
+    Each policy deletes in small batches, one writer job per batch, so other
+    writes interleave and the writer is never held for long. Freed pages are
+    then handed back to the OS with incremental vacuum, once the file is in
+    incremental auto_vacuum mode. Switching an existing file over takes a
+    full VACUUM that holds the writer throughout, so it is never done in the
+    background: the owner runs it with compact().
+    """
+    
+    def __init__(
+        self,
+        manager: DatabaseConnectionManager = db_manager,
+        policies: Optional[List[RetentionPolicy]] = None,
+        interval: float = RETENTION_SETTINGS["interval"],
+        batch_size: int = RETENTION_SETTINGS["batch_size"],
+        batch_pause: float = RETENTION_SETTINGS["batch_pause"],
+        vacuum_pages: int = RETENTION_SETTINGS["vacuum_pages"]
+    ):
+        self.manager = manager
+        self.policies = policies if policies is not None else default_policies()
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_pages = vacuum_pages
+        self._loop_task: Optional[asyncio.Task] = None
+        self._run_lock = asyncio.Lock()
+        # Whether the file is in incremental auto_vacuum mode; None until checked
+        self.incremental_vacuum: Optional[bool] = None
+        
+        # Metrics
+        self.runs = 0
+        self.last_run: Dict[str, Any] = {}
+        
+    async def _write(self, fn, exclusive: bool = False):
+        return await asyncio.wrap_future(self.manager.submit(fn, exclusive=exclusive))
+        
+    @staticmethod
+    def _vacuum_state(conn) -> Tuple[bool, int]:
+        """(whether auto_vacuum is INCREMENTAL, file size in bytes)"""
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        size = conn.execute("SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size()").fetchone()[0]
+        return incremental, size
+        
+    @staticmethod
+    def _enable_incremental_vacuum(conn) -> bool:
+        """
+        Switch the file to auto_vacuum=INCREMENTAL. Existing databases need a
+        one-off full VACUUM for the mode to take effect.
+        """
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+        
+    async def compact(self) -> Dict[str, Any]:
+        """
+        Switch the file to incremental auto_vacuum with a full VACUUM (every
+        write waits until it is done). Returns the file size before and after.
+        """
+        async with self._run_lock:
+            incremental, size_before = await self._write(self._vacuum_state, exclusive=True)
+            if not incremental:
+                logger.info(f"Compacting the {size_before / 2 ** 20:.1f} MB database; writes wait until it is done")
+            start = time.perf_counter()
+            converted = await self._write(self._enable_incremental_vacuum, exclusive=True)
+            self.incremental_vacuum, size_after = await self._write(self._vacuum_state, exclusive=True)
+            result = {
+                "converted": converted,
+                "size_before": size_before,
+                "size_after": size_after,
+                "duration_ms": (time.perf_counter() - start) * 1000
+            }
+            logger.info(f"Database compaction: {result}")
+            return result
+        
+    @staticmethod
+    def _freelist_count(conn) -> int:
+        return conn.execute("PRAGMA freelist_count").fetchone()[0]
+        
+    async def run_once(self) -> Dict[str, Any]:
+        """Apply every policy, then compact. Returns per-policy delete counts."""
+        async with self._run_lock:
+            start = time.perf_counter()
+            if self.incremental_vacuum is None:
+                self.incremental_vacuum, size = await self._write(self._vacuum_state, exclusive=True)
+                if not self.incremental_vacuum:
+                    logger.warning(
+                        f"Database is {size / 2 ** 20:.1f} MB and not in incremental auto_vacuum mode; "
+                        f"freed pages stay in the file until the owner runs /compact_database"
+                    )
+                
+            deleted: Dict[str, int] = {}
+            for policy in self.policies:
+                total = 0
+                while True:
+                    count = await self._write(
+                        lambda conn, policy=policy: policy.delete_batch(conn, self.batch_size)
+                    )
+                    total += count
+                    if count < self.batch_size:
+                        break
+                    await asyncio.sleep(self.batch_pause)
+                deleted[policy.name] = total
+                
+            free_before = free_after = 0
+            if self.incremental_vacuum:
+                free_before = await self._write(self._freelist_count, exclusive=True)
+                # executescript steps the pragma to completion; execute() frees a single page
+                await self._write(
+                    lambda conn: conn.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});"),
+                    exclusive=True
+                )
+                free_after = await self._write(self._freelist_count, exclusive=True)
+            
+            self.runs += 1
+            self.last_run = {
+                "deleted": deleted,
+                "pages_released": free_before - free_after,
+                "duration_ms": (time.perf_counter() - start) * 1000
+            }
+            if any(deleted.values()):
+                logger.info(f"Retention removed {sum(deleted.values())} rows: {deleted}")
+            return self.last_run
+            
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Retention run failed: {e}")
+            await asyncio.sleep(self.interval)
+            
+    def start(self):
+        """Start the periodic retention task on the running loop"""
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.get_running_loop().create_task(self._run())
+            
+    async def stop(self):
+        """Stop the periodic task"""
+        if self._loop_task:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+            
+    def stats(self) -> Dict[str, Any]:
+        """Run count, auto_vacuum mode and the outcome of the last run"""
+        return {"runs": self.runs, "incremental_vacuum": self.incremental_vacuum, **self.last_run}
+
+# Global retention engine instance
+retention_engine = RetentionEngine()
\ No newline at end of file
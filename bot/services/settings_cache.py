@@ -0,0 +1,129 @@
+import logging
+from typing import Dict, Any, Optional
+from ..database.async_db import async_db, AsyncDatabase
+
+class SettingsCache:
+    """
+    In-process cache for filter_settings, server_activation and channel_activation.
+    Entries load lazily per guild/channel on first use and are invalidated or
+    updated by the admin commands that write those tables, so the per-message
+    lookup is a dict hit.
+    """
+    
+    def __init__(self, db: AsyncDatabase = async_db):
+        self.db = db
+        self._filter_settings: Dict[str, Dict[str, Any]] = {}
+        self._server_active: Dict[str, bool] = {}
+        self._channel_active: Dict[str, bool] = {}
+        # Bumped on every invalidation so a load that raced with an admin
+        # write doesn't store the stale row it read; _epoch is bumped by
+        # clear() and counts towards every key, including ones never bumped
+        self._versions: Dict[tuple, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        
+    def _version(self, key: tuple) -> int:
+        # Both parts only grow, so any bump gives a version never seen before
+        return self._epoch + self._versions.get(key, 0)
+        
+    def _bump(self, key: tuple):
+        self._versions[key] = self._versions.get(key, 0) + 1
+        
+    async def get_filter_settings(self, server_id: str) -> Dict[str, Any]:
+        """Filter settings for a guild ({} when the guild has none stored)"""
+        server_id = str(server_id)
+        settings = self._filter_settings.get(server_id)
+        if settings is not None:
+            self.hits += 1
+            return dict(settings)
+            
+        self.misses += 1
+        version = self._version(("filter", server_id))
+        row = await self.db.fetch_one(
+            "SELECT filter_enabled, mature_enabled, mature_level, rules_version, response_cache "
+            "FROM filter_settings WHERE server_id = ?",
+            (server_id,)
+        )
+        settings = {}
+        if row:
+            settings = {
+                "filter_enabled": bool(row["filter_enabled"]),
+                "mature_enabled": bool(row["mature_enabled"]),
+                "mature_level": int(row["mature_level"]),
+                "rules_version": int(row["rules_version"] or 0),
+                "response_cache": row["response_cache"] is None or bool(row["response_cache"])
+            }
+        if version == self._version(("filter", server_id)):
+            self._filter_settings[server_id] = settings
+        return dict(settings)
+        
+    async def _get_active(self, cache: Dict[str, bool], kind: str, table: str, column: str, key: str) -> bool:
+        active = cache.get(key)
+        if active is not None:
+            self.hits += 1
+            return active
+            
+        self.misses += 1
+        version = self._version((kind, key))
+        row = await self.db.fetch_one(
+            f"SELECT active FROM {table} WHERE {column} = ?",
+            (key,)
+        )
+        # Rows default to active, and so does a missing row
+        active = bool(row["active"]) if row else True
+        if version == self._version((kind, key)):
+            cache[key] = active
+        return active
+        
+    async def is_server_active(self, server_id: str) -> bool:
+        """Whether the bot is activated for a guild"""
+        return await self._get_active(self._server_active, "server", "server_activation", "server_id", str(server_id))
+        
+    async def is_channel_active(self, channel_id: str) -> bool:
+        """Whether the bot is activated for a channel"""
+        return await self._get_active(self._channel_active, "channel", "channel_activation", "channel_id", str(channel_id))
+        
+    def filter_settings_version(self, server_id: str) -> int:
+        """Counter bumped whenever a guild's filter settings change or the cache is cleared"""
+        return self._version(("filter", str(server_id)))
+        
+    def invalidate_filter_settings(self, server_id: str):
+        """Drop a guild's filter settings after they were written"""
+        server_id = str(server_id)
+        self._bump(("filter", server_id))
+        self._filter_settings.pop(server_id, None)
+        
+    def set_server_active(self, server_id: str, active: bool):
+        """Record a guild activation change that was just written"""
+        server_id = str(server_id)
+        self._bump(("server", server_id))
+        self._server_active[server_id] = active
+        
+    def set_channel_active(self, channel_id: str, active: bool):
+        """Record a channel activation change that was just written"""
+        channel_id = str(channel_id)
+        self._bump(("channel", channel_id))
+        self._channel_active[channel_id] = active
+        
+    def clear(self):
+        """Drop every cached entry"""
+        self._epoch += 1
+        self._filter_settings.clear()
+        self._server_active.clear()
+        self._channel_active.clear()
+        
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and entry counts"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "filter_entries": len(self._filter_settings),
+            "server_entries": len(self._server_active),
+            "channel_entries": len(self._channel_active)
+        }
+
+# Global settings cache instance
+settings_cache = SettingsCache()
\ No newline at end of file
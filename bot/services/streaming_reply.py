@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+from ..config import STREAMING_REPLY_SETTINGS
+
+logger = logging.getLogger('chinatsu.streaming_reply')
+
+# The end of a sentence (closing quotes and brackets included) or of a line
+_SENTENCE_END_RE = re.compile(r"[.!?…]+[\"')\]*_~]*(?=\s)|\n")
+
+def split_message(text: str, limit: int = STREAMING_REPLY_SETTINGS["max_message_length"]) -> List[str]:
+    """
+    Split text into messages of at most limit characters, at a line break
+    in the second half of a message if there is one, else at the last space
+    (a single word longer than limit is cut). Pieces only depend on the text
+    before them, so a growing text keeps its earlier pieces.
+    """
+    chunks = []
+    text = text.strip()
+    while len(text) > limit:
+        cut = text.rfind("\n", limit // 2, limit + 1)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        chunk = text[:cut].rstrip()
+        if chunk:
+            chunks.append(chunk)
+        text = text[cut:].lstrip()
+    if text:
+        chunks.append(text)
+    return chunks
+
+class StreamingReply:
+    """
+    A reply posted to Discord while it is being generated. Deltas are fed in
+    as they stream; the first message goes out as soon as the first sentence
+    is complete, and is then edited as more sentences arrive. Every send or
+    edit waits for its slot, edit_interval apart, which keeps a reply inside
+    Discord's per-channel limit of 5 per 5 seconds; deltas arriving while it
+    waits are shown by the same edit. Text past max_message_length continues
+    in follow-up messages.
+    Only whole sentences are shown (or, in a long run without a sentence
+    end, whole words), and only once check passes them, so a half-written
+    word or text the filter would stop is never visible. finish() replaces
+    what was shown with the final reply, whatever it is.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[Any]],
+                 check: Optional[Callable[[str], bool]] = None,
+                 edit_interval: float = STREAMING_REPLY_SETTINGS["edit_interval"],
+                 max_length: int = STREAMING_REPLY_SETTINGS["max_message_length"],
+                 max_unbroken: int = STREAMING_REPLY_SETTINGS["max_unbroken"]):
+        self.send = send
+        self.check = check
+        self.edit_interval = edit_interval
+        self.max_length = max_length
+        self.max_unbroken = max_unbroken
+        self.messages: List[Any] = []
+        self._shown: List[str] = []
+        self._current = ""
+        self._parts: List[str] = []
+        self._next_slot = 0.0
+        self._changed = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+        self.started = time.monotonic()
+
+        # Metrics
+        self.first_shown: Optional[float] = None
+        self.posts = 0
+        self.edits = 0
+        self.deletes = 0
+
+    def feed(self, delta: Optional[str]):
+        """Add a delta of the reply; None when the generation starts over"""
+        if self._closed:
+            return
+        if delta is None:
+            self._parts.clear()
+        else:
+            self._parts.append(delta)
+        self._changed.set()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def finish(self, text: str):
+        """Show the final reply (posting it outright if nothing was shown yet)"""
+        self._closed = True
+        self._closing.set()
+        self._changed.set()
+        if self._task is not None:
+            await self._task
+        try:
+            await self._show(text)
+        except Exception as e:
+            logger.error(f"Error posting reply: {e}")
+
+    def _visible(self) -> Optional[str]:
+        """The part of the text fed so far that can be shown, or None"""
+        text = "".join(self._parts)
+        end = 0
+        for match in _SENTENCE_END_RE.finditer(text):
+            end = match.end()
+        if len(text) - end > self.max_unbroken:
+            end = max(end, text.rfind(" "), text.rfind("\n"))
+        visible = text[:end].strip()
+        if not visible or (self.check is not None and not self.check(visible)):
+            return None
+        return visible
+
+    async def _run(self):
+        try:
+            while not self._closed:
+                await self._changed.wait()
+                self._changed.clear()
+                # Take in whatever arrives until the next slot
+                delay = self._next_slot - time.monotonic()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._closing.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                if self._closed:
+                    break
+                visible = self._visible()
+                if visible is not None:
+                    await self._show(visible)
+        except Exception as e:
+            # Stop updating; finish() still posts the final reply
+            logger.error(f"Error streaming reply: {e}")
+
+    async def _slot(self):
+        """Wait until the next send or edit is allowed"""
+        delay = self._next_slot - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._next_slot = time.monotonic() + self.edit_interval
+
+    async def _show(self, text: str):
+        if text == self._current:
+            return
+        chunks = split_message(text, self.max_length)
+        for i, chunk in enumerate(chunks):
+            if i < len(self.messages):
+                if self._shown[i] != chunk:
+                    await self._slot()
+                    await self.messages[i].edit(content=chunk)
+                    self._shown[i] = chunk
+                    self.edits += 1
+            else:
+                await self._slot()
+                self.messages.append(await self.send(chunk))
+                self._shown.append(chunk)
+                self.posts += 1
+                if self.first_shown is None:
+                    self.first_shown = time.monotonic() - self.started
+        # A regenerated reply can be shorter than the one it replaces
+        while len(self.messages) > len(chunks):
+            await self._slot()
+            await self.messages[-1].delete()
+            self.messages.pop()
+            self._shown.pop()
+            self.deletes += 1
+        self._current = text
\ No newline at end of file
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from ..config import CACHE_SETTINGS
+from ..database.async_db import async_db, AsyncDatabase
+
+logger = logging.getLogger('chinatsu.users')
+
+class UserCache:
+    """
+    Bounded LRU cache of relations_users rows with write-back deltas.
+    Interaction and reputation changes accumulate in memory and are written
+    back as one batched upsert every flush_interval seconds (and on shutdown).
+    Reads always see the cached row plus any deltas not yet committed.
+    """
+    
+    _FLUSH_QUERY = """
+        INSERT INTO relations_users (user_id, reputation, interactions, last_interaction)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            reputation = reputation + excluded.reputation,
+            interactions = interactions + excluded.interactions,
+            last_interaction = excluded.last_interaction
+    """
+    
+    def __init__(
+        self,
+        db: AsyncDatabase = async_db,
+        max_size: int = CACHE_SETTINGS["max_size"],
+        flush_interval: float = CACHE_SETTINGS["flush_interval"]
+    ):
+        self.db = db
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        # user_id -> row as committed in the database
+        self._rows: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        # user_id -> [interactions, reputation, last_interaction] not yet written
+        self._deltas: Dict[int, list] = {}
+        # Deltas handed to an in-progress flush, still visible to readers
+        self._flushing: Dict[int, list] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_generation = 0
+        self._loop_task: Optional[asyncio.Task] = None
+        
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flush_count = 0
+        self.last_flush_latency = 0.0
+        
+    def _view(self, user_id: int, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Committed row with pending deltas applied"""
+        user = dict(row)
+        for pending in (self._flushing.get(user_id), self._deltas.get(user_id)):
+            if pending:
+                user["interactions"] += pending[0]
+                user["reputation"] += pending[1]
+                user["last_interaction"] = pending[2]
+        return user
+        
+    def _store(self, user_id: int, row: Dict[str, Any]):
+        self._rows[user_id] = row
+        self._rows.move_to_end(user_id)
+        while len(self._rows) > self.max_size:
+            # Pending deltas live outside the LRU, so evicting a dirty row loses nothing
+            self._rows.popitem(last=False)
+            self.evictions += 1
+            
+    async def get_user(self, user_id: int) -> Dict[str, Any]:
+        """Get user data, creating if doesn't exist"""
+        row = self._rows.get(user_id)
+        if row is not None:
+            self.hits += 1
+            self._rows.move_to_end(user_id)
+            return self._view(user_id, row)
+            
+        self.misses += 1
+        while True:
+            if user_id in self._flushing:
+                # Let the write-back land so the row isn't read half-way through it
+                async with self._flush_lock:
+                    pass
+            generation = self._flush_generation
+            row = await self.db.get_user(user_id)
+            # A flush that started meanwhile may or may not be in this row; re-read
+            if generation == self._flush_generation:
+                break
+        if user_id not in self._rows:
+            self._store(user_id, row)
+        return self._view(user_id, self._rows[user_id])
+        
+    def record_interaction(self, user_id: int, reputation: float, interactions: int = 1):
+        """Queue an interaction/reputation change; never touches the database"""
+        now = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        pending = self._deltas.get(user_id)
+        if pending:
+            pending[0] += interactions
+            pending[1] += reputation
+            pending[2] = now
+        else:
+            self._deltas[user_id] = [interactions, reputation, now]
+            
+    async def adjust_reputation(self, user_id: int, amount: float) -> float:
+        """Apply an admin reputation change and write it back immediately"""
+        await self.get_user(user_id)
+        self.record_interaction(user_id, amount, interactions=0)
+        await self.flush()
+        return (await self.get_user(user_id))["reputation"]
+        
+    async def flush(self) -> int:
+        """Write all pending deltas in one batch, returning the number of users"""
+        # A cancelled caller (stop() cancelling the periodic task) must not
+        # abandon a batch half-way: the write runs to the end, and stop()'s
+        # own flush waits for it on the lock
+        return await asyncio.shield(self._flush())
+        
+    async def _flush(self) -> int:
+        async with self._flush_lock:
+            if not self._deltas:
+                return 0
+            self._flushing, self._deltas = self._deltas, {}
+            self._flush_generation += 1
+            rows = [
+                (user_id, reputation, interactions, last_interaction)
+                for user_id, (interactions, reputation, last_interaction) in self._flushing.items()
+            ]
+            
+            start = time.perf_counter()
+            try:
+                await self.db.executemany(self._FLUSH_QUERY, rows)
+            except Exception as e:
+                logger.error(f"User cache flush failed, keeping {len(rows)} users queued: {e}")
+                self._requeue(self._flushing)
+                self._flushing = {}
+                return 0
+            except BaseException:
+                # Cancelled anyway (the loop is going away): keep the batch for a later flush
+                self._requeue(self._flushing)
+                self._flushing = {}
+                raise
+                
+            # Fold the committed deltas into the cached rows
+            for user_id, (interactions, reputation, last_interaction) in self._flushing.items():
+                row = self._rows.get(user_id)
+                if row is not None:
+                    row["interactions"] += interactions
+                    row["reputation"] += reputation
+                    row["last_interaction"] = last_interaction
+            self._flushing = {}
+            
+            self.last_flush_latency = time.perf_counter() - start
+            self.flush_count += 1
+            return len(rows)
+            
+    def _requeue(self, batch: Dict[int, list]):
+        for user_id, (interactions, reputation, last_interaction) in batch.items():
+            pending = self._deltas.get(user_id)
+            if pending:
+                pending[0] += interactions
+                pending[1] += reputation
+            else:
+                self._deltas[user_id] = [interactions, reputation, last_interaction]
+                
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Periodic user cache flush failed: {e}")
+                
+    def start(self):
+        """Start the periodic write-back task on the running loop"""
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.get_running_loop().create_task(self._run())
+            
+    async def stop(self):
+        """Stop the periodic task and write back whatever is pending"""
+        if self._loop_task:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        await self.flush()
+        
+    def stats(self) -> Dict[str, Any]:
+        """Cache and write-back metrics"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "dirty_users": len(self._deltas),
+            "flush_count": self.flush_count,
+            "last_flush_ms": self.last_flush_latency * 1000
+        }
+
+# Global user cache instance
+user_cache = UserCache()
\ No newline at end of file
@@ -0,0 +1,88 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from ..config import VERDICT_CACHE_SETTINGS
+
+class VerdictCache:
+    """
+    Bounded LRU of content filter verdicts, with a TTL.
+    Keys are the digest of the normalized message plus the guild, its
+    filter-settings version from the settings cache and the version of the
+    compiled custom rules the verdict was computed with. An admin change to a
+    guild's filter settings bumps that version, so its old verdicts become
+    unreachable at once and age out of the LRU like any other entry.
+    """
+
+    def __init__(self, max_entries: int = VERDICT_CACHE_SETTINGS["max_entries"],
+                 ttl: float = VERDICT_CACHE_SETTINGS["ttl"]):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple, Tuple[float, Tuple]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @staticmethod
+    def make_key(content_hash: bytes, over_length: bool, server_id: str, version: int, rules_version: int = 0) -> Tuple:
+        """
+        Cache key for a normalized message (by its MessageAnalysis.content_hash)
+        in a guild at a settings and custom rules version
+        """
+        return (content_hash, over_length, server_id, version, rules_version)
+
+    def get(self, key: Tuple) -> Optional[Tuple]:
+        """Cached verdict for a key, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored_at, verdict = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return verdict
+
+    def put(self, key: Tuple, verdict: Tuple):
+        """Store a verdict, evicting the least recently used entries past the bound"""
+        self._entries[key] = (time.monotonic(), verdict)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every cached verdict"""
+        self._entries.clear()
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the cache (container, keys and verdicts, shared objects once)"""
+        seen = set()
+        total = sys.getsizeof(self._entries)
+        for key, entry in self._entries.items():
+            for obj in (key, *key, entry, *entry, *entry[1]):
+                if id(obj) not in seen:
+                    seen.add(id(obj))
+                    total += sys.getsizeof(obj)
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, size and approximate memory"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "memory_bytes": self.memory_bytes()
+        }
+
+# Global verdict cache instance
+verdict_cache = VerdictCache()
\ No newline at end of file
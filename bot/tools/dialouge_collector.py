@@ -1,7 +1,7 @@
 import json
 from pathlib import Path
 from typing import List, Dict, Any
-from ..services.dialogue_training import DialogueTrainer
+from ..services.dialouge_training import DialogueTrainer
 
 class DialogueCollector:
     def __init__(self):
@@ -27,13 +27,8 @@ class DialogueCollector:
         with open(chapter_file, 'w', encoding='utf-8') as f:
             json.dump(cleaned_dialogues, f, indent=2)
         
-        # Process dialogues
-        for entry in cleaned_dialogues:
-            self.trainer.add_dialogue_entry(
-                entry['context'],
-                entry['dialogue'],
-                entry.get('emotion', 'neutral')
-            )
+        # Process dialogues (offline tool, so the synchronous loader is fine)
+        self.trainer.load_dialogue_data(str(chapter_file))
     
     def _validate_entry(self, entry: Dict[str, Any]) -> bool:
         """Validate a dialogue entry"""